@@ -0,0 +1,64 @@
+""" Measure the cost of reading the status board compared to asking a simulated modem
+
+Run from the root of the repository::
+
+    python -m benchmarks.board [--json] [--modems N] [--number N]
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import timeit
+from huawei_3g.board import StatusBoard
+from huawei_3g.huawei_e303 import HuaweiE303Modem
+from huawei_3g.testing import FakeHiLinkServer
+
+
+def run(modems, number):
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, "board")
+    try:
+        board = StatusBoard.create(filename, slots=max(modems, 1))
+        status = {'status': 'Connected', 'signal': 80, 'network_type': 'HSPA+'}
+        for i in range(modems):
+            board.publish("/sys/bus/usb/devices/1-{}".format(i), "eth{}".format(i), status, {'count': 5, 'unread': 1})
+        reader = StatusBoard.open(filename)
+        last = "/sys/bus/usb/devices/1-{}".format(modems - 1)
+        results = [
+            ("read", timeit.timeit(lambda: reader.read(last), number=number) / number),
+            ("read_all", timeit.timeit(reader.read_all, number=number // 10) / (number // 10))
+        ]
+        reader.close()
+        board.close()
+    finally:
+        shutil.rmtree(directory)
+
+    with FakeHiLinkServer() as server:
+        with HuaweiE303Modem('eth0', '/', ip=server.address) as modem:
+            calls = max(number // 100, 10)
+            seconds = timeit.timeit(lambda: (modem.get_status(cache=False), modem.get_message_count(cache=False)),
+                                    number=calls)
+            results.append(("modem", seconds / calls))
+    return [{"source": source, "microseconds": seconds * 1e6, "modems": modems} for source, seconds in results]
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description="Benchmark reading the status board")
+    argument_parser.add_argument("--json", action="store_true", help="Output the results as JSON")
+    argument_parser.add_argument("--modems", type=int, default=32, help="Modems on the board")
+    argument_parser.add_argument("--number", type=int, default=20000, help="Reads per measurement")
+    args = argument_parser.parse_args()
+
+    results = run(args.modems, args.number)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print("{:<10} {:>14}".format("source", "µs per read"))
+    for result in results:
+        print("{:<10} {:>14.1f}".format(result["source"], result["microseconds"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+""" Measure modem discovery against a fake sysfs tree with many USB devices and network interfaces
+
+Run from the root of the repository::
+
+    python -m benchmarks.discovery [--json] [--devices N]
+"""
+import argparse
+import json
+import shutil
+import tempfile
+import timeit
+import huawei_3g.modem
+from huawei_3g.testing import FakeSysfs
+
+
+def build_tree(root, devices):
+    sysfs = FakeSysfs(root)
+    for i in range(devices):
+        # Every third device is a Huawei dongle, the rest are other USB devices with a network interface
+        if i % 3 == 0:
+            sysfs.add_device("1-{}".format(i), interface="wwan{}".format(i))
+        else:
+            sysfs.add_device("1-{}".format(i), vendor="0bda", product="8153", interface="eth{}".format(i))
+    return sysfs
+
+
+def run(devices, number):
+    root = tempfile.mkdtemp()
+    try:
+        build_tree(root, devices)
+        scanner = huawei_3g.modem.Scanner(root)
+
+        def cold():
+            scanner.refresh()
+            scanner.find()
+
+        cold_seconds = timeit.timeit(cold, number=number) / number
+        cached_seconds = timeit.timeit(scanner.find, number=number) / number
+        return {
+            "devices": devices,
+            "modems": len(scanner.find()),
+            "cold_scan_ms": cold_seconds * 1000,
+            "cached_scan_ms": cached_seconds * 1000
+        }
+    finally:
+        shutil.rmtree(root)
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description="Benchmark modem discovery")
+    argument_parser.add_argument("--json", action="store_true", help="Output the results as JSON")
+    argument_parser.add_argument("--devices", type=int, nargs="+", default=[10, 100, 500],
+                                 help="The amount of USB devices in the fake sysfs tree")
+    argument_parser.add_argument("--number", type=int, default=20, help="Scans per measurement")
+    args = argument_parser.parse_args()
+
+    results = [run(devices, args.number) for devices in args.devices]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print("{:>8} {:>8} {:>14} {:>14}".format("devices", "modems", "cold scan ms", "cached ms"))
+    for result in results:
+        print("{devices:>8} {modems:>8} {cold_scan_ms:>14.2f} {cached_scan_ms:>14.2f}".format(**result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+""" Measure throughput and latency of the modem class against a fleet of simulated HiLink modems
+
+Every modem gets its own :class:`~huawei_3g.testing.FakeHiLinkServer` on localhost and its own client thread. The
+servers run in this process, so the peak memory includes them.
+
+Run from the root of the repository::
+
+    python -m benchmarks.fleet [--json] [--modems N [N ...]] [--latency MS] [--busy-rate FRACTION]
+                               [--threads N] [--max-concurrent N] [--no-serialize]
+
+With ``--threads`` every modem object is shared by multiple client threads. ``--max-concurrent 1`` makes the
+simulated modems answer overlapping requests with "Busy" like the real firmware, compare a run with and without
+``--no-serialize`` to see what the request gate of the modem class is worth.
+
+Save a run with ``--json > baseline.json`` and check a later run against it with ``--baseline baseline.json``, which
+exits with status 1 if the throughput of a scenario dropped more than the tolerance.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+import tracemalloc
+from huawei_3g.testing import FakeHiLinkFleet, fake_inbox
+
+
+def percentile(values, fraction):
+    """ The nearest-rank percentile of a list of values """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def status_operation(modem, server):
+    modem.get_status(cache=False)
+
+
+def list_operation(modem, server):
+    list(modem.iter_messages())
+
+
+def delete_operation(modem, server):
+    # Refilling the inbox isn't part of the measurement, it's done before the timer starts
+    modem.delete_messages([message["Index"] for message in server.inbox])
+
+
+def refill(server, inbox_size):
+    server.inbox = fake_inbox(inbox_size)
+
+
+scenarios = {
+    "status": (status_operation, None),
+    "list": (list_operation, None),
+    "delete": (delete_operation, refill)
+}
+
+
+def run_scenario(name, fleet, modems, number, inbox_size, threads_per_modem=1):
+    operation, prepare = scenarios[name]
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(modem, server):
+        own_latencies = []
+        own_errors = 0
+        for i in range(number):
+            if prepare:
+                prepare(server, inbox_size)
+            start = time.perf_counter()
+            try:
+                operation(modem, server)
+            except Exception:
+                own_errors += 1
+            own_latencies.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(own_latencies)
+            errors.append(own_errors)
+
+    for server in fleet.servers:
+        refill(server, inbox_size)
+    requests_before = fleet.requests
+    threads = [threading.Thread(target=worker, args=pair) for pair in zip(modems, fleet.servers)
+               for i in range(threads_per_modem)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+    requests = fleet.requests - requests_before
+
+    # A single extra round per modem with allocation tracing, tracing the timed rounds would skew the timing
+    tracemalloc.start()
+    for modem, server in zip(modems, fleet.servers):
+        if prepare:
+            prepare(server, inbox_size)
+        try:
+            operation(modem, server)
+        except Exception:
+            pass
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "scenario": name,
+        "modems": len(modems),
+        "threads": len(threads),
+        "operations": len(latencies),
+        "errors": sum(errors),
+        "requests": requests,
+        "requests_per_second": requests / seconds,
+        "operations_per_second": len(latencies) / seconds,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "peak_bytes": peak
+    }
+
+
+def run(modem_count, names, number, inbox_size=20, latency=0, jitter=0, busy_rate=0, token_lifetime=None,
+        seed=1, threads_per_modem=1, max_concurrent=None, serialize=True):
+    fleet = FakeHiLinkFleet(modem_count, latency=latency, jitter=jitter, busy_rate=busy_rate,
+                            token_lifetime=token_lifetime, seed=seed, max_concurrent=max_concurrent)
+    with fleet:
+        modems = fleet.modems(cache_ttls={}, serialize=serialize)
+        try:
+            results = [run_scenario(name, fleet, modems, number, inbox_size, threads_per_modem) for name in names]
+        finally:
+            for modem in modems:
+                modem.close()
+    for result in results:
+        result["simulated_errors"] = fleet.errors
+    return results
+
+
+def regressions(results, baseline, tolerance):
+    """ Compare results with a baseline run and list the scenarios that got slower than the tolerance allows """
+    expected = dict(((result["scenario"], result["modems"]), result) for result in baseline)
+    slower = []
+    for result in results:
+        reference = expected.get((result["scenario"], result["modems"]))
+        if reference and result["requests_per_second"] < reference["requests_per_second"] * (1 - tolerance):
+            slower.append((result, reference))
+    return slower
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description="Benchmark the modem class against simulated modems")
+    argument_parser.add_argument("--json", action="store_true", help="Output the results as JSON")
+    argument_parser.add_argument("--modems", type=int, nargs="+", default=[1, 4, 16],
+                                 help="The amount of simulated modems")
+    argument_parser.add_argument("--scenarios", nargs="+", default=sorted(scenarios), choices=sorted(scenarios))
+    argument_parser.add_argument("--number", type=int, default=50, help="Operations per modem per scenario")
+    argument_parser.add_argument("--inbox-size", type=int, default=20, help="Messages in every simulated inbox")
+    argument_parser.add_argument("--latency", type=float, default=0, help="Server latency in milliseconds")
+    argument_parser.add_argument("--jitter", type=float, default=0, help="Server latency jitter in milliseconds")
+    argument_parser.add_argument("--busy-rate", type=float, default=0,
+                                 help="Fraction of requests answered with the Busy error")
+    argument_parser.add_argument("--token-lifetime", type=float, default=None,
+                                 help="Seconds before a token expires, never by default")
+    argument_parser.add_argument("--seed", type=int, default=1, help="Seed for jitter and busy errors")
+    argument_parser.add_argument("--threads", type=int, default=1, help="Client threads sharing every modem")
+    argument_parser.add_argument("--max-concurrent", type=int, default=None,
+                                 help="Concurrent requests a simulated modem handles before answering Busy")
+    argument_parser.add_argument("--no-serialize", action="store_true",
+                                 help="Send concurrent requests to the modems instead of one at a time")
+    argument_parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    argument_parser.add_argument("--tolerance", type=float, default=0.2,
+                                 help="Allowed fractional throughput drop compared to the baseline")
+    args = argument_parser.parse_args()
+
+    results = []
+    for modem_count in args.modems:
+        results.extend(run(modem_count, args.scenarios, args.number, args.inbox_size, args.latency / 1000.0,
+                           args.jitter / 1000.0, args.busy_rate, args.token_lifetime, args.seed, args.threads,
+                           args.max_concurrent, not args.no_serialize))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print("{:<8} {:>6} {:>10} {:>8} {:>10} {:>10} {:>10} {:>12}".format(
+            "scenario", "modems", "requests/s", "errors", "p50 ms", "p99 ms", "ops/s", "peak bytes"))
+        for result in results:
+            print("{scenario:<8} {modems:>6} {requests_per_second:>10.0f} {errors:>8} {p50_ms:>10.2f} "
+                  "{p99_ms:>10.2f} {operations_per_second:>10.0f} {peak_bytes:>12}".format(**result))
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            slower = regressions(results, json.load(baseline_file), args.tolerance)
+        for result, reference in slower:
+            sys.stderr.write("{} with {} modems: {:.0f} requests/s, baseline {:.0f}\n".format(
+                result["scenario"], result["modems"], result["requests_per_second"],
+                reference["requests_per_second"]))
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+""" Compare the throughput and allocations of the response parsers on the fixtures in huawei_3g/fixtures
+
+Run from the root of the repository::
+
+    python -m benchmarks.parsers [--json] [--number N]
+"""
+import argparse
+import json
+import timeit
+import tracemalloc
+from huawei_3g.parsers import FastParser, XmltodictParser
+from huawei_3g.testing import read_fixture
+
+fixtures = {
+    "status.xml": "status",
+    "sms-count.xml": "message_count",
+    "sms-list-1.xml": "messages",
+    "sms-list-2.xml": "messages"
+}
+
+
+def measure(parse, payload, number):
+    seconds = timeit.timeit(lambda: parse(payload), number=number)
+
+    tracemalloc.start()
+    parse(payload)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "per_second": number / seconds,
+        "peak_bytes": peak
+    }
+
+
+def run(number):
+    results = []
+    for fixture, method in sorted(fixtures.items()):
+        payload = read_fixture(fixture)
+        for parser in [FastParser(), XmltodictParser()]:
+            result = measure(getattr(parser, method), payload, number)
+            result["fixture"] = fixture
+            result["parser"] = parser.name
+            results.append(result)
+    return results
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description="Benchmark the HiLink response parsers")
+    argument_parser.add_argument("--json", action="store_true", help="Output the results as JSON")
+    argument_parser.add_argument("--number", type=int, default=5000, help="Parses per measurement")
+    args = argument_parser.parse_args()
+
+    results = run(args.number)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print("{:<16} {:<10} {:>12} {:>12}".format("fixture", "parser", "parses/s", "peak bytes"))
+    for result in results:
+        print("{fixture:<16} {parser:<10} {per_second:>12.0f} {peak_bytes:>12}".format(**result))
+
+
+if __name__ == "__main__":
+    main()
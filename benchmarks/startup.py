@@ -0,0 +1,106 @@
+""" Measure the startup time of the huawei-3g command line tool and which heavy modules it imports
+
+Every scenario runs in a fresh interpreter. The overhead is the time above starting a bare interpreter.
+
+Run from the root of the repository::
+
+    python -m benchmarks.startup [--json] [--number N] [--target MS]
+
+With ``--target`` the benchmark exits with status 1 when the overhead of a command is above the target in
+milliseconds.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from huawei_3g.testing import FakeSysfs
+
+# Modules that are expensive to import and should only be loaded by the commands that need them
+heavy_modules = ["requests", "urllib3", "xmltodict", "asyncio", "sqlite3", "concurrent.futures"]
+
+
+def timed(arguments, number):
+    durations = []
+    for i in range(number):
+        start = time.perf_counter()
+        subprocess.run(arguments, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        durations.append(time.perf_counter() - start)
+    durations.sort()
+    return durations[len(durations) // 2]
+
+
+def run(number):
+    root = tempfile.mkdtemp()
+    try:
+        sysfs = FakeSysfs(root)
+        sysfs.add_device("1-1", interface="wwan0")
+        scenarios = {
+            "import huawei_3g.cli": ["-c", "import huawei_3g.cli"],
+            "import huawei_3g.huawei_e303": ["-c", "import huawei_3g.huawei_e303"],
+            "discover": ["-m", "huawei_3g", "--sysfs-root", root, "discover"],
+            "status (no modems)": ["-m", "huawei_3g", "--sysfs-root", root, "--modem", "none", "status"]
+        }
+        baseline = timed([sys.executable, "-c", "pass"], number)
+        results = []
+        for name, arguments in sorted(scenarios.items()):
+            seconds = timed([sys.executable] + arguments, number)
+            result = {
+                "scenario": name,
+                "ms": seconds * 1000,
+                "overhead_ms": (seconds - baseline) * 1000,
+                "heavy_modules": loaded_modules(arguments)
+            }
+            results.append(result)
+        return results
+    finally:
+        shutil.rmtree(root)
+
+
+def loaded_modules(arguments):
+    """ Run the scenario again and list the heavy modules that were imported """
+    if arguments[0] == "-m":
+        code = ("import runpy\nsys.argv = ['huawei-3g'] + {!r}\ntry:\n"
+                "    runpy.run_module('huawei_3g', run_name='__main__')\nexcept SystemExit:\n    pass").format(
+            arguments[2:])
+    else:
+        code = arguments[1]
+    script = "import sys\n{}\nsys.stderr.write(' '.join(m for m in {!r} if m in sys.modules))\n".format(
+        code, heavy_modules)
+    result = subprocess.run([sys.executable, "-c", script], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    return result.stderr.split()
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description="Benchmark the startup of the command line tool")
+    argument_parser.add_argument("--json", action="store_true", help="Output the results as JSON")
+    argument_parser.add_argument("--number", type=int, default=10, help="Runs per scenario, the median is reported")
+    argument_parser.add_argument("--target", type=float, help="The maximum overhead in milliseconds")
+    args = argument_parser.parse_args()
+
+    # Run the package from this checkout
+    os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")]))
+    results = run(args.number)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print("{:<30} {:>8} {:>12}  {}".format("scenario", "ms", "overhead ms", "heavy modules"))
+        for result in results:
+            print("{:<30} {:>8.1f} {:>12.1f}  {}".format(result["scenario"], result["ms"], result["overhead_ms"],
+                                                        " ".join(result["heavy_modules"]) or "-"))
+
+    if args.target is not None:
+        slow = [result for result in results if result["overhead_ms"] > args.target]
+        for result in slow:
+            sys.stderr.write("{} takes {:.1f}ms, the target is {:.1f}ms\n".format(
+                result["scenario"], result["overhead_ms"], args.target))
+        if slow:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
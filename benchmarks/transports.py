@@ -0,0 +1,91 @@
+""" Compare the transports of the modem class against a simulated modem on localhost
+
+The simulated modem runs in a separate process, so the CPU time reported is only spent by the client: building the
+request, the HTTP client and parsing the response. The replay transport doesn't use the network at all and shows
+the cost of the modem class itself.
+
+Run from the root of the repository::
+
+    python -m benchmarks.transports [--json] [--number N] [--inbox N]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from huawei_3g.huawei_e303 import HuaweiE303Modem
+from huawei_3g.transport import get_transport, RecordingTransport, ReplayTransport
+
+server_script = """
+import sys
+from huawei_3g.testing import FakeHiLinkServer
+server = FakeHiLinkServer(inbox={inbox}).start()
+sys.stdout.write(server.address + "\\n")
+sys.stdout.flush()
+sys.stdin.read()
+"""
+
+scenarios = {
+    "status": lambda modem: modem.get_status(cache=False),
+    "list": lambda modem: modem.get_messages()
+}
+
+
+def measure(modem, operation, number):
+    operation(modem)
+    start = time.perf_counter()
+    cpu = time.process_time()
+    for i in range(number):
+        operation(modem)
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    return {"calls/s": number / wall, "us/call": wall / number * 1e6, "cpu us/call": cpu / number * 1e6}
+
+
+def run(number, inbox):
+    server = subprocess.Popen([sys.executable, "-c", server_script.format(inbox=inbox)], stdin=subprocess.PIPE,
+                              stdout=subprocess.PIPE, universal_newlines=True)
+    try:
+        address = server.stdout.readline().strip()
+        results = []
+        for scenario, operation in sorted(scenarios.items()):
+            # Record a single call, the replay transport repeats the last response
+            recorder = RecordingTransport(get_transport("socket"))
+            with HuaweiE303Modem("lo", "/", ip=address, transport=recorder, cache_ttls={}) as modem:
+                operation(modem)
+            for name in ["requests", "socket", "replay"]:
+                transport = ReplayTransport(recorder.records) if name == "replay" else name
+                with HuaweiE303Modem("lo", "/", ip=address, transport=transport, cache_ttls={}) as modem:
+                    result = measure(modem, operation, number)
+                result.update({"scenario": scenario, "transport": name})
+                results.append(result)
+        return results
+    finally:
+        server.stdin.close()
+        server.wait()
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description="Benchmark the transports of the modem class")
+    argument_parser.add_argument("--json", action="store_true", help="Output the results as JSON")
+    argument_parser.add_argument("--number", type=int, default=1000, help="Calls per scenario")
+    argument_parser.add_argument("--inbox", type=int, default=20, help="Messages in the simulated inbox")
+    args = argument_parser.parse_args()
+
+    # The simulated modem imports the package from this checkout
+    os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")]))
+    results = run(args.number, args.inbox)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print("{:<10} {:<10} {:>10} {:>10} {:>12}".format("scenario", "transport", "calls/s", "us/call",
+                                                         "cpu us/call"))
+        for result in results:
+            print("{:<10} {:<10} {:>10.0f} {:>10.0f} {:>12.0f}".format(
+                result["scenario"], result["transport"], result["calls/s"], result["us/call"],
+                result["cpu us/call"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+import sys
+from huawei_3g.cli import main
+
+sys.exit(main())
@@ -0,0 +1,256 @@
+import csv
+import io
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+from huawei_3g.datastructures import DeleteResult
+from huawei_3g.huawei_e303 import HuaweiE303Modem
+
+# The columns of the archive, also the keys of every JSON record
+FIELDS = ("modem", "interface", "message_id", "sender", "date", "message", "read", "sca", "archived")
+
+COMPRESSIONS = (None, "gzip", "bz2", "xz")
+
+
+def _open_compressed(compress, raw):
+    if compress == "gzip":
+        import gzip
+        return gzip.GzipFile(fileobj=raw, mode="ab")
+    if compress == "bz2":
+        import bz2
+        return bz2.BZ2File(raw, "ab")
+    import lzma
+    return lzma.LZMAFile(raw, "ab")
+
+
+def fingerprint(message):
+    """ Identify a message on a modem, the index alone isn't enough because the modem reuses free indexes """
+    return "{}|{}|{}|{:08x}".format(message.message_id, message.date, message.sender,
+                                    zlib.crc32(message.message.encode("utf-8")))
+
+
+class ExportResult:
+    """ The outcome of exporting the messages of a single modem
+
+    archived
+      The amount of messages written to the archive
+
+    skipped
+      The amount of messages that were already archived by an earlier export
+
+    deleted
+      A :class:`~huawei_3g.datastructures.DeleteResult` for the messages deleted from the modem
+
+    error
+      The exception that stopped reading the messages of the modem or None
+    """
+
+    def __init__(self):
+        self.archived = 0
+        self.skipped = 0
+        self.deleted = DeleteResult()
+        self.error = None
+
+    def __repr__(self):
+        return "<ExportResult {} archived, {} skipped, {} deleted{}>".format(
+            self.archived, self.skipped, len(self.deleted.deleted), ", {!r}".format(self.error) if self.error else "")
+
+
+class ArchiveExporter:
+    """ Streams the received SMS messages of many modems into an append-only archive file
+
+    The inboxes are read one page at a time by a pool of threads and the messages go through a queue of at most
+    ``buffer_size`` messages to a single writer, so memory use doesn't depend on the amount of modems or messages.
+    The writer appends the messages as JSON lines or CSV rows and flushes them to disk every ``flush_size``
+    messages or when the queue runs empty. With compression every flush is written as its own compressed stream,
+    the tools for these formats read the streams of a file one after another.
+
+    A checkpoint file per archive remembers which messages on every modem have been archived, an export skips
+    those. Messages are only deleted from a modem, with ``delete`` enabled, after all messages of the modem have been
+    written and flushed and the inbox was read completely. A message can be archived twice if the export is
+    interrupted between flushing it and saving the checkpoint, it is never deleted before it's on disk.
+
+    :param filename: The archive file, created if it doesn't exist
+    :param format: "jsonl" or "csv"
+    :param compress: None, "gzip", "bz2" or "xz"
+    :param delete: Delete the messages from the modems after they have been archived
+    :param page_size: The amount of messages requested in a single API call
+    :param batch_size: The amount of messages deleted in a single API call
+    :param buffer_size: The maximum amount of messages waiting to be written
+    :param flush_size: The amount of messages written before the archive is flushed to disk
+    :param workers: The amount of modems read at the same time
+    """
+
+    def __init__(self, filename, format="jsonl", compress=None, delete=False, page_size=20,
+                 batch_size=HuaweiE303Modem.DELETE_BATCH_SIZE, buffer_size=500, flush_size=100, workers=4):
+        if format not in ("jsonl", "csv"):
+            raise ValueError("Unknown archive format {}".format(format))
+        if compress not in COMPRESSIONS:
+            raise ValueError("Unknown compression {}".format(compress))
+        self.filename = filename
+        self.format = format
+        self.compress = compress
+        self.delete = delete
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+        self.flush_size = flush_size
+        self.workers = workers
+        self.checkpoint_filename = filename + ".checkpoint"
+        self.checkpoints = self._load_checkpoints()
+
+    def export(self, modems):
+        """ Archive the messages of modems
+
+        :param modems: A list of :class:`~huawei_3g.huawei_e303.HuaweiE303Modem` instances, see
+                       :func:`~huawei_3g.modem.load`
+        :return: a dictionary mapping the sysfs path of every modem to an
+                 :class:`~huawei_3g.archive.ExportResult`
+        """
+        modems = list(modems)
+        results = dict((modem.path, ExportResult()) for modem in modems)
+        if not modems:
+            return results
+        messages = queue.Queue(self.buffer_size)
+        cancel = threading.Event()
+        from concurrent.futures import ThreadPoolExecutor
+        with open(self.filename, "ab") as raw, ThreadPoolExecutor(min(self.workers, len(modems))) as executor:
+            for modem in modems:
+                executor.submit(self._read, modem, messages, cancel)
+            try:
+                self._collect(raw, executor, modems, messages, results)
+            except BaseException:
+                # The readers wait for room in the buffer, stop them or leaving the executor waits forever
+                cancel.set()
+                raise
+        return results
+
+    def _collect(self, raw, executor, modems, messages, results):
+        """ Write the messages the readers put in the buffer and delete them when a modem has been read """
+        seen = dict((modem.path, set()) for modem in modems)
+        pending = []
+        deleting = []
+        remaining = len(modems)
+        while remaining:
+            modem, message, error = messages.get()
+            if message is not None:
+                key = fingerprint(message)
+                seen[modem.path].add((key, message.message_id))
+                if key in self.checkpoints.get(modem.path, ()):
+                    results[modem.path].skipped += 1
+                else:
+                    pending.append((modem, key, message))
+                    if len(pending) >= self.flush_size or messages.empty():
+                        self._flush(raw, pending, results)
+                        pending = []
+                continue
+
+            # The inbox of this modem has been read completely or reading it failed
+            remaining -= 1
+            self._flush(raw, pending, results)
+            pending = []
+            archived = self.checkpoints.setdefault(modem.path, set())
+            if error is None:
+                # Forget messages that are no longer on the modem
+                archived.intersection_update(key for key, message_id in seen[modem.path])
+            archived.update(key for key, message_id in seen[modem.path])
+            self._save_checkpoints()
+            if error is not None:
+                results[modem.path].error = error
+            elif self.delete and seen[modem.path]:
+                deleting.append((modem, seen[modem.path],
+                                 executor.submit(modem.delete_messages,
+                                                 [message_id for key, message_id in seen[modem.path]],
+                                                 self.batch_size)))
+
+        for modem, deleted, future in deleting:
+            result = future.result()
+            results[modem.path].deleted.update(result)
+            removed = set(result.deleted)
+            self.checkpoints[modem.path].difference_update(key for key, message_id in deleted
+                                                           if message_id in removed)
+        if deleting:
+            self._save_checkpoints()
+
+    def _read(self, modem, messages, cancel):
+        error = None
+        try:
+            for message in modem.iter_messages(page_size=self.page_size):
+                if not self._put(messages, (modem, message, None), cancel):
+                    return
+        except Exception as exception:
+            error = exception
+        self._put(messages, (modem, None, error), cancel)
+
+    @staticmethod
+    def _put(messages, item, cancel):
+        """ Put an item in the buffer, False when the export was cancelled """
+        while not cancel.is_set():
+            try:
+                messages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _flush(self, raw, pending, results):
+        if not pending:
+            return
+        archived = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+        records = [{
+            "modem": modem.path,
+            "interface": modem.interface,
+            "message_id": message.message_id,
+            "sender": message.sender,
+            "date": message.date,
+            "message": message.message,
+            "read": message.read,
+            "sca": message.sca,
+            "archived": archived
+        } for modem, key, message in pending]
+
+        if self.format == "jsonl":
+            data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        else:
+            text = io.StringIO()
+            writer = csv.DictWriter(text, FIELDS)
+            if raw.tell() == 0:
+                writer.writeheader()
+            writer.writerows(records)
+            data = text.getvalue()
+
+        if self.compress:
+            with _open_compressed(self.compress, raw) as stream:
+                stream.write(data.encode("utf-8"))
+        else:
+            raw.write(data.encode("utf-8"))
+        raw.flush()
+        os.fsync(raw.fileno())
+
+        for modem, key, message in pending:
+            results[modem.path].archived += 1
+            self.checkpoints.setdefault(modem.path, set()).add(key)
+
+    def _load_checkpoints(self):
+        try:
+            with open(self.checkpoint_filename) as handle:
+                return dict((path, set(keys)) for path, keys in json.load(handle).items())
+        except FileNotFoundError:
+            return {}
+
+    def _save_checkpoints(self):
+        # Write a new file and rename it so a crash never leaves a half written checkpoint
+        temporary = self.checkpoint_filename + ".tmp"
+        with open(temporary, "w") as handle:
+            json.dump(dict((path, sorted(keys)) for path, keys in self.checkpoints.items()), handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temporary, self.checkpoint_filename)
+
+
+def export(modems, filename, **options):
+    """ Archive the messages of modems once, see :class:`~huawei_3g.archive.ArchiveExporter` for the options """
+    return ArchiveExporter(filename, **options).export(modems)
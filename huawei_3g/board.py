@@ -0,0 +1,356 @@
+import mmap
+import os
+import struct
+import threading
+import time
+
+MAGIC = b"HW3GSTAT"
+VERSION = 1
+
+# magic, version, flags, slots, slot size
+_HEADER = struct.Struct("<8sHHII")
+HEADER_SIZE = 64
+_STALE = 1
+
+# Every slot starts with a sequence number that is odd while the slot is being written
+_SEQUENCE = struct.Struct("<Q")
+# updated, count, unread, signal, state, path, interface, status, network type, error
+_DATA = struct.Struct("<dHHBB2x64s16s48s16s48s")
+SLOT_SIZE = 256
+
+EMPTY = 0
+OK = 1
+ERROR = 2
+
+_states = {OK: "ok", ERROR: "error"}
+
+# The time in seconds a reader waits for a slot that is being written before giving up
+READ_TIMEOUT = 0.1
+
+
+class BoardError(IOError):
+    """ Raised when a slot of the status board stays half written, usually because the collector died while writing
+    it. The collector fixes the board when it's started again.
+    """
+    pass
+
+
+def _text(value, size):
+    # Don't cut a character in half
+    return value.encode("utf-8")[:size].decode("utf-8", "ignore").encode("utf-8") if value else b""
+
+
+def _path(path):
+    encoded = path.encode("utf-8")
+    if len(encoded) > 64:
+        raise ValueError("The path {} is longer than the 64 bytes a status board slot can store".format(path))
+    return encoded
+
+
+def _decode(values):
+    updated, count, unread, signal, state, path, interface, status, network_type, error = values
+    return {
+        "path": path.rstrip(b"\0").decode("utf-8", "replace"),
+        "interface": interface.rstrip(b"\0").decode("utf-8", "replace") or None,
+        "status": status.rstrip(b"\0").decode("utf-8", "replace") or None,
+        "signal": signal,
+        "network_type": network_type.rstrip(b"\0").decode("utf-8", "replace") or None,
+        "count": count,
+        "unread": unread,
+        "updated": updated,
+        "state": _states[state],
+        "error": error.rstrip(b"\0").decode("utf-8", "replace") or None
+    }
+
+
+class StatusBoard:
+    """ A table with the latest status of every modem in a memory-mapped file
+
+    A single collector process writes the board, see :class:`~huawei_3g.board.StatusCollector`, and any amount of
+    processes read it without talking to the modems. The file has a 64 byte header followed by ``slots`` slots of
+    256 bytes, one per modem, so it can be read from other languages as well. A slot stores a sysfs path of at most
+    64 bytes, longer paths raise a ValueError.
+
+    Readers don't take locks. Every slot starts with a sequence number the writer makes odd before it changes the
+    slot and even again afterwards, a reader that sees an odd number or a number that changed while it was reading
+    the slot reads it again. A read costs a few microseconds. A slot that stays odd for :data:`READ_TIMEOUT` seconds
+    raises :class:`~huawei_3g.board.BoardError`.
+
+    Use :func:`~huawei_3g.board.StatusBoard.create` in the collector and :func:`~huawei_3g.board.StatusBoard.open` in
+    the readers. When the collector creates the board again the old file is marked stale and readers switch to the
+    new file by themselves.
+
+    :param filename: The board file, on Linux /dev/shm keeps it in memory
+    :param writable: Open the board for writing
+    """
+
+    def __init__(self, filename, writable=False):
+        self.filename = filename
+        self.writable = writable
+        self._slots_by_path = {}
+        self._map()
+
+    @classmethod
+    def create(cls, filename, slots=128):
+        """ Create an empty board for the collector, replacing an existing board
+
+        :param filename: The board file
+        :param slots: The maximum amount of modems on the board
+        """
+        temporary = "{}.{}.tmp".format(filename, os.getpid())
+        with open(temporary, "wb") as handle:
+            handle.write(_HEADER.pack(MAGIC, VERSION, 0, slots, SLOT_SIZE).ljust(HEADER_SIZE, b"\0"))
+            handle.truncate(HEADER_SIZE + slots * SLOT_SIZE)
+        previous = None
+        try:
+            previous = cls(filename, writable=True)
+        except (OSError, ValueError):
+            pass
+        os.replace(temporary, filename)
+        if previous:
+            previous._mark_stale()
+            previous.close()
+        return cls(filename, writable=True)
+
+    @classmethod
+    def open(cls, filename):
+        """ Open a board for reading """
+        return cls(filename)
+
+    @property
+    def slots(self):
+        return self._slots
+
+    def publish(self, path, interface=None, status=None, count=None, error=None):
+        """ Write the status of a modem to the board
+
+        :param path: The sysfs path of the modem
+        :param interface: The network interface of the modem
+        :param status: A dictionary as returned by :func:`~huawei_3g.HuaweiE303Modem.get_status`
+        :param count: A dictionary as returned by :func:`~huawei_3g.HuaweiE303Modem.get_message_count`
+        :param error: The exception that prevented getting the status, the last status stays on the board
+        """
+        encoded = _path(path)
+        slot = self._slot_for(path)
+        offset = HEADER_SIZE + slot * SLOT_SIZE
+        if error is not None:
+            values = list(_DATA.unpack_from(self._mmap, offset + _SEQUENCE.size))
+            if values[4] == EMPTY:
+                values[5] = encoded
+            values[0] = time.time()
+            values[4] = ERROR
+            values[6] = _text(interface, 16) or values[6]
+            values[9] = _text(str(error) or error.__class__.__name__, 48)
+        else:
+            values = [time.time(), min(count["count"], 65535) if count else 0,
+                      min(count["unread"], 65535) if count else 0, status["signal"] if status else 0, OK,
+                      encoded, _text(interface, 16), _text(status and status["status"], 48),
+                      _text(status and status["network_type"], 16), b""]
+        self._write(offset, values)
+
+    def remove(self, path):
+        """ Remove a modem from the board """
+        slot = self._slots_by_path.pop(path, None)
+        if slot is not None:
+            self._write(HEADER_SIZE + slot * SLOT_SIZE, [0, 0, 0, 0, EMPTY, b"", b"", b"", b"", b""])
+
+    def read(self, path):
+        """ Read the status of a modem
+
+        :return: a dictionary with the keys path, interface, status, signal, network_type, count, unread, updated
+                 (the time of the last poll in seconds since the epoch), state ("ok" or "error") and error, or None if
+                 the modem isn't on the board
+        """
+        encoded = _path(path)
+        self._check_stale()
+        slot = self._slots_by_path.get(path)
+        if slot is not None:
+            values = self._read(slot)
+            if values is not None and values[5].rstrip(b"\0") == encoded:
+                return _decode(values)
+        # The slot of the modem isn't known yet or has been reused, look it up again
+        self._slots_by_path.pop(path, None)
+        for slot in range(self._slots):
+            values = self._read(slot)
+            if values is not None and values[5].rstrip(b"\0") == encoded:
+                self._slots_by_path[path] = slot
+                return _decode(values)
+        return None
+
+    def read_all(self):
+        """ Read the status of all modems on the board as a list of dictionaries, see
+        :func:`~huawei_3g.board.StatusBoard.read`
+        """
+        self._check_stale()
+        result = []
+        for slot in range(self._slots):
+            values = self._read(slot)
+            if values is not None:
+                result.append(_decode(values))
+        return result
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _map(self):
+        with open(self.filename, "r+b" if self.writable else "rb") as handle:
+            access = mmap.ACCESS_WRITE if self.writable else mmap.ACCESS_READ
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=access)
+        magic, version, flags, slots, slot_size = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION or slot_size != SLOT_SIZE:
+            self._mmap.close()
+            raise ValueError("{} is not a version {} status board".format(self.filename, VERSION))
+        self._slots = slots
+        self._slots_by_path = {}
+        if self.writable:
+            for slot in range(slots):
+                try:
+                    values = self._read(slot)
+                except BoardError:
+                    # Clear the slot a writer died on
+                    self._write(HEADER_SIZE + slot * SLOT_SIZE, [0, 0, 0, 0, EMPTY, b"", b"", b"", b"", b""])
+                    continue
+                if values is not None:
+                    self._slots_by_path[values[5].rstrip(b"\0").decode("utf-8", "replace")] = slot
+
+    def _check_stale(self):
+        if _HEADER.unpack_from(self._mmap, 0)[2] & _STALE:
+            self._mmap.close()
+            self._map()
+
+    def _mark_stale(self):
+        magic, version, flags, slots, slot_size = _HEADER.unpack_from(self._mmap, 0)
+        _HEADER.pack_into(self._mmap, 0, magic, version, flags | _STALE, slots, slot_size)
+
+    def _slot_for(self, path):
+        slot = self._slots_by_path.get(path)
+        if slot is None:
+            used = set(self._slots_by_path.values())
+            free = [slot for slot in range(self._slots) if slot not in used]
+            if not free:
+                raise ValueError("The status board is full, create it with more than {} slots".format(self._slots))
+            slot = self._slots_by_path[path] = free[0]
+        return slot
+
+    def _write(self, offset, values):
+        sequence = _SEQUENCE.unpack_from(self._mmap, offset)[0]
+        # A writer that died while writing the slot left the sequence odd
+        sequence += sequence & 1
+        _SEQUENCE.pack_into(self._mmap, offset, sequence + 1)
+        _DATA.pack_into(self._mmap, offset + _SEQUENCE.size, *values)
+        _SEQUENCE.pack_into(self._mmap, offset, sequence + 2)
+
+    def _read(self, slot):
+        """ Read a consistent copy of a slot, None for an empty slot """
+        offset = HEADER_SIZE + slot * SLOT_SIZE
+        mapped = self._mmap
+        deadline = None
+        while True:
+            before = _SEQUENCE.unpack_from(mapped, offset)[0]
+            if before & 1:
+                # The writer is busy with this slot, a write takes microseconds so a slot that stays busy is broken
+                if deadline is None:
+                    deadline = time.monotonic() + READ_TIMEOUT
+                elif time.monotonic() >= deadline:
+                    raise BoardError("Slot {} of the status board {} is half written".format(slot, self.filename))
+                time.sleep(0)
+                continue
+            values = _DATA.unpack_from(mapped, offset + _SEQUENCE.size)
+            if _SEQUENCE.unpack_from(mapped, offset)[0] == before:
+                return values if values[4] != EMPTY else None
+
+
+class StatusCollector:
+    """ Polls the status and message count of modems and publishes them on a :class:`~huawei_3g.board.StatusBoard`
+
+    :param modems: A list of :class:`~huawei_3g.huawei_e303.HuaweiE303Modem` instances
+    :param filename: The board file, it is created again when the collector is created
+    :param interval: The time in seconds between polls
+    :param slots: The maximum amount of modems on the board
+    """
+
+    def __init__(self, modems, filename, interval=1, slots=128):
+        self.modems = list(modems)
+        self.interval = interval
+        self.board = StatusBoard.create(filename, slots)
+        self.errors = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_modem(self, modem):
+        """ Start publishing a modem, for example from :class:`~huawei_3g.registry.ModemRegistry` """
+        with self._lock:
+            if modem not in self.modems:
+                self.modems.append(modem)
+
+    def remove_modem(self, modem):
+        """ Stop publishing a modem and remove it from the board """
+        with self._lock:
+            if modem in self.modems:
+                self.modems.remove(modem)
+            self.errors.pop(modem.path, None)
+            self.board.remove(modem.path)
+
+    def sample(self):
+        """ Poll all modems once and publish the results
+
+        Modems that can't be published, for example because the board is full, are kept in :attr:`errors` with the
+        exception until they are published again.
+        """
+        for modem in list(self.modems):
+            try:
+                snapshot = modem.get_snapshot(["status", "message_count"])
+                error = snapshot.errors.get("status") or snapshot.errors.get("message_count")
+            except Exception as exception:
+                error = exception
+            with self._lock:
+                if modem not in self.modems:
+                    continue
+                try:
+                    if error is not None:
+                        self.board.publish(modem.path, modem.interface, error=error)
+                    else:
+                        self.board.publish(modem.path, modem.interface, snapshot.status, snapshot.message_count)
+                except Exception as exception:
+                    self.errors[modem.path] = exception
+                else:
+                    self.errors.pop(modem.path, None)
+
+    def start(self):
+        """ Poll in a background thread every interval """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="huawei-3g-board")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        self.board.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _run(self):
+        while True:
+            self.sample()
+            if self._stop.wait(self.interval):
+                return
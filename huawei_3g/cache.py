@@ -0,0 +1,115 @@
+import threading
+import time
+
+# Device information never changes, status, traffic and message counts are fine to reuse for a moment
+DEFAULT_TTLS = {
+    "/device/information": 3600,
+    "/device/signal": 1,
+    "/monitoring/status": 1,
+    "/monitoring/traffic-statistics": 1,
+    "/monitoring/month_statistics": 60,
+    "/sms/sms-count": 1
+}
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResponseCache:
+    """ Caches parsed API responses per endpoint and merges concurrent identical requests
+
+    Only endpoints with a TTL are cached. When multiple threads request the same endpoint while a request for it is
+    already in flight they wait for that request instead of sending their own.
+
+    :param ttls: A dictionary mapping API urls to the time in seconds a response is reused
+    """
+
+    def __init__(self, ttls=None):
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = {}
+        self._flights = {}
+        # Counts the invalidations, a response fetched while an invalidation happened isn't stored
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, url, fetch, variant=None, bypass=False):
+        """ Get a response from the cache or fetch it
+
+        :param url: The API url
+        :param fetch: A callable that does the request and returns the parsed response
+        :param variant: Distinguishes differently parsed responses for the same url
+        :param bypass: Always do the request, the response still replaces the cached one
+        """
+        ttl = self.ttls.get(url)
+        if not ttl:
+            return fetch()
+
+        key = (url, variant)
+        with self._lock:
+            if not bypass:
+                entry = self._entries.get(key)
+                if entry and entry[0] > time.monotonic():
+                    self.hits += 1
+                    return entry[1]
+                flight = self._flights.get(key)
+                if flight:
+                    self.coalesced += 1
+            else:
+                flight = None
+            leader = flight is None
+            if leader:
+                self.misses += 1
+                flight = self._flights[key] = _Flight()
+                generation = self._generation
+
+        if not leader:
+            flight.done.wait()
+            if flight.error:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = fetch()
+            with self._lock:
+                if generation == self._generation:
+                    self._entries[key] = (time.monotonic() + ttl, flight.value)
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
+        return flight.value
+
+    def invalidate(self, prefix=""):
+        """ Remove all cached responses for urls starting with prefix
+
+        Requests that are in flight may have been answered before the change that caused the invalidation, their
+        responses aren't cached and new requests don't wait for them.
+        """
+        with self._lock:
+            self._generation += 1
+            for key in list(self._entries):
+                if key[0].startswith(prefix):
+                    del self._entries[key]
+            for key in list(self._flights):
+                if key[0].startswith(prefix):
+                    del self._flights[key]
+
+    def stats(self):
+        """ Get the hit and miss counters as a dictionary """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'entries': len(self._entries)
+        }
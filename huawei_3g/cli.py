@@ -0,0 +1,191 @@
+""" The huawei-3g command line tool
+
+Usage::
+
+    huawei-3g [--json] discover
+    huawei-3g [--json] status
+    huawei-3g [--json] messages [--delete]
+    huawei-3g [--json] --modem 1-1 delete 40000 40001
+
+All modems are queried at the same time. Only the modules a command needs are imported, discover doesn't load the
+HTTP client at all, so the tool starts quickly on slow hardware.
+"""
+import argparse
+import json
+import sys
+
+
+def main(argv=None):
+    """ Run the command line tool, returns the exit status """
+    parser = _argument_parser()
+    arguments = parser.parse_args(argv)
+    if not arguments.command:
+        parser.print_usage(sys.stderr)
+        return 2
+    return arguments.handler(arguments)
+
+
+def _argument_parser():
+    parser = argparse.ArgumentParser(prog="huawei-3g", description="Query Huawei HiLink 3G modems")
+    parser.add_argument("--json", action="store_true", help="Output JSON")
+    parser.add_argument("--modem", action="append", help="Only use this modem, by sysfs path, USB device name or "
+                                                         "network interface. Can be repeated")
+    parser.add_argument("--sysfs-root", default="/sys", help="The path sysfs is mounted on")
+    parser.add_argument("--ip", default="192.168.8.1", help="The address of the HiLink web server")
+    parser.add_argument("--bind", choices=["auto", "device", "address"],
+                        help="Bind the connections to the network interface of every modem")
+    parser.add_argument("--timeout", type=float, default=10, help="The timeout in seconds per modem")
+    commands = parser.add_subparsers(dest="command")
+
+    discover = commands.add_parser("discover", help="List the attached Huawei USB devices, also the unsupported ones")
+    discover.set_defaults(handler=_discover)
+
+    status = commands.add_parser("status", help="Show the connection status and message count")
+    status.set_defaults(handler=_status)
+
+    messages = commands.add_parser("messages", help="List the SMS messages in the inbox")
+    messages.add_argument("--delete", action="store_true", help="Delete the messages after listing them")
+    messages.set_defaults(handler=_messages)
+
+    delete = commands.add_parser("delete", help="Delete SMS messages by index")
+    delete.add_argument("ids", nargs="+", help="The message indexes")
+    delete.set_defaults(handler=_delete)
+    return parser
+
+
+def _discover(arguments):
+    import huawei_3g.modem
+    devices = [device for device in huawei_3g.modem.find(arguments.sysfs_root) if _selected(device, arguments)]
+    if arguments.json:
+        _print_json(devices)
+    else:
+        for device in devices:
+            print("{} 12d1:{} {} {}".format(device["path"], device["productId"], device["interface"] or "-",
+                                            device["name"] if device["supported"] else "unsupported"))
+    return 0
+
+
+def _status(arguments):
+    async def status(modem):
+        result = await modem.get_status()
+        result.update(await modem.get_message_count())
+        return result
+
+    def show(result):
+        return "{status}, signal {signal}%, {network_type}, {count} messages ({unread} unread)".format(**result)
+
+    return _run(arguments, status, show)
+
+
+def _messages(arguments):
+    async def messages(modem):
+        if not arguments.delete:
+            return [_message_dict(message) for message in await modem.get_messages()]
+        drained, result = await modem.drain_messages()
+        output = _delete_result(result)
+        output["messages"] = [_message_dict(message) for message in drained]
+        return output
+
+    def show(result):
+        messages = result["messages"] if arguments.delete else result
+        lines = ["{} messages".format(len(messages))]
+        lines.extend("  {message_id} {date} {sender}: {message}".format(**message) for message in messages)
+        if arguments.delete:
+            lines.append("  " + _show_delete_result(result))
+        return "\n".join(lines)
+
+    return _run(arguments, messages, show)
+
+
+def _delete(arguments):
+    async def delete(modem):
+        return _delete_result(await modem.delete_messages(arguments.ids))
+
+    return _run(arguments, delete, _show_delete_result, single=True)
+
+
+def _delete_result(result):
+    return {
+        "deleted": result.deleted,
+        "failed": result.failed,
+        "errors": [str(error) or error.__class__.__name__ for error in result.errors]
+    }
+
+
+def _show_delete_result(result):
+    text = "deleted {}".format(" ".join(result["deleted"]) or "nothing")
+    if result["failed"]:
+        text += ", failed {}".format(" ".join(result["failed"]))
+    if result["errors"]:
+        text += " ({})".format(", ".join(result["errors"]))
+    return text
+
+
+def _run(arguments, operation, show, single=False):
+    import huawei_3g.modem
+    devices = [device for device in huawei_3g.modem.find(arguments.sysfs_root)
+               if device["supported"] and _selected(device, arguments)]
+    if single and len(devices) != 1:
+        sys.stderr.write("Select a single modem with --modem, {} modems found\n".format(len(devices)))
+        return 2
+
+    import asyncio
+    results = asyncio.run(_gather(devices, operation, arguments))
+    failed = False
+    output = []
+    for device, result in zip(devices, results):
+        entry = {"path": device["path"], "interface": device["interface"]}
+        if isinstance(result, Exception):
+            failed = True
+            entry["error"] = str(result) or result.__class__.__name__
+        else:
+            # A partial result, like messages that couldn't be deleted, also fails the command
+            failed = failed or bool(isinstance(result, dict) and (result.get("failed") or result.get("errors")))
+            entry["result"] = result
+        output.append(entry)
+
+    if arguments.json:
+        _print_json(output)
+    else:
+        for entry in output:
+            text = "error: " + entry["error"] if "error" in entry else show(entry["result"])
+            print("{} ({}): {}".format(entry["path"], entry["interface"] or "-", text))
+    return 1 if failed else 0
+
+
+async def _gather(devices, operation, arguments):
+    import asyncio
+    from huawei_3g.huawei_e303_async import AsyncHuaweiE303Modem, AsyncTransport
+    transport = AsyncTransport(timeout=(arguments.timeout, arguments.timeout))
+
+    async def run(device):
+        modem = AsyncHuaweiE303Modem(device["interface"], device["path"], ip=arguments.ip, transport=transport,
+                                     bind=arguments.bind)
+        return await asyncio.wait_for(operation(modem), arguments.timeout)
+
+    try:
+        return await asyncio.gather(*[run(device) for device in devices], return_exceptions=True)
+    finally:
+        await transport.close()
+
+
+def _selected(device, arguments):
+    if not arguments.modem:
+        return True
+    names = (device["path"], device["path"].rsplit("/", 1)[-1], device["interface"])
+    return any(name in names for name in arguments.modem)
+
+
+def _message_dict(message):
+    return {
+        "message_id": message.message_id,
+        "message": message.message,
+        "sender": message.sender,
+        "date": message.date,
+        "read": message.read
+    }
+
+
+def _print_json(value):
+    json.dump(value, sys.stdout, indent=2)
+    sys.stdout.write("\n")
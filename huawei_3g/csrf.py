@@ -0,0 +1,123 @@
+import threading
+import time
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.token = None
+        self.error = None
+
+
+class TokenManager:
+    """ Keeps the __RequestVerificationToken of a HiLink modem
+
+    The token is fetched lazily the first time it is needed and cached for ``ttl`` seconds. When a background refresh
+    is enabled the token is renewed ``refresh_margin`` seconds before it expires so requests never have to wait for
+    it. The background refresh stops when the token hasn't been used for ``ttl`` seconds, the next
+    :func:`~huawei_3g.csrf.TokenManager.get` fetches a new token and starts it again. Concurrent callers that need a
+    new token at the same time share a single fetch.
+
+    :param fetch: A callable that requests a new token from the modem and returns it
+    :param ttl: The time in seconds a token is considered valid
+    :param refresh_margin: How many seconds before expiry the background refresh happens
+    :param background: Refresh the token in a background thread before it expires
+    """
+
+    def __init__(self, fetch, ttl=300, refresh_margin=30, background=True):
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.background = background
+        self.token = ""
+        self.expires = 0
+        self.refresh_count = 0
+        self._fetch = fetch
+        self._lock = threading.Lock()
+        self._flight = None
+        self._timer = None
+        self._closed = False
+        self._last_used = 0
+
+    def get(self):
+        """ Get a valid token, fetching a new one if there is none or if it has expired """
+        self._last_used = time.monotonic()
+        if self.token and time.monotonic() < self.expires:
+            return self.token
+        return self.refresh()
+
+    def refresh(self, stale=None):
+        """ Fetch a new token from the modem
+
+        If the modem rejected a token pass it as ``stale``. When another caller already replaced that token in the
+        meantime the new token is returned without fetching again.
+
+        :param stale: The token that was rejected by the modem
+        :return: the new token
+        """
+        with self._lock:
+            if stale is not None and self.token != stale and time.monotonic() < self.expires:
+                return self.token
+            flight = self._flight
+            leader = flight is None
+            if leader:
+                flight = self._flight = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error:
+                raise flight.error
+            return flight.token
+
+        try:
+            flight.token = self._fetch()
+            with self._lock:
+                self.token = flight.token
+                self.expires = time.monotonic() + self.ttl
+                self.refresh_count += 1
+            self._schedule()
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                self._flight = None
+            flight.done.set()
+        return flight.token
+
+    def invalidate(self):
+        """ Forget the current token so the next :func:`~huawei_3g.csrf.TokenManager.get` fetches a new one """
+        with self._lock:
+            self.expires = 0
+
+    def close(self):
+        """ Stop the background refresh, a refresh that is running doesn't schedule the next one """
+        with self._lock:
+            self._closed = True
+            timer = self._timer
+            self._timer = None
+        if timer:
+            timer.cancel()
+
+    def _schedule(self):
+        if not self.background:
+            return
+        with self._lock:
+            if self._closed:
+                return
+            if self._timer:
+                self._timer.cancel()
+            self._timer = threading.Timer(max(self.ttl - self.refresh_margin, 0), self._background_refresh)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _background_refresh(self):
+        if time.monotonic() - self._last_used > self.ttl:
+            # Nobody needs the token, don't keep polling the modem for it
+            with self._lock:
+                self._timer = None
+            return
+        try:
+            self.refresh()
+        except Exception:
+            # The token simply expires and the next request fetches it again
+            pass
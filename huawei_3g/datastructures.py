@@ -1,9 +1,143 @@
+__author__ = 'martijn'
+import datetime
+
+
+def parse_date(date):
+    """ Parse a HiLink timestamp like 2015-09-08 11:03:00 into a datetime
+
+    The modem always uses the same fixed format so slicing the string is a lot faster than datetime.strptime
+    """
+    if len(date) == 19 and date[4] == '-' and date[13] == ':':
+        return datetime.datetime(int(date[0:4]), int(date[5:7]), int(date[8:10]),
+                                 int(date[11:13]), int(date[14:16]), int(date[17:19]))
+    return datetime.datetime.strptime(date, '%Y-%m-%d %H:%M:%S')
+
+
+_unparsed = object()
+
+
 class SMSMessage:
-    """A SMS message received by a modem"""
-    message_id = ""
-    message = ""
-    sender = ""
-    receive_time = None
+    """A SMS message received by a modem
+
+    Messages are immutable. The receive time is kept as the string sent by the modem in ``date`` and only parsed into
+    the ``receive_time`` datetime the first time it is used.
+    """
+    __slots__ = ('message_id', 'message', 'sender', 'date', 'read', 'sms_type', 'priority', 'save_type', 'sca',
+                 '_receive_time')
+
+    def __init__(self, message_id="", message="", sender="", date=None, read=False, sms_type=1, priority=0,
+                 save_type=4, sca=""):
+        """ Create a SMS message
+
+        :param message_id: The index of the message on the modem
+        :param message: The text of the message
+        :param sender: The phone number of the sender
+        :param date: The time the message was received as sent by the modem. Ex: 2015-09-08 11:03:00
+        :param read: True if the message has been read (Smstat)
+        :param sms_type: The SmsType of the message
+        :param priority: The Priority of the message
+        :param save_type: The SaveType of the message
+        :param sca: The number of the SMS center that delivered the message
+        """
+        init = object.__setattr__
+        init(self, 'message_id', message_id)
+        init(self, 'message', message)
+        init(self, 'sender', sender)
+        init(self, 'date', date)
+        init(self, 'read', read)
+        init(self, 'sms_type', sms_type)
+        init(self, 'priority', priority)
+        init(self, 'save_type', save_type)
+        init(self, 'sca', sca)
+        init(self, '_receive_time', _unparsed)
+
+    @property
+    def receive_time(self):
+        """ The time the message was received as datetime """
+        if self._receive_time is _unparsed:
+            receive_time = parse_date(self.date) if self.date else None
+            object.__setattr__(self, '_receive_time', receive_time)
+        return self._receive_time
+
+    def _fields(self):
+        return (self.message_id, self.message, self.sender, self.date, self.read, self.sms_type, self.priority,
+                self.save_type, self.sca)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("SMSMessage is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("SMSMessage is immutable")
+
+    def __reduce__(self):
+        return SMSMessage, self._fields()
+
+    def __eq__(self, other):
+        if not isinstance(other, SMSMessage):
+            return NotImplemented
+        return self._fields() == other._fields()
+
+    def __hash__(self):
+        return hash(self._fields())
+
+    def __repr__(self):
+        return "<SMSMessage {} '{}' from '{}'>".format(self.message_id, self.message, self.sender)
+
+
+class DeleteResult:
+    """ The outcome of deleting SMS messages from a modem
+
+    deleted
+      The indexes of the messages that have been deleted
+
+    failed
+      The indexes of the messages that could not be deleted
+
+    errors
+      The exceptions raised by the failed delete requests
+    """
+
+    def __init__(self):
+        self.deleted = []
+        self.failed = []
+        self.errors = []
+
+    def update(self, other):
+        """ Add the outcome of another DeleteResult to this one """
+        self.deleted.extend(other.deleted)
+        self.failed.extend(other.failed)
+        self.errors.extend(other.errors)
+
+    def __repr__(self):
+        return "<DeleteResult {} deleted, {} failed>".format(len(self.deleted), len(self.failed))
+
+
+class ModemSnapshot:
+    """ The state of a modem collected with :func:`~huawei_3g.HuaweiE303Modem.get_snapshot`
+
+    status, message_count, signal, device_information, traffic, month_statistics
+      The dictionaries returned by the get_* method of the field, None if the field wasn't requested or failed
+
+    timestamps
+      A dictionary mapping every field that was received to the time in seconds since the epoch it arrived
+
+    errors
+      A dictionary mapping the fields the modem answered with an error to the
+      :class:`~huawei_3g.huawei_e303.ApiError`
+    """
+    __slots__ = ('path', 'status', 'message_count', 'signal', 'device_information', 'traffic', 'month_statistics',
+                 'timestamps', 'errors')
+
+    def __init__(self, path):
+        self.path = path
+        self.status = None
+        self.message_count = None
+        self.signal = None
+        self.device_information = None
+        self.traffic = None
+        self.month_statistics = None
+        self.timestamps = {}
+        self.errors = {}
 
     def __repr__(self):
-        return "<SMSMessage {} '{}' from '{}'>".format(self.message_id, self.message, self.sender)
\ No newline at end of file
+        return "<ModemSnapshot {} {}>".format(self.path, " ".join(sorted(self.timestamps)))
@@ -0,0 +1,86 @@
+import heapq
+import threading
+
+# Token requests go first, reading pages of messages last so short calls don't wait behind a long inbox
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2
+
+
+class RequestGate:
+    """ Lets a single request at a time through to a modem
+
+    The HiLink firmware answers concurrent requests with spurious "Busy" and token errors, so every HTTP exchange with
+    a modem holds the gate of the modem. Threads that find the gate taken wait in a queue ordered by priority and then
+    by arrival, when the gate is released it is handed directly to the first waiting thread. Taking a free gate only
+    takes a lock, so a modem used by a single thread doesn't pay for it.
+
+    Only the exchange itself holds the gate, parsing the response happens after it is released so multiple threads
+    sharing a modem keep it busy.
+    """
+
+    def __init__(self):
+        self.waits = 0
+        self._busy = False
+        self._waiting = []
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, priority=PRIORITY_NORMAL):
+        """ Wait until the gate is free and take it, lower priority values go first """
+        with self._lock:
+            if not self._busy:
+                self._busy = True
+                return
+            self.waits += 1
+            self._sequence += 1
+            turn = threading.Event()
+            heapq.heappush(self._waiting, (priority, self._sequence, turn))
+        turn.wait()
+
+    def release(self):
+        """ Hand the gate to the next waiting thread or free it """
+        with self._lock:
+            if self._waiting:
+                heapq.heappop(self._waiting)[2].set()
+            else:
+                self._busy = False
+
+    def hold(self, priority=PRIORITY_NORMAL):
+        """ A context manager that holds the gate for a block """
+        return _Held(self, priority)
+
+    @property
+    def waiting(self):
+        """ The amount of threads waiting for the gate """
+        with self._lock:
+            return len(self._waiting)
+
+
+class _Held:
+    __slots__ = ('gate', 'priority')
+
+    def __init__(self, gate, priority):
+        self.gate = gate
+        self.priority = priority
+
+    def __enter__(self):
+        self.gate.acquire(self.priority)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.gate.release()
+
+
+class OpenGate:
+    """ A gate that never blocks, for modems that are allowed concurrent requests """
+    waits = 0
+    waiting = 0
+
+    def acquire(self, priority=PRIORITY_NORMAL):
+        pass
+
+    def release(self):
+        pass
+
+    def hold(self, priority=PRIORITY_NORMAL):
+        return _Held(self, priority)
@@ -0,0 +1,148 @@
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(IOError):
+    """ Raised instead of sending a request to a modem that has been failing, see :class:`~huawei_3g.health.Health`
+
+    :param retry_after: The time in seconds until the modem is tried again
+    """
+
+    def __init__(self, message="The modem is unavailable", retry_after=0):
+        IOError.__init__(self, message)
+        self.retry_after = retry_after
+
+
+class Health:
+    """ A circuit breaker and health score for a single modem
+
+    Connection errors, timeouts and "Busy" answers are failures, every other answer of the modem, also other API
+    errors, is a success. After ``failure_threshold`` failures in a row the circuit opens and requests fail right
+    away with :class:`~huawei_3g.health.CircuitOpenError` for ``reset_timeout`` seconds. Then the circuit is half-open:
+    ``probes`` requests at a time are let through to test the modem, a success closes the circuit and a failure opens
+    it again with twice the timeout, up to ``max_reset_timeout``.
+
+    The score is a number between 0 and 1 that combines the recent success rate and latency, so fleet code can
+    prefer fast and reliable modems, see :func:`~huawei_3g.health.rank`. An open circuit scores 0.
+
+    :param failure_threshold: The amount of failures in a row that opens the circuit
+    :param reset_timeout: The time in seconds the circuit stays open before it is probed
+    :param max_reset_timeout: The maximum time in seconds the circuit stays open
+    :param probes: The amount of requests let through at the same time while half-open
+    :param latency_target: The latency in seconds that scores 0.5 for speed, faster modems score higher
+    :param smoothing: The weight of the newest request in the averaged success rate and latency
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=5, max_reset_timeout=60, probes=1, latency_target=0.5,
+                 smoothing=0.2):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.probes = probes
+        self.latency_target = latency_target
+        self.smoothing = smoothing
+        self.state = CLOSED
+        self.failures = 0
+        self.success_rate = 1.0
+        self.latency = 0.0
+        self._timeout = reset_timeout
+        self._opened = 0
+        self._probing = 0
+        self._lock = threading.Lock()
+
+    @property
+    def score(self):
+        """ The health of the modem between 0 and 1 """
+        with self._lock:
+            if self._current_state() == OPEN:
+                return 0.0
+            return self.success_rate * self.latency_target / (self.latency_target + self.latency)
+
+    @property
+    def available(self):
+        """ False while the circuit is open and requests fail right away """
+        with self._lock:
+            return self._current_state() != OPEN
+
+    def before_request(self):
+        """ Check if a request may be sent, raises :class:`~huawei_3g.health.CircuitOpenError` if not
+
+        Every call that doesn't raise must be followed by :func:`~huawei_3g.health.Health.success` or
+        :func:`~huawei_3g.health.Health.failure`.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == OPEN:
+                raise CircuitOpenError(retry_after=self._opened + self._timeout - time.monotonic())
+            if state == HALF_OPEN:
+                if self._probing >= self.probes:
+                    raise CircuitOpenError("The modem is being probed")
+                self._probing += 1
+
+    def success(self, latency):
+        """ Record a request the modem answered
+
+        :param latency: The time in seconds the modem took to answer
+        """
+        with self._lock:
+            self._average(1.0, latency)
+            self.failures = 0
+            if self.state == HALF_OPEN:
+                self._probing -= 1
+                self.state = CLOSED
+                self._timeout = self.reset_timeout
+
+    def failure(self, latency=None):
+        """ Record a request that failed
+
+        :param latency: The time in seconds until the request failed, for timeouts
+        """
+        with self._lock:
+            self._average(0.0, latency)
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                self._probing -= 1
+                self._open(min(self._timeout * 2, self.max_reset_timeout))
+            elif self.state == CLOSED and self.failures >= self.failure_threshold:
+                self._open(self.reset_timeout)
+
+    def reset(self):
+        """ Close the circuit, for example after the modem was plugged in again """
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = 0
+            self._timeout = self.reset_timeout
+
+    def _open(self, timeout):
+        self.state = OPEN
+        self._timeout = timeout
+        self._opened = time.monotonic()
+
+    def _current_state(self):
+        if self.state == OPEN and time.monotonic() - self._opened >= self._timeout:
+            self.state = HALF_OPEN
+            self._probing = 0
+        return self.state
+
+    def _average(self, success, latency):
+        self.success_rate += (success - self.success_rate) * self.smoothing
+        if latency is not None:
+            self.latency += (latency - self.latency) * self.smoothing
+
+    def __repr__(self):
+        return "<Health {} score {:.2f}>".format(self.state, self.score)
+
+
+def rank(modems):
+    """ Sort modems from the healthiest to the least healthy and leave out the modems with an open circuit
+
+    :param modems: A list of :class:`~huawei_3g.huawei_e303.HuaweiE303Modem` instances
+    """
+    scored = [(modem.health.score, i, modem) for i, modem in enumerate(modems) if modem.health.available]
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return [modem for score, i, modem in scored]
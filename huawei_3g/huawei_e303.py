@@ -1,16 +1,76 @@
-import requests
-import xmltodict
 import datetime
-from huawei_3g.datastructures import SMSMessage
+import threading
+import time
+from huawei_3g.cache import ResponseCache
+from huawei_3g.csrf import TokenManager
+from huawei_3g.datastructures import DeleteResult, ModemSnapshot
+from huawei_3g.gate import RequestGate, OpenGate, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_BULK
+from huawei_3g.health import Health
+from huawei_3g.metrics import Metrics
+from huawei_3g.parsers import get_parser, ErrorRecord
+from huawei_3g.transport import Binding, BindError, DEFAULT_TIMEOUT, get_transport
 
 
-class TokenError(Exception):
+# The fields of a ModemSnapshot, see HuaweiE303Modem.get_snapshot
+SNAPSHOT_FIELDS = ("status", "message_count", "signal", "device_information", "traffic", "month_statistics")
+
+
+def _escape(text):
+    # xml.sax.saxutils.escape does the same but importing it loads urllib and the email package
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+class ApiError(Exception):
+    """ Raised when the HiLink API answers with an error code """
+
+    def __init__(self, message, code=None):
+        Exception.__init__(self, message)
+        self.code = code
+
+
+class BusyError(ApiError):
+    """ Raised when the modem is too busy to handle a request, retry it later """
+
+    def __init__(self, message="Busy", code="100004"):
+        ApiError.__init__(self, message, code)
+
+
+class TokenError(ApiError):
+    """ Raised when the modem rejects the __RequestVerificationToken, the request is retried with a new token """
+
+    def __init__(self, message="Wrong __RequestVerificationToken header", code="125001"):
+        ApiError.__init__(self, message, code)
+
+
+class NotSupportedError(ApiError):
+    """ Raised when the firmware of the modem doesn't have the API call """
+    pass
+
+
+class AccessDeniedError(ApiError):
+    """ Raised when the modem refuses the API call """
+    pass
+
+
+class LoginError(ApiError):
+    """ Raised when logging in to the web interface fails """
+    pass
+
+
+class VoiceBusyError(ApiError):
+    """ Raised when the modem can't handle the API call during a voice call """
     pass
 
 
 class HuaweiE303Modem:
     """ This class abstracts the communication with a Huawei HiLink E303 modem"""
-    token = ""
+
+    BOX_INBOX = 1
+    BOX_OUTBOX = 2
+    BOX_DRAFT = 3
+
+    # The amount of message indexes sent in a single delete-sms request
+    DELETE_BATCH_SIZE = 20
 
     _error_codes = {
         "100002": "No support",  # Huawei branded 404
@@ -20,7 +80,21 @@ class HuaweiE303Modem:
         "108002": "Wrong password",
         "108003": "Already logged in",
         "120001": "Voice busy",
-        "125001": "Wrong __RequestVerificationToken header"
+        "125001": "Wrong __RequestVerificationToken header",
+        "125002": "Wrong session",
+        "125003": "Wrong session token"
+    }
+    _error_types = {
+        "100002": NotSupportedError,
+        "100003": AccessDeniedError,
+        "100004": BusyError,
+        "108001": LoginError,
+        "108002": LoginError,
+        "108003": LoginError,
+        "120001": VoiceBusyError,
+        "125001": TokenError,
+        "125002": TokenError,
+        "125003": TokenError
     }
     _network_type = {
         0: "No service",
@@ -74,20 +148,93 @@ class HuaweiE303Modem:
         905: "Connection failed, signal poor",
     }
 
-    def __init__(self, interface, sysfs_path):
+    # field: (API url, parser method or None for the generic parser, decoder)
+    _snapshot_endpoints = {
+        "status": ("/monitoring/status", "status", "_decode_status"),
+        "message_count": ("/sms/sms-count", "message_count", "_decode_message_count"),
+        "signal": ("/device/signal", None, "_decode_signal"),
+        "device_information": ("/device/information", None, "_decode_device_information"),
+        "traffic": ("/monitoring/traffic-statistics", "traffic", "_decode_record"),
+        "month_statistics": ("/monitoring/month_statistics", "month_statistics", "_decode_record")
+    }
+
+    # The priority of the requests of an API url in the request gate, see huawei_3g.gate
+    _priorities = {
+        "/webserver/token": PRIORITY_HIGH,
+        "/sms/sms-list": PRIORITY_BULK
+    }
+
+    _box_count = {
+        1: "local_inbox",
+        2: "local_outbox",
+        3: "local_draft"
+    }
+
+    def __init__(self, interface, sysfs_path, ip="192.168.8.1", pool_size=2, timeout=DEFAULT_TIMEOUT, retries=2,
+                 token_ttl=300, token_retries=1, parser="fast", bind=None, cache_ttls=None, transport="requests",
+                 health=None, serialize=True, workers=4):
         """ Create instance of the HuaweiE303Modem class
 
+        The modem keeps a pool of kept-alive HTTP connections to the HiLink web server. Call
+        :func:`~huawei_3g.HuaweiE303Modem.close` or use the modem as a context manager to release them.
+
+        A modem object can be shared by any amount of threads. The firmware of the modem misbehaves when it gets
+        multiple requests at once, so the requests are sent one at a time, see :class:`~huawei_3g.gate.RequestGate`.
+        Work can also be handed to the modem with :func:`~huawei_3g.HuaweiE303Modem.submit`.
+
         :param interface: The name of the network interface associated with this modem
         :param sysfs_path: The path in /sys/** that represents this USB device
+        :param ip: The address of the HiLink web server, optionally with a port
+        :param pool_size: The maximum amount of kept-alive connections to the modem
+        :param timeout: The (connect, read) timeout in seconds for every API call
+        :param retries: The amount of retries on connection errors, or a urllib3 Retry instance
+        :param token_ttl: The time in seconds the __RequestVerificationToken is cached and renewed in the background
+        :param token_retries: How many times a request is repeated with a new token when the modem rejects the token
+        :param parser: The response parser to use, "fast" or "xmltodict"
+        :param bind: Bind the connections to the network interface of the modem so multiple modems with the same ip
+                     can be used at the same time. One of "auto", "device" or "address", see
+                     :class:`~huawei_3g.transport.Binding`. Raises :class:`~huawei_3g.transport.BindError` if the
+                     binding isn't possible. Without an interface the binding waits for
+                     :func:`~huawei_3g.HuaweiE303Modem.set_interface` and API calls raise BindError until then.
+        :param cache_ttls: A dictionary mapping API urls to the time in seconds their response is cached, see
+                           :data:`~huawei_3g.cache.DEFAULT_TTLS`. Use an empty dictionary to disable caching.
+        :param transport: The HTTP client, "requests" or "socket" (see :func:`~huawei_3g.transport.get_transport`) or
+                          a transport instance such as a :class:`~huawei_3g.transport.ReplayTransport`. The pool_size,
+                          timeout, retries and bind options only apply to transports created by name.
+        :param health: A :class:`~huawei_3g.health.Health` instance to configure the circuit breaker, while the
+                       circuit is open API calls raise :class:`~huawei_3g.health.CircuitOpenError` right away
+        :param serialize: Send a single request at a time to the modem, disable this only for firmware that handles
+                          concurrent requests
+        :param workers: The amount of threads that run the work passed to :func:`~huawei_3g.HuaweiE303Modem.submit`
         """
         self.interface = interface
         self.path = sysfs_path
-        self.ip = "192.168.8.1"
+        self.ip = ip
         self.base_url = "http://{}/api".format(self.ip)
-        self.token = ""
-        # self._get_token()
-
-    def get_status(self):
+        self.timeout = timeout
+        self.bind = bind
+        # A modem that is plugged in before its network interface shows up is bound in set_interface
+        self.binding = Binding(interface, bind) if bind and interface else None
+        self._transport_options = {'pool_size': pool_size, 'timeout': timeout, 'retries': retries}
+        self._transport_name = transport if isinstance(transport, str) else None
+        self.transport = self._create_transport() if self._transport_name else transport
+        self.tokens = TokenManager(self._fetch_token, ttl=token_ttl)
+        self.token_retries = token_retries
+        self.parser = get_parser(parser)
+        self.cache = ResponseCache(cache_ttls)
+        self.metrics = Metrics()
+        self.health = health or Health()
+        self.gate = RequestGate() if serialize else OpenGate()
+        self.workers = workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def token(self):
+        """ The current __RequestVerificationToken """
+        return self.tokens.token
+
+    def get_status(self, cache=True):
         """ Get the status of the attached modem
 
         This returns the status/connection information of this modem as a dictionary with the following keys:
@@ -101,19 +248,43 @@ class HuaweiE303Modem:
 
         network_type
           The protocol used to communicate with the network. Ex: 3G or GPRS
+
+        :param cache: Set to False to skip the response cache for this call
         """
-        status_raw = self._api_get("/monitoring/status")
-        signal = int(int(status_raw['SignalIcon']) / 5.0 * 100.0)
-        network_type = "Unknown"
-        if int(status_raw['CurrentNetworkType']) in self._network_type:
-            network_type = self._network_type[int(status_raw['CurrentNetworkType'])]
-        return {
-            'status': self._network_status[int(status_raw['ConnectionStatus'])],
-            'signal': signal,
-            'network_type': network_type
-        }
+        return self._decode_status(self._api_get("/monitoring/status", self.parser.status, cache))
+
+    def get_traffic_statistics(self, cache=True):
+        """ Get the data usage of the modem
+
+        This returns a dictionary with the following keys:
+
+        connect_time
+          The duration of the current connection in seconds
 
-    def get_message_count(self):
+        upload, download
+          The bytes sent and received during the current connection
+
+        upload_rate, download_rate
+          The current speed in bytes per second
+
+        total_upload, total_download, total_connect_time
+          The counters since the statistics were last cleared
+
+        :param cache: Set to False to skip the response cache for this call
+        """
+        return self._decode_record(self._api_get("/monitoring/traffic-statistics", self.parser.traffic, cache))
+
+    def get_month_statistics(self, cache=True):
+        """ Get the data usage of the current month
+
+        This returns a dictionary with the keys download and upload in bytes, duration in seconds and last_clear, the
+        date the counters were reset as reported by the modem. Ex: 2015-9-1
+
+        :param cache: Set to False to skip the response cache for this call
+        """
+        return self._decode_record(self._api_get("/monitoring/month_statistics", self.parser.month_statistics, cache))
+
+    def get_message_count(self, cache=True):
         """ Get the amount of SMS messages on the modem
 
         Returns the amount of SMS messages stored on the internal memory of the modem as a dictionary
@@ -123,12 +294,129 @@ class HuaweiE303Modem:
 
         unread
           The count of messages that arent read yet.
+
+        :param cache: Set to False to skip the response cache for this call
         """
-        messages_raw = self._api_get("/sms/sms-count")
-        return {
-            'count': int(messages_raw['LocalInbox']),
-            'unread': int(messages_raw['LocalUnread'])
-        }
+        return self._decode_message_count(self._api_get("/sms/sms-count", self.parser.message_count, cache))
+
+    def get_device_information(self, cache=True):
+        """ Get information about the modem hardware and SIM card
+
+        This returns a dictionary with the following keys:
+
+        name
+          The model of the modem. Ex: E303
+
+        serial, imei, imsi, iccid, msisdn
+          The identifiers of the modem and the SIM card as strings, msisdn is often empty
+
+        hardware_version, software_version
+          The versions of the modem hardware and firmware
+
+        :param cache: Set to False to skip the response cache for this call
+        """
+        return self._decode_device_information(self._api_get("/device/information", cache=cache))
+
+    def get_signal(self, cache=True):
+        """ Get the radio signal details of the modem
+
+        This returns a dictionary with the levels the modem reports for its network type as integers, levels that
+        aren't reported are None:
+
+        rssi, rscp, rsrp
+          The received signal power in dBm
+
+        ecio, rsrq, sinr
+          The signal quality in dB
+
+        mode
+          The radio mode as reported by the modem, 2 is WCDMA and 7 is LTE
+
+        cell_id
+          The id of the cell the modem is connected to as a string
+
+        :param cache: Set to False to skip the response cache for this call
+        """
+        return self._decode_signal(self._api_get("/device/signal", cache=cache))
+
+    def get_snapshot(self, fields=SNAPSHOT_FIELDS):
+        """ Get multiple kinds of information of the modem at once
+
+        Only the API calls the fields need are done. With a transport that supports pipelining, like the "socket"
+        transport, all requests are sent at once over a single connection, other transports do the requests one after
+        another. The requests hold the request gate together with the priority of bulk work and the responses are
+        parsed after the gate is released. The cache is not used.
+
+        Fields the modem rejects the token for are requested again with a new token, like every other API call.
+        Fields the modem answers with another error are left None and the error is kept in the errors of the
+        snapshot, connection errors are raised.
+
+        :param fields: The fields to get, a selection of "status", "message_count", "signal", "device_information",
+                       "traffic" and "month_statistics"
+        :return: a :class:`~huawei_3g.datastructures.ModemSnapshot`
+        """
+        fields = list(fields)
+        for field in fields:
+            if field not in self._snapshot_endpoints:
+                raise ValueError("Unknown snapshot field {}".format(field))
+        snapshot = ModemSnapshot(self.path)
+        if not fields:
+            return snapshot
+
+        self._check_binding()
+        token = self.tokens.token
+        pending = fields
+        attempt = 0
+        while pending:
+            self.health.before_request()
+            start = time.perf_counter()
+            headers = {"__RequestVerificationToken": token}
+            try:
+                responses = self._exchange([("GET", "/api" + self._snapshot_endpoints[field][0], None, headers)
+                                            for field in pending])
+            except Exception:
+                self.health.failure(time.perf_counter() - start)
+                for field in pending:
+                    self.metrics.error(self._snapshot_endpoints[field][0], "connection")
+                raise
+            received = time.perf_counter()
+
+            busy = False
+            stale = []
+            try:
+                for (response, latency), field in zip(responses, pending):
+                    url, parser, decoder = self._snapshot_endpoints[field]
+                    parse_start = time.perf_counter()
+                    try:
+                        parsed = self._parse_api_response(response, parser and getattr(self.parser, parser))
+                        setattr(snapshot, field, getattr(self, decoder)(parsed))
+                    except TokenError as error:
+                        self.metrics.error(url, error.code)
+                        if attempt < self.token_retries:
+                            stale.append(field)
+                        else:
+                            snapshot.errors[field] = error
+                    except ApiError as error:
+                        busy = busy or isinstance(error, BusyError)
+                        self.metrics.error(url, error.code)
+                        snapshot.errors[field] = error
+                    if field not in stale:
+                        snapshot.timestamps[field] = time.time()
+                    self.metrics.observe(url, latency, time.perf_counter() - parse_start)
+            except Exception:
+                self.health.failure(received - start)
+                raise
+            if busy:
+                self.health.failure(received - start)
+            else:
+                self.health.success((received - start) / len(pending))
+
+            # Fields the modem rejected the token for are requested again with a new token
+            if stale:
+                attempt += 1
+                token = self.tokens.refresh(stale=token)
+            pending = stale
+        return snapshot
 
     def get_messages(self, delete=False):
         """ Get all SMS messages stored on the modem
@@ -137,41 +425,157 @@ class HuaweiE303Modem:
         :class:`~huawei_3g.datastructures.SMSMessage` instances.
 
         If you set the delete argument to True then the messages will be deleted after retrieving them with this method.
+        This uses :func:`~huawei_3g.HuaweiE303Modem.drain_messages`, messages that couldn't be deleted stay on the
+        modem and are returned again by the next call. Use drain_messages to see which messages failed.
 
         :param delete: Delete the messages after this call
         """
-        raw = self._api_post("/sms/sms-list",
-                             "<?xml version=\"1.0\" encoding=\"UTF-8\"?><request>"
-                             "<PageIndex>1</PageIndex>"
-                             "<ReadCount>50</ReadCount>"
-                             "<BoxType>1</BoxType>"
-                             "<SortType>0</SortType>"
-                             "<Ascending>0</Ascending>"
-                             "<UnreadPreferred>0</UnreadPreferred>"
-                             "</request>")
+        if delete:
+            return self.drain_messages()[0]
+        return list(self.iter_messages(page_size=50, prefetch=False))
+
+    def drain_messages(self, page_size=50, batch_size=DELETE_BATCH_SIZE):
+        """ Get all SMS messages from the inbox and delete them
+
+        This collects the messages of :func:`~huawei_3g.HuaweiE303Modem.iter_drain`. Only the returned messages are
+        deleted, if deleting a batch fails the messages stay on the modem and calling this again picks them up. When
+        reading a page fails before any message was read the error is raised, otherwise the messages that have been
+        read are returned and the error is added to the errors of the result.
+
+        :param page_size: The amount of messages requested in a single API call
+        :param batch_size: The amount of messages deleted in a single API call
+        :return: a tuple of the list of messages, newest first, and a :class:`~huawei_3g.datastructures.DeleteResult`
+        """
+        result = DeleteResult()
         messages = []
-        if raw['Count'] == '0':
-            return []
+        try:
+            for message in self.iter_drain(page_size, batch_size, result):
+                messages.append(message)
+        except Exception as error:
+            if not messages:
+                raise
+            result.errors.append(error)
+        messages.reverse()
+        return messages, result
+
+    def iter_drain(self, page_size=50, batch_size=DELETE_BATCH_SIZE, result=None):
+        """ Iterate over the SMS messages in the inbox and delete them
+
+        This is a generator that yields :class:`~huawei_3g.datastructures.SMSMessage` instances, oldest first. The
+        pages of the inbox are read from the last page to the first page so deleting the messages of a page never
+        moves messages that are still to be read to another page. The messages of a page are deleted in the
+        background while the next page is fetched, but only after the caller consumed all of them. When reading a
+        page fails or the caller stops early the messages it didn't get stay on the modem.
+
+        :param page_size: The amount of messages requested in a single API call
+        :param batch_size: The amount of messages deleted in a single API call
+        :param result: A :class:`~huawei_3g.datastructures.DeleteResult` the outcome of the deletes is added to
+        """
+        if result is None:
+            result = DeleteResult()
+        count = self._api_get("/sms/sms-count", self.parser.message_count, cache=False).local_inbox
+        seen = set()
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            deleting = None
+            try:
+                for page_index in range((count + page_size - 1) // page_size, 0, -1):
+                    page = self._fetch_page(page_index, page_size, self.BOX_INBOX, False)
+                    if deleting:
+                        result.update(deleting.result())
+                        deleting = None
+                    consumed = []
+                    for message in reversed(page):
+                        # Messages that are removed by someone else while the inbox is read can repeat one
+                        if message.message_id not in seen:
+                            seen.add(message.message_id)
+                            yield message
+                            consumed.append(message.message_id)
+                    if consumed:
+                        deleting = executor.submit(self.delete_messages, consumed, batch_size)
+            finally:
+                if deleting:
+                    result.update(deleting.result())
+
+    def iter_messages(self, box=BOX_INBOX, page_size=20, unread_first=False, prefetch=True, count=None):
+        """ Iterate over the SMS messages stored on the modem one page at a time
+
+        This is a generator that yields :class:`~huawei_3g.datastructures.SMSMessage` instances. Only a single page
+        of messages is kept in memory. The amount of pages is planned with the message count of the box so an
+        empty box costs a single cheap request.
+
+        If prefetch is enabled the next page is requested in a background thread while the caller is working on the
+        messages of the current page.
+
+        :param box: The box to read, one of BOX_INBOX, BOX_OUTBOX or BOX_DRAFT
+        :param page_size: The amount of messages requested in a single API call
+        :param unread_first: Return the unread messages before the read messages
+        :param prefetch: Fetch the next page while the current page is being consumed
+        :param count: The amount of messages in the box if the caller just requested it, saves requesting it again
+        """
+        if count is None:
+            count = getattr(self._api_get("/sms/sms-count", self.parser.message_count, cache=False),
+                            self._box_count[box])
+        pages = (count + page_size - 1) // page_size
+        if pages == 0:
+            return
+
+        executor = None
+        if prefetch and pages > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            upcoming = None
+            for page_index in range(1, pages + 1):
+                if upcoming:
+                    messages = upcoming.result()
+                else:
+                    messages = self._fetch_page(page_index, page_size, box, unread_first)
+
+                # A short page means messages got removed since the count was requested
+                last_page = page_index == pages or len(messages) < page_size
+                if executor and not last_page:
+                    upcoming = executor.submit(self._fetch_page, page_index + 1, page_size, box, unread_first)
+                for message in messages:
+                    yield message
+                if last_page:
+                    break
+        finally:
+            if executor:
+                executor.shutdown(wait=False)
+
+    def send_sms(self, phones, message):
+        """ Send an SMS message
+
+        The modem only accepts the message, use :func:`~huawei_3g.HuaweiE303Modem.get_send_status` to see if it was
+        delivered to the network. Raises :class:`~huawei_3g.huawei_e303.BusyError` when the modem is still sending
+        another message.
+
+        :param phones: The phone number to send the message to, or a list of phone numbers
+        :param message: The text of the message
+        """
+        if isinstance(phones, str):
+            phones = [phones]
+        self._api_post("/sms/send-sms", self._send_sms_request(phones, message), self.parser.acknowledgement)
+        self.cache.invalidate("/sms/")
 
-        if raw['Count'] == '1':
-            message_list = [raw['Messages']['Message']]
-        else:
-            message_list = raw['Messages']['Message']
-
-        for message in message_list:
-            sms = SMSMessage()
-            sms.message_id = message['Index']
-            sms.message = message['Content']
-            sms.sender = message['Phone']
-            receive_time = message['Date']
-            sms.receive_time = datetime.datetime.strptime(receive_time, '%Y-%m-%d %H:%M:%S')
-            messages.append(sms)
-        if delete:
-            ids = []
-            for message in messages:
-                ids.append(message.message_id)
-            self.delete_messages(ids)
-        return messages
+    def get_send_status(self):
+        """ Get the progress of the last :func:`~huawei_3g.HuaweiE303Modem.send_sms`
+
+        This returns a dictionary with the following keys:
+
+        sending
+          The phone number the modem is sending to or None when it's done
+
+        sent, failed
+          Lists of the phone numbers the message was and wasn't delivered to
+        """
+        raw = self._api_get("/sms/send-status", cache=False)
+        return {
+            'sending': raw.get('Phone') or None,
+            'sent': [phone for phone in (raw.get('SucPhone') or "").split(",") if phone],
+            'failed': [phone for phone in (raw.get('FailPhone') or "").split(",") if phone]
+        }
 
     def delete_message(self, message_id):
         """ Delete a SMS message from the modem
@@ -182,64 +586,294 @@ class HuaweiE303Modem:
         """
         return self.delete_messages([message_id])
 
-    def delete_messages(self, ids):
+    def delete_messages(self, ids, batch_size=DELETE_BATCH_SIZE):
         """ Delete multiple SMS messages from the modem
 
         This does the same thing as :func:`~huawei_3g.HuaweiE303Modem.delete_message` but accepts a list of message
-        indexes to delete them in a single API call.
+        indexes. The indexes are sent in batches of batch_size messages, a failing batch doesn't stop the other
+        batches from being deleted.
+
+        :param ids: The message indexes to delete
+        :param batch_size: The amount of messages deleted in a single API call
+        :return: a :class:`~huawei_3g.datastructures.DeleteResult`
+        """
+        ids = list(ids)
+        result = DeleteResult()
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            try:
+                self._api_post("/sms/delete-sms", self._delete_request(batch), self.parser.acknowledgement)
+            except Exception as error:
+                result.failed.extend(batch)
+                result.errors.append(error)
+            else:
+                result.deleted.extend(batch)
+        self.cache.invalidate("/sms/")
+        return result
+
+    def set_interface(self, interface):
+        """ Change the network interface of the modem, this rebinds the connections if binding is enabled """
+        if self.bind:
+            self.binding = Binding(interface, self.bind) if interface else None
+            self.interface = interface
+            if self._transport_name:
+                transport = self.transport
+                self.transport = self._create_transport()
+                transport.close()
+        else:
+            self.interface = interface
+
+    def submit(self, function, *args, **kwargs):
+        """ Run a function in the background, usually a method of this modem
+
+        The requests of all submitted work share the request gate of the modem, requests for a page of messages
+        wait for the other requests so short calls aren't stuck behind reading a full inbox::
+
+            status = modem.submit(modem.get_status)
+            messages = modem.submit(modem.get_messages)
+            print(status.result())
+
+        :return: a :class:`concurrent.futures.Future` with the return value of the function
         """
-        xml = "<?xml version=\"1.0\" encoding=\"UTF-8\"?><request>"
-        for message_id in ids:
-            xml += "<Index>{}</Index>".format(message_id)
-        xml += "</request>"
-        self._api_post("/sms/delete-sms", xml)
+        with self._executor_lock:
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="huawei-3g-modem")
+            return self._executor.submit(function, *args, **kwargs)
+
+    def close(self):
+        """ Wait for the submitted work, close the kept-alive connections to the modem and stop the token refresh """
+        with self._executor_lock:
+            executor = self._executor
+            self._executor = None
+        if executor:
+            executor.shutdown()
+        self.tokens.close()
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def __repr__(self):
         return "<HuaweiE303Modem {} ({})>".format(self.interface, self.path)
 
+    @classmethod
+    def _decode_status(cls, status):
+        signal = int(status.signal_icon / 5.0 * 100.0)
+        network_type = "Unknown"
+        if status.network_type in cls._network_type:
+            network_type = cls._network_type[status.network_type]
+        return {
+            'status': cls._network_status[status.connection_status],
+            'signal': signal,
+            'network_type': network_type
+        }
+
+    @staticmethod
+    def _decode_message_count(count):
+        return {
+            'count': count.local_inbox,
+            'unread': count.local_unread
+        }
+
+    @staticmethod
+    def _decode_record(record):
+        return dict((name, getattr(record, name)) for name in record.__slots__)
+
+    @staticmethod
+    def _decode_device_information(raw):
+        return {
+            'name': raw.get('DeviceName'),
+            'serial': raw.get('SerialNumber'),
+            'imei': raw.get('Imei'),
+            'imsi': raw.get('Imsi'),
+            'iccid': raw.get('Iccid'),
+            'msisdn': raw.get('Msisdn'),
+            'hardware_version': raw.get('HardwareVersion'),
+            'software_version': raw.get('SoftwareVersion')
+        }
+
+    @staticmethod
+    def _decode_signal(raw):
+        def level(value):
+            # Levels look like -67dBm, some firmware reports the limits of the range as >=-51dBm
+            try:
+                return int(value.lstrip("<>=").rstrip("dBm"))
+            except (AttributeError, ValueError):
+                return None
+
+        return {
+            'rssi': level(raw.get('rssi')),
+            'rscp': level(raw.get('rscp')),
+            'rsrp': level(raw.get('rsrp')),
+            'ecio': level(raw.get('ecio')),
+            'rsrq': level(raw.get('rsrq')),
+            'sinr': level(raw.get('sinr')),
+            'mode': level(raw.get('mode')),
+            'cell_id': raw.get('cell_id') or None
+        }
+
+    @staticmethod
+    def _sms_list_request(page_index, read_count, box=BOX_INBOX, unread_first=False):
+        return ("<?xml version=\"1.0\" encoding=\"UTF-8\"?><request>"
+                "<PageIndex>{}</PageIndex>"
+                "<ReadCount>{}</ReadCount>"
+                "<BoxType>{}</BoxType>"
+                "<SortType>0</SortType>"
+                "<Ascending>0</Ascending>"
+                "<UnreadPreferred>{}</UnreadPreferred>"
+                "</request>").format(page_index, read_count, box, 1 if unread_first else 0)
+
+    def _fetch_page(self, page_index, page_size, box, unread_first):
+        return self._api_post("/sms/sms-list", self._sms_list_request(page_index, page_size, box, unread_first),
+                              self.parser.messages)
+
+    @staticmethod
+    def _send_sms_request(phones, message, now=None):
+        date = (now or datetime.datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+        return ("<?xml version=\"1.0\" encoding=\"UTF-8\"?><request>"
+                "<Index>-1</Index>"
+                "<Phones><Phone>{}</Phone></Phones>"
+                "<Sca></Sca>"
+                "<Content>{}</Content>"
+                "<Length>{}</Length>"
+                "<Reserved>1</Reserved>"
+                "<Date>{}</Date>"
+                "</request>").format("</Phone><Phone>".join(_escape(phone) for phone in phones), _escape(message),
+                                     len(message), date)
+
+    @staticmethod
+    def _delete_request(ids):
+        return "<?xml version=\"1.0\" encoding=\"UTF-8\"?><request><Index>{}</Index></request>".format(
+            "</Index><Index>".join(str(message_id) for message_id in ids))
+
     def _get_token(self):
-        token_response = self._api_get("/webserver/token")
-        self.token = token_response['token']
-
-    def _api_get(self, url):
-        full_url = self.base_url + url
-        response = requests.get(full_url, headers={
-            "__RequestVerificationToken": self.token
-        })
-        try:
-            return self._parse_api_response(response)
-        except TokenError:
-            self._get_token()
-            return self._api_get(url)
+        self.tokens.refresh()
+
+    def _fetch_token(self):
+        return self._parse_api_response(self._send("GET", "/webserver/token", None, ""), self.parser.token)
+
+    def _create_transport(self):
+        return get_transport(self._transport_name, binding=self.binding, **self._transport_options)
+
+    def _api_get(self, url, parse=None, cache=True):
+        return self.cache.get(url, lambda: self._api_request("GET", url, parse=parse), parse, bypass=not cache)
+
+    def _api_post(self, url, parameters, parse=None):
+        return self._api_request("POST", url, parameters.encode('UTF-8'), parse)
+
+    def _api_request(self, method, url, data=None, parse=None):
+        self._check_binding()
+        # The E303 accepts GET requests without a token, so only POST requests wait for one to be fetched
+        token = self.tokens.get() if method == "POST" else self.tokens.token
+        attempt = 0
+        while True:
+            self.health.before_request()
+            start = time.perf_counter()
+            try:
+                response = self._send(method, url, data, token)
+            except Exception:
+                self.health.failure(time.perf_counter() - start)
+                self.metrics.error(url, "connection")
+                raise
+            received = time.perf_counter()
+            try:
+                result = self._parse_api_response(response, parse)
+            except BusyError as error:
+                self.health.failure(received - start)
+                self.metrics.error(url, error.code)
+                raise
+            except TokenError as error:
+                self.health.success(received - start)
+                self.metrics.error(url, error.code)
+                if attempt >= self.token_retries:
+                    raise
+                attempt += 1
+                token = self.tokens.refresh(stale=token)
+            except ApiError as error:
+                # The modem answered, so it is healthy even if it didn't like the request
+                self.health.success(received - start)
+                self.metrics.error(url, error.code)
+                raise
+            except Exception:
+                self.health.failure(received - start)
+                raise
+            else:
+                self.health.success(received - start)
+                return result
+            finally:
+                self.metrics.observe(url, received - start, time.perf_counter() - received)
+
+    def _check_binding(self):
+        if self.bind and self.binding is None:
+            raise BindError("The modem has no network interface to bind to yet")
 
-    def _api_post(self, url, parameters):
-        full_url = self.base_url + url
-        parameters_bytes = parameters.encode('UTF-8')
+    def _exchange(self, requests):
+        """ Send a list of requests, pipelined if the transport supports it
 
-        response = requests.post(full_url, parameters_bytes, headers={
-            "__RequestVerificationToken": self.token
-        })
+        The gate is held while the responses are received and released before they are parsed.
 
+        :return: a list of (response, seconds waited for the response) tuples
+        """
+        results = []
+        self.gate.acquire(PRIORITY_BULK if len(requests) > 1 else PRIORITY_NORMAL)
+        try:
+            sent = time.perf_counter()
+            if hasattr(self.transport, "pipeline"):
+                responses = self.transport.pipeline(self.ip, requests)
+            else:
+                responses = (self.transport.request(method, self.ip, path, body, headers)
+                             for method, path, body, headers in requests)
+            for response in responses:
+                received = time.perf_counter()
+                # With pipelining this is the time waiting for this response after the previous one
+                results.append((response, received - sent))
+                sent = received
+        finally:
+            self.gate.release()
+        return results
+
+    def _send(self, method, url, data, token):
+        self._check_binding()
+        self.gate.acquire(self._priorities.get(url, PRIORITY_NORMAL))
         try:
-            return self._parse_api_response(response)
-        except TokenError:
-            self._get_token()
-            return self._api_post(url, parameters)
+            return self.transport.request(method, self.ip, "/api" + url, data, {"__RequestVerificationToken": token})
+        finally:
+            self.gate.release()
+
+    @classmethod
+    def _parse_api_response(cls, response, parse=None):
+        """ Parse a response of the HiLink API
 
-    def _parse_api_response(self, response):
+        Without a parse function the response is returned as the dictionary produced by xmltodict. Otherwise the
+        parse function of a :mod:`~huawei_3g.parsers` parser produces a typed record.
+        """
         if response.status_code == 200:
             payload = response.content
+            if parse:
+                parsed = parse(payload)
+                if isinstance(parsed, ErrorRecord):
+                    cls._raise_error(parsed.code)
+                return parsed
+
+            # Imported here so the modem classes can be used without xmltodict
+            import xmltodict
             parsed = xmltodict.parse(payload)
 
             # HAHA! HTTP response codes are for the weak!
             if 'response' in parsed:
                 return parsed['response']
             else:
-                code = parsed['error']['code']
-                if str(code) == "125001":
-                    raise TokenError()
-                if code in self._error_codes:
-                    raise Exception(self._error_codes[str(code)])
-                else:
-                    raise Exception("Unknown error occurred")
+                cls._raise_error(parsed['error']['code'])
         return {}
+
+    @classmethod
+    def _raise_error(cls, code):
+        code = str(code)
+        if code in cls._error_codes:
+            raise cls._error_types[code](cls._error_codes[code], code)
+        else:
+            raise ApiError("Unknown error occurred", code)
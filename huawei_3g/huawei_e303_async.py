@@ -0,0 +1,347 @@
+import asyncio
+from huawei_3g.datastructures import DeleteResult
+from huawei_3g.huawei_e303 import HuaweiE303Modem, TokenError
+from huawei_3g.parsers import get_parser
+from huawei_3g.transport import Binding, BindError
+import huawei_3g.modem
+
+
+class AsyncResponse:
+    """ The parts of a HTTP response the modem classes care about """
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+
+class _Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncTransport:
+    """ A minimal asyncio HTTP/1.1 client with kept-alive connections
+
+    A single transport can be shared by any amount of
+    :class:`~huawei_3g.huawei_e303_async.AsyncHuaweiE303Modem` instances. It keeps a small pool of idle connections
+    per host and network interface binding so polling a modem doesn't need a new TCP handshake every time.
+
+    :param pool_size: The maximum amount of idle connections kept per host
+    :param timeout: The (connect, read) timeout in seconds for every request
+    """
+
+    def __init__(self, pool_size=2, timeout=(3.05, 10)):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._idle = {}
+
+    async def request(self, method, host, path, body=b"", headers=None, binding=None):
+        """ Do a single HTTP request and return a :class:`~huawei_3g.huawei_e303_async.AsyncResponse`
+
+        :param method: GET or POST
+        :param host: The host to connect to, optionally with a port
+        :param path: The path of the request including the leading slash
+        :param body: The request body as bytes
+        :param headers: Extra request headers as a dictionary
+        :param binding: A :class:`~huawei_3g.transport.Binding` to bind the connection to a network interface
+        """
+        key = (host, binding.interface if binding else None)
+        connection = await self._acquire(key, binding)
+        try:
+            status_code, content, keep_alive = await asyncio.wait_for(
+                self._exchange(connection, method, host, path, body, headers or {}), self.timeout[1])
+        except BaseException:
+            connection.close()
+            raise
+        if keep_alive:
+            self._release(key, connection)
+        else:
+            connection.close()
+        return AsyncResponse(status_code, content)
+
+    async def close(self):
+        """ Close all idle connections """
+        for connections in self._idle.values():
+            for connection in connections:
+                connection.close()
+        self._idle = {}
+
+    async def _acquire(self, key, binding):
+        idle = self._idle.get(key)
+        while idle:
+            connection = idle.pop()
+            if not connection.reader.at_eof():
+                return connection
+            connection.close()
+
+        address, _, port = key[0].partition(":")
+        if binding is None:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(address, int(port or 80)),
+                                                    self.timeout[0])
+            return _Connection(reader, writer)
+
+        sock = binding.create_socket()
+        try:
+            sock.setblocking(False)
+            await asyncio.wait_for(asyncio.get_running_loop().sock_connect(sock, (address, int(port or 80))),
+                                   self.timeout[0])
+            reader, writer = await asyncio.open_connection(sock=sock)
+        except BaseException:
+            sock.close()
+            raise
+        return _Connection(reader, writer)
+
+    def _release(self, key, connection):
+        idle = self._idle.setdefault(key, [])
+        if len(idle) < self.pool_size:
+            idle.append(connection)
+        else:
+            connection.close()
+
+    async def _exchange(self, connection, method, host, path, body, headers):
+        head = ["{} {} HTTP/1.1".format(method, path), "Host: {}".format(host),
+                "Content-Length: {}".format(len(body))]
+        for name, value in headers.items():
+            head.append("{}: {}".format(name, value))
+        connection.writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await connection.writer.drain()
+
+        status_line = await connection.reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by {}".format(host))
+        version, status_code = status_line.split(None, 2)[0:2]
+
+        response_headers = {}
+        while True:
+            line = await connection.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            content = await self._read_chunked(connection.reader)
+        else:
+            content = await connection.reader.readexactly(int(response_headers.get("content-length", 0)))
+
+        keep_alive = version == b"HTTP/1.1" and response_headers.get("connection", "").lower() != "close"
+        return int(status_code), content, keep_alive
+
+    @staticmethod
+    async def _read_chunked(reader):
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                await reader.readline()
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+
+
+class AsyncHuaweiE303Modem:
+    """ The asyncio counterpart of :class:`~huawei_3g.huawei_e303.HuaweiE303Modem`
+
+    This has the same API as the synchronous class but all methods are coroutines. Modems created with the same
+    :class:`~huawei_3g.huawei_e303_async.AsyncTransport` share its connection pools.
+    """
+
+    def __init__(self, interface, sysfs_path, ip="192.168.8.1", transport=None, parser="fast", bind=None):
+        """ Create instance of the AsyncHuaweiE303Modem class
+
+        :param interface: The name of the network interface associated with this modem
+        :param sysfs_path: The path in /sys/** that represents this USB device
+        :param ip: The address of the HiLink web server, optionally with a port
+        :param transport: The AsyncTransport to use, a new one is created and closed with the modem if this is
+                          omitted
+        :param parser: The response parser to use, "fast" or "xmltodict"
+        :param bind: Bind the connections to the network interface of the modem, see
+                     :class:`~huawei_3g.transport.Binding`
+        """
+        self.interface = interface
+        self.path = sysfs_path
+        self.ip = ip
+        self._own_transport = transport is None
+        self.transport = transport or AsyncTransport()
+        self.token = ""
+        self.parser = get_parser(parser)
+        self.bind = bind
+        # A modem that was just plugged in may not have a network interface yet, see set_interface
+        self.binding = Binding(interface, bind) if bind and interface else None
+
+    async def get_status(self):
+        """ Get the status of the attached modem. See :func:`~huawei_3g.HuaweiE303Modem.get_status` """
+        return HuaweiE303Modem._decode_status(await self._api_get("/monitoring/status", self.parser.status))
+
+    async def get_message_count(self):
+        """ Get the amount of SMS messages on the modem. See :func:`~huawei_3g.HuaweiE303Modem.get_message_count` """
+        return HuaweiE303Modem._decode_message_count(
+            await self._api_get("/sms/sms-count", self.parser.message_count))
+
+    async def get_messages(self, delete=False):
+        """ Get all SMS messages stored on the modem. See :func:`~huawei_3g.HuaweiE303Modem.get_messages`
+
+        :param delete: Delete the messages after this call, messages that couldn't be deleted stay on the modem
+        """
+        if delete:
+            return (await self.drain_messages())[0]
+        count = (await self._api_get("/sms/sms-count", self.parser.message_count)).local_inbox
+        messages = []
+        seen = set()
+        for page_index in range(1, (count + 49) // 50 + 1):
+            page = await self._fetch_page(page_index, 50)
+            for message in page:
+                if message.message_id not in seen:
+                    seen.add(message.message_id)
+                    messages.append(message)
+            if len(page) < 50:
+                break
+        return messages
+
+    async def drain_messages(self, page_size=50, batch_size=HuaweiE303Modem.DELETE_BATCH_SIZE):
+        """ Get all SMS messages from the inbox and delete them. See
+        :func:`~huawei_3g.HuaweiE303Modem.drain_messages`, the messages of a page are deleted while the next page is
+        fetched.
+
+        :param page_size: The amount of messages requested in a single API call
+        :param batch_size: The amount of messages deleted in a single API call
+        :return: a tuple of the list of messages, newest first, and a :class:`~huawei_3g.datastructures.DeleteResult`
+        """
+        count = (await self._api_get("/sms/sms-count", self.parser.message_count)).local_inbox
+        result = DeleteResult()
+        messages = []
+        seen = set()
+        deleting = None
+        try:
+            for page_index in range((count + page_size - 1) // page_size, 0, -1):
+                page = await self._fetch_page(page_index, page_size)
+                if deleting:
+                    result.update(await deleting)
+                    deleting = None
+                drained = [message for message in reversed(page) if message.message_id not in seen]
+                seen.update(message.message_id for message in drained)
+                messages.extend(drained)
+                if drained:
+                    deleting = asyncio.get_running_loop().create_task(
+                        self.delete_messages([message.message_id for message in drained], batch_size))
+        except Exception as error:
+            if not messages:
+                raise
+            result.errors.append(error)
+        finally:
+            if deleting:
+                result.update(await deleting)
+        messages.reverse()
+        return messages, result
+
+    async def delete_message(self, message_id):
+        """ Delete a SMS message from the modem """
+        return await self.delete_messages([message_id])
+
+    async def delete_messages(self, ids, batch_size=HuaweiE303Modem.DELETE_BATCH_SIZE):
+        """ Delete multiple SMS messages from the modem in batches
+
+        See :func:`~huawei_3g.HuaweiE303Modem.delete_messages`, a failing batch doesn't stop the other batches.
+
+        :param ids: The message indexes to delete
+        :param batch_size: The amount of messages deleted in a single API call
+        :return: a :class:`~huawei_3g.datastructures.DeleteResult`
+        """
+        ids = list(ids)
+        result = DeleteResult()
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            try:
+                await self._api_post("/sms/delete-sms", HuaweiE303Modem._delete_request(batch),
+                                     self.parser.acknowledgement)
+            except Exception as error:
+                result.failed.extend(batch)
+                result.errors.append(error)
+            else:
+                result.deleted.extend(batch)
+        return result
+
+    def set_interface(self, interface):
+        """ Change the network interface of the modem, the connections are bound to it if binding is enabled """
+        self.interface = interface
+        if self.bind:
+            self.binding = Binding(interface, self.bind) if interface else None
+
+    async def close(self):
+        """ Close the kept-alive connections to the modem if the modem created its transport """
+        if self._own_transport:
+            await self.transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def __repr__(self):
+        return "<AsyncHuaweiE303Modem {} ({})>".format(self.interface, self.path)
+
+    async def _fetch_page(self, page_index, page_size):
+        return await self._api_post("/sms/sms-list", HuaweiE303Modem._sms_list_request(page_index, page_size),
+                                    self.parser.messages)
+
+    async def _get_token(self):
+        self.token = await self._api_get("/webserver/token", self.parser.token)
+
+    async def _api_get(self, url, parse=None):
+        return await self._api_request("GET", url, b"", parse)
+
+    async def _api_post(self, url, parameters, parse=None):
+        return await self._api_request("POST", url, parameters.encode('UTF-8'), parse)
+
+    async def _api_request(self, method, url, body, parse=None, retry=True):
+        if self.bind and self.binding is None:
+            raise BindError("The modem has no network interface to bind to yet")
+        response = await self.transport.request(method, self.ip, "/api" + url, body, {
+            "__RequestVerificationToken": self.token
+        }, self.binding)
+        try:
+            return HuaweiE303Modem._parse_api_response(response, parse)
+        except TokenError:
+            if not retry:
+                raise
+            await self._get_token()
+            return await self._api_request(method, url, body, parse, retry=False)
+
+
+def load(transport=None, **kwargs):
+    """ Find all supported Huawei modems and return a list of asyncio modem objects
+
+    This is the asyncio version of :func:`~huawei_3g.modem.load`. All modems share a single transport.
+
+    :param transport: The AsyncTransport to use for all modems, a new one is created if this is omitted
+    :param kwargs: Extra arguments for AsyncHuaweiE303Modem, like bind="auto"
+    :return: list of modem objects
+    """
+    transport = transport or AsyncTransport()
+    result = []
+    for modem in huawei_3g.modem.find():
+        if modem['supported'] and modem['class'] == 'huawei_e303':
+            result.append(AsyncHuaweiE303Modem(modem["interface"], modem["path"], transport=transport, **kwargs))
+    return result
+
+
+async def gather_status(modems=None, timeout=5):
+    """ Get the status of many modems concurrently
+
+    This polls all modems at the same time so the total time is close to the time of the slowest modem. A modem that
+    doesn't answer within the timeout or fails has the exception as its value in the result.
+
+    :param modems: A list of AsyncHuaweiE303Modem instances, uses :func:`~huawei_3g.huawei_e303_async.load` if omitted
+    :param timeout: The timeout in seconds for a single modem
+    :return: a dictionary mapping each modem to its status dictionary or an exception
+    """
+    if modems is None:
+        modems = load()
+    results = await asyncio.gather(*[asyncio.wait_for(modem.get_status(), timeout) for modem in modems],
+                                   return_exceptions=True)
+    return dict(zip(modems, results))
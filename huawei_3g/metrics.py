@@ -0,0 +1,180 @@
+import bisect
+import threading
+
+# Upper bounds in seconds, the HiLink web server answers in a few milliseconds up to seconds when it's busy
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    """ Counts observations in buckets with fixed upper bounds
+
+    :param buckets: The sorted upper bounds of the buckets, an extra bucket catches everything above the last bound
+    """
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+        self.count += other.count
+
+    def cumulative(self):
+        """ Get the (upper bound, count) pairs with the counts of all lower buckets included """
+        total = 0
+        result = []
+        for bound, count in zip(list(self.buckets) + [float("inf")], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class _Shard:
+    """ The metrics recorded by a single thread """
+
+    def __init__(self, thread):
+        self.thread = thread
+        self.requests = {}
+        self.errors = {}
+
+
+class Metrics:
+    """ Latency histograms and error counters per API endpoint of a single modem
+
+    Every thread records into its own shard, so recording a request doesn't take a lock. The shards are only merged
+    when the metrics are read with :func:`~huawei_3g.metrics.Metrics.snapshot`, or when a new thread starts recording
+    and the shards of finished threads are folded together, so there is a shard per running thread at most.
+
+    :param buckets: The upper bounds of the latency histogram buckets in seconds
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._local = threading.local()
+        self._shards = []
+        self._retired = _Shard(None)
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, transport, parse):
+        """ Record a request
+
+        :param endpoint: The API url
+        :param transport: The time in seconds between sending the request and receiving the response
+        :param parse: The time in seconds spent parsing the response
+        """
+        shard = self._shard()
+        histograms = shard.requests.get(endpoint)
+        if histograms is None:
+            histograms = shard.requests[endpoint] = (Histogram(self.buckets), Histogram(self.buckets))
+        histograms[0].observe(transport)
+        histograms[1].observe(parse)
+
+    def error(self, endpoint, code):
+        """ Count an error response, code is a HiLink error code or "connection" for transport failures """
+        errors = self._shard().errors
+        key = (endpoint, code)
+        errors[key] = errors.get(key, 0) + 1
+
+    def snapshot(self):
+        """ Merge the metrics of all threads
+
+        :return: a tuple of a dictionary mapping endpoints to (transport, parse) histograms and a dictionary mapping
+                 (endpoint, code) to error counts
+        """
+        requests = {}
+        errors = {}
+        with self._lock:
+            self._retire()
+            for shard in [self._retired] + self._shards:
+                self._merge_into(requests, errors, dict(shard.requests), dict(shard.errors))
+        return requests, errors
+
+    def _retire(self):
+        # Threads that have finished won't record anything anymore, fold them in so their shards can be freed
+        for shard in [shard for shard in self._shards if not shard.thread.is_alive()]:
+            self._merge_into(self._retired.requests, self._retired.errors, shard.requests, shard.errors)
+            self._shards.remove(shard)
+
+    def _merge_into(self, requests, errors, shard_requests, shard_errors):
+        for endpoint, histograms in shard_requests.items():
+            if endpoint not in requests:
+                requests[endpoint] = (Histogram(self.buckets), Histogram(self.buckets))
+            requests[endpoint][0].merge(histograms[0])
+            requests[endpoint][1].merge(histograms[1])
+        for key, count in shard_errors.items():
+            errors[key] = errors.get(key, 0) + count
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._lock:
+                # Short-lived threads, like the thread pools of a single call, would otherwise add a shard each
+                self._retire()
+                self._shards.append(shard)
+            return shard
+
+
+def _labels(**labels):
+    return ",".join("{}=\"{}\"".format(key, str(value).replace("\\", "\\\\").replace("\"", "\\\"")
+                                       .replace("\n", "\\n")) for key, value in sorted(labels.items()))
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+def export(modems):
+    """ Export the metrics of modems in the Prometheus text exposition format
+
+    :param modems: A list of :class:`~huawei_3g.huawei_e303.HuaweiE303Modem` instances
+    :return: the metrics as a string
+    """
+    histograms = {
+        "transport": ["# HELP huawei_3g_request_transport_seconds Time between sending a request and receiving the "
+                      "response",
+                      "# TYPE huawei_3g_request_transport_seconds histogram"],
+        "parse": ["# HELP huawei_3g_request_parse_seconds Time spent parsing a response",
+                  "# TYPE huawei_3g_request_parse_seconds histogram"]
+    }
+    errors = ["# HELP huawei_3g_errors_total Error responses per HiLink error code",
+              "# TYPE huawei_3g_errors_total counter"]
+    refreshes = ["# HELP huawei_3g_token_refreshes_total Fetched __RequestVerificationTokens",
+                 "# TYPE huawei_3g_token_refreshes_total counter"]
+    health = ["# HELP huawei_3g_health_score Success rate and speed of the modem between 0 and 1",
+              "# TYPE huawei_3g_health_score gauge"]
+    circuits = ["# HELP huawei_3g_circuit_open 1 while requests to the modem fail right away",
+                "# TYPE huawei_3g_circuit_open gauge"]
+
+    for modem in modems:
+        requests, error_counts = modem.metrics.snapshot()
+        for endpoint in sorted(requests):
+            for kind, histogram in zip(("transport", "parse"), requests[endpoint]):
+                name = "huawei_3g_request_{}_seconds".format(kind)
+                for bound, count in histogram.cumulative():
+                    histograms[kind].append("{}_bucket{{{}}} {}".format(
+                        name, _labels(modem=modem.path, endpoint=endpoint, le=_format_bound(bound)), count))
+                labels = _labels(modem=modem.path, endpoint=endpoint)
+                histograms[kind].append("{}_sum{{{}}} {!r}".format(name, labels, histogram.sum))
+                histograms[kind].append("{}_count{{{}}} {}".format(name, labels, histogram.count))
+        for (endpoint, code), count in sorted(error_counts.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+            errors.append("huawei_3g_errors_total{{{}}} {}".format(
+                _labels(modem=modem.path, endpoint=endpoint, code=code), count))
+        refreshes.append("huawei_3g_token_refreshes_total{{{}}} {}".format(
+            _labels(modem=modem.path), modem.tokens.refresh_count))
+        health.append("huawei_3g_health_score{{{}}} {!r}".format(_labels(modem=modem.path), modem.health.score))
+        circuits.append("huawei_3g_circuit_open{{{}}} {}".format(_labels(modem=modem.path),
+                                                                0 if modem.health.available else 1))
+
+    return "\n".join(histograms["transport"] + histograms["parse"] + errors + refreshes + health + circuits) + "\n"
@@ -2,12 +2,12 @@ import glob
 import os.path
 
 
-def find():
+def find(sysfs_root="/sys"):
     """
     Get a list of Huawei dongles attached to this computer
 
     This reads files in sysfs (/sys/**) to determine which usb devices are attached and then filters on vendor
-    id and product id.
+    id and product id. The result is cached until the devices in sysfs change, see :func:`~huawei_3g.modem.refresh`.
 
     This returns a list of dictionaries. Each dictionary contains information about a single attached modem.
 
@@ -32,71 +32,195 @@ def find():
 
     class
       The class in this Python module that implements the interface with this modem.
+
+    :param sysfs_root: The path sysfs is mounted on
+    """
+    return _get_scanner(sysfs_root).find()
+
+
+def find_interface(sysfs_device_path, sysfs_root="/sys"):
+    """ Find the network interface associated with a sysfs device path
+
+    :param sysfs_device_path: The sysfs path to a plugged in modem like /sys/devices/pci0000:00/0000:00:1c.3/0000:02:00.0
+    :param sysfs_root: The path sysfs is mounted on
+    :return: the network interface. Ex: eth0
+    """
+    return _get_scanner(sysfs_root).find_interface(sysfs_device_path)
+
+
+def refresh():
+    """ Forget the cached results of :func:`~huawei_3g.modem.find` so the next call scans sysfs again """
+    for scanner in _scanners.values():
+        scanner.refresh()
+
+
+class Scanner:
+    """ Finds Huawei dongles in sysfs and caches the result
+
+    A scan reads the vendor id of every USB device and resolves the device of every network interface once, building
+    an index from device path to network interface. The result is cached until the USB device or network interface
+    directories in sysfs change or :func:`~huawei_3g.modem.Scanner.refresh` is called.
+
+    :param sysfs_root: The path sysfs is mounted on, this can point to a fake sysfs tree for testing
     """
     huawei_vendor = "12d1"
-    result = []
     supported_dongles = {
         "14dc": {
             "name": "Huawei E303",
             "class": "huawei_e303"
         }
     }
-    for device in glob.glob("/sys/bus/usb/devices/*/idVendor"):
-        with open(device) as vendor_file:
-            vendor_id = vendor_file.read().strip()
-        if vendor_id == huawei_vendor:
+
+    def __init__(self, sysfs_root="/sys"):
+        self.root = sysfs_root
+        self.scans = 0
+        self._key = None
+        self._result = None
+        self._index = None
+
+    def find(self):
+        """ Get a list of Huawei dongles, see :func:`~huawei_3g.modem.find` """
+        self._update()
+        return [dict(modem) for modem in self._result]
+
+    def find_interface(self, sysfs_device_path):
+        """ Find the network interface of a sysfs device, see :func:`~huawei_3g.modem.find_interface` """
+        self._update()
+        return self._index.get(os.path.realpath(sysfs_device_path))
+
+    def refresh(self):
+        """ Forget the cached scan """
+        self._key = None
+
+    def _update(self):
+        key = self._cache_key()
+        if key is None or key != self._key:
+            self._index = self._interface_index()
+            self._result = self._scan()
+            self._key = key
+            self.scans += 1
+
+    def _cache_key(self):
+        key = []
+        for directory in ("bus/usb/devices", "class/net"):
+            path = os.path.join(self.root, directory)
+            try:
+                # The directory listing is part of the key because sysfs doesn't always update directory mtimes
+                key.append((os.stat(path).st_mtime, tuple(sorted(os.listdir(path)))))
+            except OSError:
+                return None
+        return tuple(key)
+
+    def _interface_index(self):
+        # Map the device of every network interface and all its parent devices to the interface name, so the USB
+        # device of a dongle can be looked up directly
+        index = {}
+        for interface in glob.glob(os.path.join(self.root, "class/net/*")):
+            name = os.path.basename(interface)
+            path = os.path.realpath(os.path.join(interface, "device"))
+            while path not in index and path != os.path.dirname(path):
+                index[path] = name
+                path = os.path.dirname(path)
+        return index
+
+    def _scan(self):
+        result = []
+        for device in glob.glob(os.path.join(self.root, "bus/usb/devices/*/idVendor")):
             path_part = device.split("/")
             sysfs_path = "/".join(path_part[0:-1])
-
-            with open(os.path.join(sysfs_path, "idProduct")) as product_file:
-                product_id = product_file.read().strip()
-
-            if product_id in supported_dongles:
+            try:
+                with open(device) as vendor_file:
+                    vendor_id = vendor_file.read().strip()
+                if vendor_id != self.huawei_vendor:
+                    continue
+                with open(os.path.join(sysfs_path, "idProduct")) as product_file:
+                    product_id = product_file.read().strip()
+            except OSError:
+                # The device was unplugged during the scan
+                continue
+
+            interface = self._index.get(os.path.realpath(sysfs_path))
+            if product_id in self.supported_dongles:
                 result.append({
                     "path": sysfs_path,
                     "supported": True,
                     "productId": product_id,
-                    "name": supported_dongles[product_id]["name"],
-                    "class": supported_dongles[product_id]["class"],
-                    "interface": find_interface(sysfs_path)
+                    "name": self.supported_dongles[product_id]["name"],
+                    "class": self.supported_dongles[product_id]["class"],
+                    "interface": interface
                 })
             else:
                 result.append({
                     "path": sysfs_path,
                     "supported": False,
                     "productId": product_id,
-                    "interface": find_interface(sysfs_path)
+                    "interface": interface
                 })
-    return result
+        return result
 
 
-def find_interface(sysfs_device_path):
-    """ Find the network interface associated with a sysfs device path
+_scanners = {}
 
-    :param sysfs_device_path: The sysfs path to a plugged in modem like /sys/devices/pci0000:00/0000:00:1c.3/0000:02:00.0
-    :return: the network interface. Ex: eth0
-    """
-    sysfs_device = os.path.realpath(sysfs_device_path)
-    for interface in glob.glob("/sys/class/net/*"):
-        device_symlink = os.path.join(interface, "device")
-        device_endpoint = os.path.realpath(device_symlink)
-        if sysfs_device in device_endpoint:
-            return os.path.basename(interface)
-    return None
 
+def _get_scanner(sysfs_root):
+    if sysfs_root not in _scanners:
+        _scanners[sysfs_root] = Scanner(sysfs_root)
+    return _scanners[sysfs_root]
 
-def load():
+
+def load(sysfs_root="/sys", **kwargs):
     """ Find all supported Huawei modem and return a list of modem objects
 
     This uses :func:`~huawei_3g.find` to search for all the modems on the computer and creates the class instances
     for all modems and returns that as a list
+    :param sysfs_root: The path sysfs is mounted on
+    :param kwargs: Extra arguments for the constructor of the modem classes, like bind="auto"
     :return: list of modem classes
     """
     result = []
-    modems = find()
+    modems = find(sysfs_root)
     for modem in modems:
-        if modem['supported']:
-            if modem['class'] == 'huawei_e303':
-                import huawei_3g.huawei_e303
-                result.append(huawei_3g.huawei_e303.HuaweiE303Modem(modem["interface"], modem["path"]))
+        instance = create(modem, **kwargs)
+        if instance:
+            result.append(instance)
     return result
+
+
+def create(modem, **kwargs):
+    """ Create the modem object for a dictionary returned by :func:`~huawei_3g.modem.find`
+
+    :param modem: A dictionary describing a modem
+    :param kwargs: Extra arguments for the constructor of the modem class
+    :return: the modem object or None if the modem isn't supported
+    """
+    if modem['supported']:
+        if modem['class'] == 'huawei_e303':
+            import huawei_3g.huawei_e303
+            return huawei_3g.huawei_e303.HuaweiE303Modem(modem["interface"], modem["path"], **kwargs)
+    return None
+
+
+def get_snapshots(modems, fields=None, workers=16):
+    """ Get a snapshot of many modems at the same time, see :func:`~huawei_3g.HuaweiE303Modem.get_snapshot`
+
+    :param modems: A list of modem objects, see :func:`~huawei_3g.modem.load`
+    :param fields: The fields to get, defaults to all fields
+    :param workers: The amount of modems queried at the same time
+    :return: a dictionary mapping the sysfs path of every modem to its
+             :class:`~huawei_3g.datastructures.ModemSnapshot` or to the exception raised while getting it
+    """
+    modems = list(modems)
+    if not modems:
+        return {}
+
+    def snapshot(modem):
+        try:
+            if fields is None:
+                return modem.get_snapshot()
+            return modem.get_snapshot(fields)
+        except Exception as error:
+            return error
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(min(workers, len(modems))) as executor:
+        return dict(zip([modem.path for modem in modems], executor.map(snapshot, modems)))
@@ -0,0 +1,280 @@
+import sqlite3
+import threading
+import time
+from huawei_3g.huawei_e303 import BusyError
+from huawei_3g.ratelimit import TokenBucket
+
+QUEUED = "queued"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+UNKNOWN = "unknown"
+
+
+class OutboundQueue:
+    """ A durable queue of outgoing SMS messages that is sent through multiple modems
+
+    Messages are stored in a SQLite database before they are sent, so they survive a restart. Every modem gets its
+    own worker thread that takes the next message from the queue as soon as the modem is ready for it, so faster
+    modems send more messages and the throughput grows with the amount of modems.
+
+    A worker doesn't take messages while:
+
+    - its rate limit is reached, the limit is ``rate`` messages per second with bursts of ``burst`` messages
+    - the signal of its modem is below ``min_signal`` percent or the modem has no service
+    - it's backing off because the modem answered "Busy", the backoff doubles with every Busy answer
+
+    After a message is accepted by the modem the worker polls the send status until the modem delivered it to the
+    network or gave up, "Busy" answers to these polls are ignored. Failed messages are retried ``max_attempts``
+    times, possibly on another modem. When the send status can't be read or the modem is still sending after
+    ``send_timeout`` seconds, the message gets the status "unknown" and isn't sent again, the modem may still
+    deliver it.
+
+    Messages that were being sent when the process stopped are queued again when the queue is opened, so a message
+    is sent at least once and in rare cases twice.
+
+    :param modems: A list of :class:`~huawei_3g.huawei_e303.HuaweiE303Modem` instances, see
+                   :func:`~huawei_3g.modem.load`
+    :param database: Path to the SQLite database file
+    :param rate: The maximum amount of messages per second per modem
+    :param burst: The amount of messages a modem can send at once after being idle
+    :param min_signal: The minimum signal strength in percent for a modem to send messages
+    :param max_attempts: The amount of times sending a message is tried before it's marked as failed
+    :param retry_delay: The time in seconds before a failed message is retried
+    :param poll_interval: The interval in seconds the send status and the signal strength are checked
+    :param send_timeout: The maximum time in seconds a modem may take to deliver a message
+    :param busy_backoff: The time in seconds a worker waits after the first "Busy" answer, up to 30 seconds
+    """
+
+    def __init__(self, modems, database, rate=0.5, burst=1, min_signal=20, max_attempts=3, retry_delay=30,
+                 poll_interval=1, send_timeout=60, busy_backoff=0.5):
+        self.rate = rate
+        self.burst = burst
+        self.min_signal = min_signal
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self.send_timeout = send_timeout
+        self.busy_backoff = busy_backoff
+        self.connection = sqlite3.connect(database, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS outbound ("
+                                "id INTEGER PRIMARY KEY AUTOINCREMENT, phone TEXT, message TEXT, status TEXT, "
+                                "attempts INTEGER, modem TEXT, error TEXT, created REAL, updated REAL, "
+                                "not_before REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS outbound_status ON outbound (status, not_before, id)")
+        with self.connection:
+            self.connection.execute("UPDATE outbound SET status = ? WHERE status = ?", (QUEUED, SENDING))
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._workers = {}
+        self._modems = list(modems)
+
+    def enqueue(self, phone, message):
+        """ Add a message to the queue
+
+        :return: the id of the message, see :func:`~huawei_3g.outbound.OutboundQueue.status`
+        """
+        return self.enqueue_many([(phone, message)])[0]
+
+    def enqueue_many(self, messages):
+        """ Add a list of (phone, message) tuples to the queue in a single transaction
+
+        :return: the list of message ids
+        """
+        now = time.time()
+        ids = []
+        with self._wakeup:
+            with self.connection:
+                for phone, message in messages:
+                    cursor = self.connection.execute(
+                        "INSERT INTO outbound (phone, message, status, attempts, created, updated, not_before) "
+                        "VALUES (?, ?, ?, 0, ?, ?, 0)", (phone, message, QUEUED, now, now))
+                    ids.append(cursor.lastrowid)
+            self._wakeup.notify_all()
+        return ids
+
+    def status(self, message_id):
+        """ Get the delivery status of a message
+
+        This returns a dictionary with the keys status ("queued", "sending", "sent", "failed" or "unknown"), attempts,
+        modem (the sysfs path of the modem that sent or last tried to send the message) and error, or None if the
+        message doesn't exist.
+        """
+        with self._lock:
+            row = self.connection.execute("SELECT status, attempts, modem, error FROM outbound WHERE id = ?",
+                                          (message_id,)).fetchone()
+        if row is None:
+            return None
+        return {'status': row[0], 'attempts': row[1], 'modem': row[2], 'error': row[3]}
+
+    def counts(self):
+        """ Get the amount of messages per status as a dictionary """
+        with self._lock:
+            return dict(self.connection.execute("SELECT status, COUNT(*) FROM outbound GROUP BY status"))
+
+    def start(self):
+        """ Start a worker for every modem """
+        self._stop.clear()
+        for modem in self._modems:
+            self.add_modem(modem)
+        return self
+
+    def add_modem(self, modem):
+        """ Start sending messages through a modem, for example from :class:`~huawei_3g.registry.ModemRegistry` """
+        with self._lock:
+            if modem.path in self._workers:
+                return
+            if modem not in self._modems:
+                self._modems.append(modem)
+            stop = threading.Event()
+            thread = threading.Thread(target=self._work, args=(modem, stop), name="huawei-3g-outbound")
+            thread.daemon = True
+            self._workers[modem.path] = (thread, stop)
+        thread.start()
+
+    def remove_modem(self, modem):
+        """ Stop sending messages through a modem, the message it is sending is finished first """
+        with self._lock:
+            if modem in self._modems:
+                self._modems.remove(modem)
+        self._stop_worker(modem)
+
+    def join(self, timeout=None):
+        """ Wait until all messages are sent or failed
+
+        :return: True if the queue is empty, False on timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            counts = self.counts()
+            if not counts.get(QUEUED) and not counts.get(SENDING):
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+
+    def stop(self):
+        """ Stop all workers after they finished the message they are sending """
+        self._stop.set()
+        for modem in list(self._modems):
+            self._stop_worker(modem)
+
+    def close(self):
+        self.stop()
+        self.connection.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _stop_worker(self, modem):
+        with self._wakeup:
+            worker = self._workers.pop(modem.path, None)
+            if worker is None:
+                return
+            worker[1].set()
+            self._wakeup.notify_all()
+        if worker[0] is not threading.current_thread():
+            worker[0].join()
+
+    def _work(self, modem, stop):
+        limit = TokenBucket(self.rate, self.burst)
+        backoff = 0
+        while not stop.is_set() and not self._stop.is_set():
+            if not self._healthy(modem):
+                stop.wait(self.poll_interval)
+                continue
+            wait = limit.take()
+            if wait:
+                stop.wait(wait)
+                continue
+
+            claimed = self._claim(modem, stop)
+            if claimed is None:
+                # Nothing to send, give back the token so the next message can go out right away
+                limit.refund()
+                continue
+            message_id, phone, message, attempts = claimed
+
+            try:
+                modem.send_sms(phone, message)
+            except BusyError:
+                # The modem is still sending, back off and let another modem pick up the message
+                backoff = min(max(backoff * 2, self.busy_backoff), 30)
+                self._release(message_id, QUEUED, attempts, "Busy", 0)
+                stop.wait(backoff)
+                continue
+            except Exception as exception:
+                self._retry(message_id, attempts, str(exception) or exception.__class__.__name__)
+                continue
+            backoff = 0
+
+            # The modem accepted the message, only a message the modem reports as failed is sent again
+            try:
+                delivered = self._wait_delivered(modem, phone)
+            except Exception as exception:
+                self._release(message_id, UNKNOWN, attempts + 1, str(exception) or exception.__class__.__name__, 0)
+                continue
+            if delivered is None:
+                self._release(message_id, UNKNOWN, attempts + 1, "Timeout", 0)
+            elif delivered:
+                self._release(message_id, SENT, attempts + 1, None, 0)
+            else:
+                self._retry(message_id, attempts, "Not delivered")
+
+    def _retry(self, message_id, attempts, error):
+        if attempts + 1 >= self.max_attempts:
+            self._release(message_id, FAILED, attempts + 1, error, 0)
+        else:
+            self._release(message_id, QUEUED, attempts + 1, error, time.time() + self.retry_delay)
+
+    def _healthy(self, modem):
+        try:
+            status = modem.get_status()
+        except Exception:
+            return False
+        return status['signal'] >= self.min_signal and status['network_type'] != "No service"
+
+    def _claim(self, modem, stop):
+        with self._wakeup:
+            now = time.time()
+            row = self.connection.execute(
+                "SELECT id, phone, message, attempts, not_before FROM outbound WHERE status = ? "
+                "ORDER BY not_before > ?, not_before, id LIMIT 1", (QUEUED, now)).fetchone()
+            if row is None or row[4] > now:
+                wait = self.poll_interval if row is None else min(self.poll_interval, row[4] - now)
+                if not stop.is_set():
+                    self._wakeup.wait(wait)
+                return None
+            with self.connection:
+                self.connection.execute("UPDATE outbound SET status = ?, modem = ?, updated = ? WHERE id = ?",
+                                        (SENDING, modem.path, now, row[0]))
+            return row[:4]
+
+    def _release(self, message_id, status, attempts, error, not_before):
+        with self._wakeup:
+            with self.connection:
+                self.connection.execute(
+                    "UPDATE outbound SET status = ?, attempts = ?, error = ?, updated = ?, not_before = ? "
+                    "WHERE id = ?", (status, attempts, error, time.time(), not_before, message_id))
+            if status == QUEUED:
+                self._wakeup.notify_all()
+
+    def _wait_delivered(self, modem, phone):
+        """ Poll the send status, True when the message was delivered, False when it failed and None on timeout """
+        deadline = time.monotonic() + self.send_timeout
+        while True:
+            try:
+                status = modem.get_send_status()
+            except BusyError:
+                # Try again until the timeout
+                status = {'sending': phone}
+            if status['sending'] is None:
+                return phone not in status['failed']
+            if time.monotonic() >= deadline:
+                return None
+            # Not the stop event, the message is finished first and a stopped worker would poll without a pause
+            time.sleep(self.poll_interval)
@@ -0,0 +1,269 @@
+import xml.etree.ElementTree as ElementTree
+from huawei_3g.datastructures import SMSMessage
+
+
+class ErrorRecord:
+    """ An <error> response of the HiLink API """
+    __slots__ = ('code',)
+
+    def __init__(self, code):
+        self.code = code
+
+
+class StatusRecord:
+    """ The fields of /monitoring/status used by this module """
+    __slots__ = ('connection_status', 'signal_icon', 'network_type')
+
+    def __init__(self, connection_status=0, signal_icon=0, network_type=0):
+        self.connection_status = connection_status
+        self.signal_icon = signal_icon
+        self.network_type = network_type
+
+
+class MessageCountRecord:
+    """ The message counters of /sms/sms-count """
+    __slots__ = ('local_unread', 'local_inbox', 'local_outbox', 'local_draft')
+
+    def __init__(self, local_unread=0, local_inbox=0, local_outbox=0, local_draft=0):
+        self.local_unread = local_unread
+        self.local_inbox = local_inbox
+        self.local_outbox = local_outbox
+        self.local_draft = local_draft
+
+
+class TrafficRecord:
+    """ The counters of /monitoring/traffic-statistics, in bytes, bytes per second and seconds """
+    __slots__ = ('connect_time', 'upload', 'download', 'upload_rate', 'download_rate', 'total_upload',
+                 'total_download', 'total_connect_time')
+
+    def __init__(self, connect_time=0, upload=0, download=0, upload_rate=0, download_rate=0, total_upload=0,
+                 total_download=0, total_connect_time=0):
+        self.connect_time = connect_time
+        self.upload = upload
+        self.download = download
+        self.upload_rate = upload_rate
+        self.download_rate = download_rate
+        self.total_upload = total_upload
+        self.total_download = total_download
+        self.total_connect_time = total_connect_time
+
+
+class MonthStatisticsRecord:
+    """ The counters of /monitoring/month_statistics """
+    __slots__ = ('download', 'upload', 'duration', 'last_clear')
+
+    def __init__(self, download=0, upload=0, duration=0, last_clear=None):
+        self.download = download
+        self.upload = upload
+        self.duration = duration
+        self.last_clear = last_clear
+
+
+def _int(text):
+    # Some firmware versions leave fields empty instead of sending 0
+    if text:
+        return int(text)
+    return 0
+
+
+def _message(fields):
+    return SMSMessage(fields.get('Index'), fields.get('Content') or '', fields.get('Phone'), fields.get('Date'),
+                      fields.get('Smstat') == '1', _int(fields.get('SmsType')), _int(fields.get('Priority')),
+                      _int(fields.get('SaveType')), fields.get('Sca') or '')
+
+
+_status_fields = {
+    'ConnectionStatus': 'connection_status',
+    'SignalIcon': 'signal_icon',
+    'CurrentNetworkType': 'network_type'
+}
+
+_count_fields = {
+    'LocalUnread': 'local_unread',
+    'LocalInbox': 'local_inbox',
+    'LocalOutbox': 'local_outbox',
+    'LocalDraft': 'local_draft'
+}
+
+
+_traffic_fields = {
+    'CurrentConnectTime': 'connect_time',
+    'CurrentUpload': 'upload',
+    'CurrentDownload': 'download',
+    'CurrentUploadRate': 'upload_rate',
+    'CurrentDownloadRate': 'download_rate',
+    'TotalUpload': 'total_upload',
+    'TotalDownload': 'total_download',
+    'TotalConnectTime': 'total_connect_time'
+}
+
+_month_fields = {
+    'CurrentMonthDownload': 'download',
+    'CurrentMonthUpload': 'upload',
+    'MonthDuration': 'duration',
+    'MonthLastClearTime': 'last_clear'
+}
+
+
+# The amount of bytes of a payload fed to the incremental parser at once
+CHUNK_SIZE = 512
+
+
+class FastParser:
+    """ Parses HiLink responses straight into typed records
+
+    This uses the incremental ElementTree parser and feeds it the payload in chunks of :data:`CHUNK_SIZE` bytes. It
+    stops as soon as all fields of a record are found, leaving the rest of the payload unparsed, and discards elements
+    once they have been converted so only a single message is kept as a tree at a time.
+    """
+    name = "fast"
+
+    def status(self, payload):
+        """ Parse a /monitoring/status payload into a :class:`~huawei_3g.parsers.StatusRecord` """
+        return self._fields(payload, StatusRecord(), _status_fields)
+
+    def message_count(self, payload):
+        """ Parse a /sms/sms-count payload into a :class:`~huawei_3g.parsers.MessageCountRecord` """
+        return self._fields(payload, MessageCountRecord(), _count_fields)
+
+    def traffic(self, payload):
+        """ Parse a /monitoring/traffic-statistics payload into a :class:`~huawei_3g.parsers.TrafficRecord` """
+        return self._fields(payload, TrafficRecord(), _traffic_fields)
+
+    def month_statistics(self, payload):
+        """ Parse a /monitoring/month_statistics payload into a :class:`~huawei_3g.parsers.MonthStatisticsRecord` """
+        return self._fields(payload, MonthStatisticsRecord(), _month_fields, texts=('MonthLastClearTime',))
+
+    def messages(self, payload):
+        """ Parse a /sms/sms-list payload into a list of :class:`~huawei_3g.datastructures.SMSMessage` """
+        events = self._events(payload)
+        error = self._error(events)
+        if error:
+            return error
+        result = []
+        for event, element in events:
+            if event == 'end' and element.tag == 'Message':
+                result.append(_message(dict((field.tag, field.text) for field in element)))
+                element.clear()
+        return result
+
+    def token(self, payload):
+        """ Parse a /webserver/token payload into the token string """
+        events = self._events(payload)
+        error = self._error(events)
+        if error:
+            return error
+        for event, element in events:
+            if event == 'end' and element.tag == 'token':
+                return element.text or ''
+        return ''
+
+    def acknowledgement(self, payload):
+        """ Parse the <response>OK</response> answer of an action, returns True """
+        return self._error(self._events(payload)) or True
+
+    def _fields(self, payload, record, fields, texts=()):
+        events = self._events(payload)
+        error = self._error(events)
+        if error:
+            return error
+        remaining = len(fields)
+        for event, element in events:
+            if event == 'end' and element.tag in fields:
+                setattr(record, fields[element.tag], element.text if element.tag in texts else _int(element.text))
+                remaining -= 1
+                if remaining == 0:
+                    break
+        return record
+
+    @staticmethod
+    def _events(payload):
+        # Feed the payload a chunk at a time so a caller that stops early leaves the rest of it unparsed
+        parser = ElementTree.XMLPullParser(('start', 'end'))
+        view = memoryview(payload)
+        for start in range(0, len(payload), CHUNK_SIZE):
+            parser.feed(view[start:start + CHUNK_SIZE])
+            for event in parser.read_events():
+                yield event
+        parser.close()
+        for event in parser.read_events():
+            yield event
+
+    @staticmethod
+    def _error(events):
+        # The first event is always the start of the root element
+        event, root = next(events)
+        if root.tag != 'error':
+            return None
+        for event, element in events:
+            if event == 'end' and element.tag == 'code':
+                return ErrorRecord(element.text)
+        return ErrorRecord(None)
+
+
+class XmltodictParser:
+    """ Produces the same records as :class:`~huawei_3g.parsers.FastParser` but parses with xmltodict """
+    name = "xmltodict"
+
+    def status(self, payload):
+        return self._fields(payload, StatusRecord(), _status_fields)
+
+    def message_count(self, payload):
+        return self._fields(payload, MessageCountRecord(), _count_fields)
+
+    def traffic(self, payload):
+        return self._fields(payload, TrafficRecord(), _traffic_fields)
+
+    def month_statistics(self, payload):
+        return self._fields(payload, MonthStatisticsRecord(), _month_fields, texts=('MonthLastClearTime',))
+
+    def messages(self, payload):
+        parsed = self._parse(payload)
+        if isinstance(parsed, ErrorRecord):
+            return parsed
+        if parsed['Count'] == '0':
+            return []
+        message_list = parsed['Messages']['Message']
+        if not isinstance(message_list, list):
+            message_list = [message_list]
+
+        return [_message(message) for message in message_list]
+
+    def token(self, payload):
+        parsed = self._parse(payload)
+        if isinstance(parsed, ErrorRecord):
+            return parsed
+        return parsed.get('token') or ''
+
+    def acknowledgement(self, payload):
+        parsed = self._parse(payload)
+        if isinstance(parsed, ErrorRecord):
+            return parsed
+        return True
+
+    def _fields(self, payload, record, fields, texts=()):
+        parsed = self._parse(payload)
+        if isinstance(parsed, ErrorRecord):
+            return parsed
+        for tag, attribute in fields.items():
+            setattr(record, attribute, parsed.get(tag) if tag in texts else _int(parsed.get(tag)))
+        return record
+
+    @staticmethod
+    def _parse(payload):
+        import xmltodict
+        parsed = xmltodict.parse(payload)
+        if 'error' in parsed:
+            return ErrorRecord(parsed['error']['code'])
+        return parsed['response']
+
+
+parsers = {
+    FastParser.name: FastParser,
+    XmltodictParser.name: XmltodictParser
+}
+
+
+def get_parser(name):
+    """ Get a parser instance by name, either "fast" or "xmltodict" """
+    return parsers[name]()
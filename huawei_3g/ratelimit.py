@@ -0,0 +1,59 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """ Limits the rate of an action while allowing short bursts
+
+    The bucket holds up to ``burst`` tokens and is refilled with ``rate`` tokens per second. Every action takes a
+    token.
+
+    :param rate: The sustained amount of actions per second
+    :param burst: The amount of actions that can happen at once after an idle period
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, amount=1):
+        """ Take tokens if they are available
+
+        :param amount: The amount of tokens to take, at most ``burst``
+        :return: 0 if the tokens were taken, otherwise the time in seconds until enough tokens are available
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0
+            return (amount - self._tokens) / self.rate
+
+    def refund(self, amount=1):
+        """ Give back tokens that were taken but not used """
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + amount)
+
+    def acquire(self, timeout=None, amount=1):
+        """ Wait until tokens are available and take them
+
+        :param timeout: The maximum time in seconds to wait
+        :param amount: The amount of tokens to take, at most ``burst``
+        :return: True if the tokens were taken, False on timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.take(amount)
+            if not wait:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
@@ -0,0 +1,215 @@
+import select
+import socket
+import threading
+import huawei_3g.modem
+
+NETLINK_KOBJECT_UEVENT = 15
+
+
+def parse_uevent(data):
+    """ Parse a kernel uevent as received from the netlink socket into a dictionary
+
+    A uevent looks like ``add@/devices/...\\0ACTION=add\\0DEVPATH=/devices/...\\0SUBSYSTEM=usb\\0...``
+    """
+    event = {}
+    for field in data.split(b"\0")[1:]:
+        key, _, value = field.decode("utf-8", "replace").partition("=")
+        if key:
+            event[key] = value
+    return event
+
+
+class ModemRegistry:
+    """ Keeps track of the attached modems for a long running process
+
+    The registry scans sysfs once when it is started and then only rescans when the kernel reports that a USB device
+    or network interface was added or removed. Modem objects are kept for as long as the dongle is plugged in, so
+    they keep their token and kept-alive connections.
+
+    Hotplug events are read from the kernel uevent netlink socket. If that socket can't be opened, for example in a
+    container, the registry falls back to polling sysfs, which is cheap because :class:`~huawei_3g.modem.Scanner`
+    only does a full scan when the sysfs directories changed.
+
+    Errors while handling an event, also exceptions raised by the callbacks, don't stop the registry. The last one
+    is kept in :attr:`last_error` and sysfs is scanned again shortly after. A modem that can't be created, for
+    example because ``bind`` is set and its interface has no address yet, is tried again at every scan.
+
+    :param sysfs_root: The path sysfs is mounted on
+    :param on_add: Called with the modem object when a modem is plugged in
+    :param on_remove: Called with the modem object when a modem is removed, after it has been closed
+    :param poll_interval: The interval in seconds sysfs is checked when polling
+    :param kwargs: Extra arguments for the constructor of the modem classes
+    """
+
+    def __init__(self, sysfs_root="/sys", on_add=None, on_remove=None, poll_interval=2, **kwargs):
+        self.scanner = huawei_3g.modem.Scanner(sysfs_root)
+        self.on_add = on_add
+        self.on_remove = on_remove
+        self.poll_interval = poll_interval
+        self.method = None
+        self.last_error = None
+        self._modem_arguments = kwargs
+        self._incomplete = False
+        self._modems = {}
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._socket = None
+        self._thread = None
+
+    @property
+    def modems(self):
+        """ The list of attached modem objects """
+        with self._lock:
+            return list(self._modems.values())
+
+    def get(self, path):
+        """ Get the modem object for a sysfs path or None """
+        with self._lock:
+            return self._modems.get(path)
+
+    def start(self, method="auto"):
+        """ Scan for modems and start listening for hotplug events
+
+        :param method: "netlink" to use kernel uevents, "poll" to poll sysfs or "auto" to use netlink if possible
+        """
+        self.rescan()
+        if method in ("auto", "netlink"):
+            try:
+                self._socket = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+                self._socket.bind((0, 1))
+                method = "netlink"
+            except (OSError, AttributeError):
+                if method == "netlink":
+                    raise
+                self._socket = None
+                method = "poll"
+
+        self.method = method
+        self._stop.clear()
+        target = self._listen if method == "netlink" else self._poll
+        self._thread = threading.Thread(target=target, name="huawei-3g-registry")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """ Stop listening for hotplug events """
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if self._socket:
+            self._socket.close()
+            self._socket = None
+
+    def close(self):
+        """ Stop listening and close all modem objects """
+        self.stop()
+        with self._lock:
+            for modem in self._modems.values():
+                modem.close()
+            self._modems = {}
+
+    def handle_uevent(self, event):
+        """ Apply a hotplug event
+
+        :param event: A uevent dictionary or the raw bytes received from the netlink socket
+        :return: True if the event caused a rescan
+        """
+        if isinstance(event, bytes):
+            event = parse_uevent(event)
+        if event.get("SUBSYSTEM") not in ("usb", "net"):
+            return False
+        if event.get("ACTION") not in ("add", "remove", "move", "change"):
+            return False
+        self.rescan()
+        return True
+
+    def rescan(self):
+        """ Scan sysfs and apply the differences to the list of modems """
+        self.scanner.refresh()
+        self._apply(self.scanner.find())
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _apply(self, devices):
+        found = {}
+        for info in devices:
+            if info["supported"]:
+                found[info["path"]] = info
+
+        added = []
+        removed = []
+        with self._lock:
+            for path in list(self._modems):
+                if path not in found:
+                    removed.append(self._modems.pop(path))
+            self._incomplete = False
+            for path, info in found.items():
+                modem = self._modems.get(path)
+                try:
+                    if modem is None:
+                        modem = huawei_3g.modem.create(info, **self._modem_arguments)
+                        self._modems[path] = modem
+                        added.append(modem)
+                    elif modem.interface != info["interface"]:
+                        # The network interface shows up a moment after the USB device
+                        modem.set_interface(info["interface"])
+                except Exception as error:
+                    # For example an interface without an address to bind to yet, try again at the next scan
+                    self.last_error = error
+                    self._incomplete = True
+
+        for modem in removed:
+            self._notify(modem.close)
+            self._notify(self.on_remove, modem)
+        for modem in added:
+            self._notify(self.on_add, modem)
+
+    def _notify(self, callback, *args):
+        # Every modem is announced, even when the callback failed for another modem
+        if callback is None:
+            return
+        try:
+            callback(*args)
+        except Exception as error:
+            self.last_error = error
+
+    def _listen(self):
+        # Set when events may have been missed, a rescan is done at the next timeout
+        dirty = False
+        while not self._stop.is_set():
+            try:
+                readable, _, _ = select.select([self._socket], [], [], 0.5)
+                # Plugging in a dongle produces a burst of events, handle them with a single rescan
+                relevant = dirty
+                while readable:
+                    event = parse_uevent(self._socket.recv(8192))
+                    relevant = relevant or (event.get("SUBSYSTEM") in ("usb", "net"))
+                    readable, _, _ = select.select([self._socket], [], [], 0.05)
+                if relevant:
+                    dirty = True
+                    self.rescan()
+                    dirty = self._incomplete
+            except Exception as error:
+                # For example sysfs changing during the scan or events dropped by a full socket buffer
+                self.last_error = error
+                dirty = True
+
+    def _poll(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                scans = self.scanner.scans
+                devices = self.scanner.find()
+                if self.scanner.scans != scans:
+                    self._apply(devices)
+                if self._incomplete:
+                    self.scanner.refresh()
+            except Exception as error:
+                self.last_error = error
+                # Apply the devices again at the next poll
+                self.scanner.refresh()
@@ -0,0 +1,219 @@
+import heapq
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from huawei_3g.ratelimit import TokenBucket
+
+# Every poll does a status and a message count request
+REQUESTS_PER_POLL = 2
+
+
+class ModemEvent:
+    """ A change noticed by the :class:`~huawei_3g.scheduler.PollScheduler`
+
+    kind
+      "status", "signal" or "network_type" when that value of :func:`~huawei_3g.HuaweiE303Modem.get_status` changed,
+      "messages" when the message count changed, "error" when polling starts failing and "recovered" when it works
+      again
+
+    old, new
+      The previous and the current value. For "messages" these are the message count dictionaries, for "error" new is
+      the exception. old is None for the first poll of a modem.
+    """
+    __slots__ = ('kind', 'modem', 'old', 'new')
+
+    def __init__(self, kind, modem, old, new):
+        self.kind = kind
+        self.modem = modem
+        self.old = old
+        self.new = new
+
+    @property
+    def new_messages(self):
+        """ The amount of messages that arrived, for "messages" events """
+        if self.kind != "messages":
+            return 0
+        return max(0, self.new['count'] - (self.old['count'] if self.old else 0))
+
+    def __repr__(self):
+        return "<ModemEvent {} {!r}: {!r} -> {!r}>".format(self.kind, self.modem, self.old, self.new)
+
+
+class _PollState:
+    __slots__ = ('modem', 'interval', 'status', 'count', 'failures', 'removed')
+
+    def __init__(self, modem, interval):
+        self.modem = modem
+        self.interval = interval
+        self.status = None
+        self.count = None
+        self.failures = 0
+        self.removed = False
+
+
+class PollScheduler:
+    """ Polls the status and message count of many modems and reports changes
+
+    Every modem has its own poll interval. It drops to ``min_interval`` when the status or the message count of the
+    modem changes and grows by ``slowdown`` on every poll without changes, up to ``max_interval``. Failed polls, for
+    example "Busy" answers, double the interval. The time of every poll is randomized by ``jitter`` so modems that
+    were added at the same time don't keep polling at the same moment.
+
+    A single dispatcher thread hands the polls that are due to a small thread pool. All polls share a request
+    budget of ``budget`` requests per second, when it's used up polls are postponed.
+
+    Changes are reported as :class:`~huawei_3g.scheduler.ModemEvent` instances to ``on_event``, called from the
+    thread pool. Without a callback the events are put in the :attr:`events` queue.
+
+    :param modems: The modems to poll, more can be added with :func:`~huawei_3g.scheduler.PollScheduler.add_modem`
+    :param on_event: Called with every :class:`~huawei_3g.scheduler.ModemEvent`
+    :param min_interval: The poll interval in seconds for modems that are changing
+    :param max_interval: The poll interval in seconds for idle or failing modems
+    :param slowdown: The factor the interval grows with after a poll without changes
+    :param jitter: The fraction the poll interval is randomly varied by
+    :param budget: The maximum amount of requests per second over all modems
+    :param workers: The amount of polls that can run at the same time
+    """
+
+    def __init__(self, modems=None, on_event=None, min_interval=1, max_interval=60, slowdown=1.5, jitter=0.1,
+                 budget=20, workers=4):
+        self.on_event = on_event
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.slowdown = slowdown
+        self.jitter = jitter
+        self.budget = TokenBucket(budget, burst=max(budget, REQUESTS_PER_POLL))
+        self.events = queue.Queue()
+        self.polls = 0
+        self._workers = workers
+        self._states = {}
+        self._due = []
+        self._sequence = 0
+        self._random = random.Random()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+        for modem in modems or []:
+            self.add_modem(modem)
+
+    def add_modem(self, modem):
+        """ Start polling a modem, for example from :class:`~huawei_3g.registry.ModemRegistry` """
+        with self._wakeup:
+            if modem.path in self._states:
+                return
+            state = self._states[modem.path] = _PollState(modem, self.min_interval)
+            # Spread the first polls of a batch of new modems over the minimum interval
+            self._schedule(state, self._random.uniform(0, self.min_interval))
+
+    def remove_modem(self, modem):
+        """ Stop polling a modem """
+        with self._wakeup:
+            state = self._states.pop(modem.path, None)
+            if state:
+                state.removed = True
+
+    def interval(self, modem):
+        """ The current poll interval of a modem in seconds """
+        with self._lock:
+            return self._states[modem.path].interval
+
+    def start(self):
+        """ Start polling in a background thread """
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(self._workers)
+        self._thread = threading.Thread(target=self._dispatch, name="huawei-3g-scheduler")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """ Stop polling and wait for the running polls """
+        with self._wakeup:
+            self._stop.set()
+            self._wakeup.notify_all()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if self._executor:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _schedule(self, state, delay):
+        self._sequence += 1
+        heapq.heappush(self._due, (time.monotonic() + delay, self._sequence, state))
+        self._wakeup.notify_all()
+
+    def _dispatch(self):
+        while True:
+            with self._wakeup:
+                while not self._stop.is_set():
+                    if self._due and self._due[0][2].removed:
+                        heapq.heappop(self._due)
+                        continue
+                    wait = self._due[0][0] - time.monotonic() if self._due else None
+                    if wait is not None and wait <= 0:
+                        break
+                    self._wakeup.wait(wait)
+                if self._stop.is_set():
+                    return
+                state = heapq.heappop(self._due)[2]
+
+            wait = self.budget.take(REQUESTS_PER_POLL)
+            if wait:
+                # Out of budget, try again when there is budget for this poll
+                with self._wakeup:
+                    self._schedule(state, wait)
+                continue
+            self._executor.submit(self._poll, state)
+
+    def _poll(self, state):
+        modem = state.modem
+        events = []
+        try:
+            status = modem.get_status(cache=False)
+            count = modem.get_message_count(cache=False)
+        except Exception as error:
+            if state.failures == 0:
+                events.append(ModemEvent("error", modem, None, error))
+            state.failures += 1
+            interval = min(max(state.interval, self.min_interval) * 2, self.max_interval)
+        else:
+            if state.failures:
+                events.append(ModemEvent("recovered", modem, state.failures, None))
+            state.failures = 0
+            for key in ("status", "signal", "network_type"):
+                if state.status is None or state.status[key] != status[key]:
+                    events.append(ModemEvent(key, modem, state.status and state.status[key], status[key]))
+            if state.count != count:
+                events.append(ModemEvent("messages", modem, state.count, count))
+            changed = state.status is not None and (state.status['status'] != status['status'] or
+                                                    state.count != count)
+            state.status = status
+            state.count = count
+            if changed:
+                interval = self.min_interval
+            else:
+                interval = min(state.interval * self.slowdown, self.max_interval)
+
+        try:
+            for event in events:
+                if self.on_event:
+                    self.on_event(event)
+                else:
+                    self.events.put(event)
+        finally:
+            with self._wakeup:
+                self.polls += 1
+                state.interval = interval
+                if not state.removed:
+                    self._schedule(state, interval * (1 + self._random.uniform(-self.jitter, self.jitter)))
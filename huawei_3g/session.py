@@ -0,0 +1,64 @@
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+
+class BoundHTTPAdapter(HTTPAdapter):
+    """ A requests transport adapter that binds its connections with a :class:`~huawei_3g.transport.Binding` """
+
+    def __init__(self, binding, **kwargs):
+        self.binding = binding
+        HTTPAdapter.__init__(self, **kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        pool_kwargs["socket_options"] = self.binding.socket_options
+        if self.binding.source_address:
+            pool_kwargs["source_address"] = (self.binding.source_address, 0)
+        HTTPAdapter.init_poolmanager(self, connections, maxsize, block, **pool_kwargs)
+
+
+def create_session(pool_size=1, retries=2, backoff_factor=0.2, binding=None):
+    """ Create a requests session with a keep-alive connection pool for talking to a HiLink web server
+
+    The HiLink web server is tiny and slow to accept new connections, so the session keeps the TCP connection
+    open between API calls instead of doing a new handshake for every request.
+
+    :param pool_size: The maximum amount of kept-alive connections to the modem
+    :param retries: The amount of times a failed connection attempt is retried, or a Retry instance
+    :param backoff_factor: The backoff factor in seconds between retries
+    :param binding: A :class:`~huawei_3g.transport.Binding` to bind all connections to a network interface
+    :return: a configured :class:`requests.Session`
+    """
+    if not isinstance(retries, Retry):
+        retries = Retry(total=retries, connect=retries, read=retries, backoff_factor=backoff_factor)
+
+    if binding:
+        adapter = BoundHTTPAdapter(binding, pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+    else:
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    return session
+
+
+class RequestsTransport:
+    """ A transport that does the requests with a requests session, see :func:`~huawei_3g.session.create_session`
+
+    :param pool_size: The maximum amount of kept-alive connections to the modem
+    :param timeout: The (connect, read) timeout in seconds
+    :param retries: The amount of retries on connection errors, or a urllib3 Retry instance
+    :param binding: A :class:`~huawei_3g.transport.Binding` to bind the connections to a network interface
+    """
+    name = "requests"
+
+    def __init__(self, pool_size=2, timeout=(3.05, 10), retries=2, binding=None):
+        self.timeout = timeout
+        self.session = create_session(pool_size=pool_size, retries=retries, binding=binding)
+
+    def request(self, method, host, path, body=None, headers=None):
+        """ Do a single HTTP request, the requests response has the status_code and content the modem needs """
+        return self.session.request(method, "http://{}{}".format(host, path), data=body, headers=headers,
+                                    timeout=self.timeout)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,314 @@
+import multiprocessing
+import multiprocessing.connection
+import os
+import pickle
+import queue
+import threading
+import time
+import huawei_3g.modem
+
+
+class FleetResult:
+    """ A result reported by a worker process of the :class:`~huawei_3g.supervisor.FleetSupervisor`
+
+    kind
+      "status" with the status and message count of the modem as a single dictionary, "messages" with the list of
+      :class:`~huawei_3g.datastructures.SMSMessage` instances read from the modem or "error" with a dictionary with
+      the type, message and code of the exception a poll raised
+
+    path
+      The sysfs path of the modem
+
+    timestamp
+      The time of the poll in seconds since the epoch
+    """
+    __slots__ = ('kind', 'path', 'value', 'timestamp')
+
+    def __init__(self, kind, path, value, timestamp):
+        self.kind = kind
+        self.path = path
+        self.value = value
+        self.timestamp = timestamp
+
+    def __reduce__(self):
+        return FleetResult, (self.kind, self.path, self.value, self.timestamp)
+
+    def __repr__(self):
+        return "<FleetResult {} {}: {!r}>".format(self.kind, self.path, self.value)
+
+
+def _poll(modem, options):
+    results = []
+    now = time.time()
+    try:
+        status = modem.get_status(cache=False)
+        status.update(modem.get_message_count(cache=False))
+        results.append(FleetResult("status", modem.path, status, now))
+        if options["messages"] and status["count"]:
+            results.append(FleetResult("messages", modem.path, modem.get_messages(delete=options["delete"]), now))
+    except Exception as error:
+        results.append(_error(modem.path, error, now))
+    return results
+
+
+def _error(path, error, timestamp):
+    # Exceptions don't always survive pickling, send what's needed to handle them
+    return FleetResult("error", path, {
+        "type": error.__class__.__name__,
+        "message": str(error),
+        "code": getattr(error, "code", None)
+    }, timestamp)
+
+
+def _create(device, options):
+    arguments = dict(options["modem_options"])
+    if "ip" in device:
+        arguments["ip"] = device["ip"]
+    modem = huawei_3g.modem.create(device, **arguments)
+    if modem is None:
+        raise ValueError("The modem at {} isn't supported".format(device["path"]))
+    return modem
+
+
+def _worker(connection, options):
+    """ The main loop of a worker process, polls its modems and sends the results of every round in one message """
+    from concurrent.futures import ThreadPoolExecutor
+    modems = {}
+    # Devices the modem object couldn't be created for yet, for example because their interface isn't up
+    pending = {}
+    executor = ThreadPoolExecutor(options["threads"])
+    next_poll = time.monotonic()
+    try:
+        while True:
+            if connection.poll(max(0, next_poll - time.monotonic())):
+                command, device = connection.recv()
+                if command == "add":
+                    pending[device["path"]] = device
+                elif command == "remove":
+                    pending.pop(device["path"], None)
+                    modem = modems.pop(device["path"], None)
+                    if modem:
+                        modem.close()
+                elif command == "stop":
+                    return
+                continue
+
+            batch = []
+            for path, device in list(pending.items()):
+                try:
+                    modem = _create(device, options)
+                except Exception as error:
+                    batch.append(_error(path, error, time.time()))
+                    continue
+                del pending[path]
+                if path in modems:
+                    modems[path].close()
+                modems[path] = modem
+            for results in executor.map(lambda modem: _poll(modem, options), list(modems.values())):
+                batch.extend(results)
+            if batch:
+                connection.send_bytes(pickle.dumps(batch, pickle.HIGHEST_PROTOCOL))
+            # Skip rounds that were missed instead of polling back to back
+            next_poll = max(next_poll + options["interval"], time.monotonic())
+    except (EOFError, BrokenPipeError, KeyboardInterrupt):
+        # The supervisor is gone
+        pass
+    finally:
+        executor.shutdown(wait=False)
+        for modem in modems.values():
+            modem.close()
+
+
+class _Worker:
+    __slots__ = ('index', 'process', 'connection', 'devices')
+
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.connection = None
+        self.devices = {}
+
+
+class FleetSupervisor:
+    """ Polls a large fleet of modems from multiple worker processes
+
+    Parsing the responses of a hundred modems keeps a single Python process busy, so the modems found by
+    :func:`~huawei_3g.modem.find` are divided over ``processes`` worker processes. Every worker polls the status and
+    message count of its modems every ``interval`` seconds, optionally reads the messages, and sends the results of a
+    round as a single pickled batch over a pipe.
+
+    The modems are rediscovered every ``discover_interval`` seconds. New modems go to the worker with the fewest
+    modems and when modems are removed the modems are moved between workers until they differ at most one modem. A
+    worker that dies is started again with the same modems, the other workers are not affected. A modem the worker
+    can't create, for example because its interface can't be bound yet, is reported as an error every round
+    until it can be created.
+
+    The results are passed as lists of :class:`~huawei_3g.supervisor.FleetResult` instances to ``on_results``, called
+    from the supervisor thread. Without a callback the results are put in the :attr:`results` queue one by one.
+
+    :param processes: The amount of worker processes, defaults to the amount of CPUs
+    :param on_results: Called with every batch of :class:`~huawei_3g.supervisor.FleetResult` instances
+    :param interval: The time in seconds between the polls of a modem
+    :param messages: Also read the messages of modems that have messages
+    :param delete: Delete the messages after reading them
+    :param threads: The amount of modems a worker polls at the same time
+    :param discover_interval: The time in seconds between searches for added and removed modems
+    :param sysfs_root: The path sysfs is mounted on
+    :param discover: A function that returns the list of modems like :func:`~huawei_3g.modem.find`, a modem
+                     dictionary can have an "ip" key to use another address for that modem
+    :param modem_options: Extra arguments for the modem constructor, like {"bind": "auto"}
+    """
+
+    def __init__(self, processes=None, on_results=None, interval=5, messages=False, delete=False, threads=4,
+                 discover_interval=10, sysfs_root="/sys", discover=None, modem_options=None):
+        self.processes = processes or os.cpu_count() or 1
+        self.on_results = on_results
+        self.discover_interval = discover_interval
+        self.discover = discover or (lambda: huawei_3g.modem.find(sysfs_root))
+        self.results = queue.Queue()
+        self.restarts = 0
+        self._options = {
+            "interval": interval,
+            "messages": messages,
+            "delete": delete,
+            "threads": threads,
+            "modem_options": modem_options or {}
+        }
+        self._context = multiprocessing.get_context("spawn")
+        self._workers = [_Worker(i) for i in range(self.processes)]
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def assignments(self):
+        """ A dictionary mapping the sysfs path of every modem to the index of the worker process polling it """
+        with self._lock:
+            return dict((path, worker.index) for worker in self._workers for path in worker.devices)
+
+    def start(self):
+        """ Start the worker processes and the supervisor thread """
+        self._stop.clear()
+        for worker in self._workers:
+            self._start_worker(worker)
+        self._thread = threading.Thread(target=self._supervise, name="huawei-3g-supervisor")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """ Stop the supervisor thread and the worker processes """
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        for worker in self._workers:
+            self._stop_worker(worker)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _start_worker(self, worker):
+        parent, child = self._context.Pipe()
+        worker.process = self._context.Process(target=_worker, args=(child, self._options),
+                                               name="huawei-3g-worker-{}".format(worker.index))
+        worker.process.daemon = True
+        worker.process.start()
+        child.close()
+        worker.connection = parent
+        for device in worker.devices.values():
+            parent.send(("add", device))
+
+    def _stop_worker(self, worker):
+        if worker.process is None:
+            return
+        try:
+            worker.connection.send(("stop", None))
+        except OSError:
+            pass
+        worker.process.join(5)
+        if worker.process.is_alive():
+            worker.process.terminate()
+            worker.process.join()
+        worker.connection.close()
+        worker.process = None
+
+    def _supervise(self):
+        next_discovery = 0
+        while not self._stop.is_set():
+            if time.monotonic() >= next_discovery:
+                self._rediscover()
+                next_discovery = time.monotonic() + self.discover_interval
+
+            workers = dict((worker.connection, worker) for worker in self._workers)
+            workers.update((worker.process.sentinel, worker) for worker in self._workers)
+            timeout = min(0.5, max(0, next_discovery - time.monotonic()))
+            for ready in multiprocessing.connection.wait(list(workers), timeout):
+                worker = workers[ready]
+                if ready is worker.connection:
+                    try:
+                        batch = pickle.loads(worker.connection.recv_bytes())
+                    except (EOFError, OSError):
+                        continue
+                    self._deliver(batch)
+                elif not worker.process.is_alive() and not self._stop.is_set():
+                    self._restart(worker)
+
+    def _restart(self, worker):
+        # Read the results the worker sent before it died, then start it again with the same modems
+        try:
+            while worker.connection.poll():
+                self._deliver(pickle.loads(worker.connection.recv_bytes()))
+        except (EOFError, OSError):
+            pass
+        worker.connection.close()
+        worker.process.join()
+        self.restarts += 1
+        self._start_worker(worker)
+
+    def _deliver(self, batch):
+        if self.on_results:
+            self.on_results(batch)
+        else:
+            for result in batch:
+                self.results.put(result)
+
+    def _rediscover(self):
+        try:
+            devices = dict((device["path"], device) for device in self.discover()
+                           if device["supported"] and device.get("interface"))
+        except Exception:
+            return
+        with self._lock:
+            for worker in self._workers:
+                for path in [path for path in worker.devices if path not in devices]:
+                    self._send(worker, "remove", worker.devices.pop(path))
+            assigned = set(path for worker in self._workers for path in worker.devices)
+            for path in sorted(devices):
+                if path not in assigned:
+                    worker = min(self._workers, key=lambda worker: len(worker.devices))
+                    worker.devices[path] = devices[path]
+                    self._send(worker, "add", devices[path])
+
+            # Move modems from the busiest to the quietest worker until the difference is at most one modem
+            while True:
+                busiest = max(self._workers, key=lambda worker: len(worker.devices))
+                quietest = min(self._workers, key=lambda worker: len(worker.devices))
+                if len(busiest.devices) - len(quietest.devices) <= 1:
+                    break
+                path = sorted(busiest.devices)[-1]
+                device = busiest.devices.pop(path)
+                self._send(busiest, "remove", device)
+                quietest.devices[path] = device
+                self._send(quietest, "add", device)
+
+    @staticmethod
+    def _send(worker, command, device):
+        try:
+            worker.connection.send((command, device))
+        except OSError:
+            # The worker died, it gets its modems when it's restarted
+            pass
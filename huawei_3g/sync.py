@@ -0,0 +1,98 @@
+import sqlite3
+
+
+class MessageSync:
+    """ Incrementally fetch new SMS messages from a modem
+
+    The indexes of the messages that have been returned before are stored per modem in a small SQLite database
+    together with a high-water mark (the highest index seen) and the message counters of the last poll. A poll
+    first requests the message count and only lists the inbox if the count changed, so polling a modem without new
+    messages costs a single cheap request.
+
+    :param modem: A :class:`~huawei_3g.huawei_e303.HuaweiE303Modem` instance
+    :param database: Path to the SQLite database file, multiple modems can share a single file
+    :param key: The key the modem is stored under, defaults to the sysfs path of the modem
+    """
+
+    def __init__(self, modem, database, key=None):
+        self.modem = modem
+        self.key = key or modem.path
+        self.connection = sqlite3.connect(database)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS sync_state ("
+                                "modem TEXT PRIMARY KEY, high_water INTEGER, inbox INTEGER, unread INTEGER)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS sync_seen ("
+                                "modem TEXT, message_index INTEGER, PRIMARY KEY (modem, message_index))")
+        self.connection.commit()
+
+    @property
+    def high_water(self):
+        """ The highest message index that has been returned by :func:`~huawei_3g.sync.MessageSync.poll` """
+        return self._state()[0]
+
+    def poll(self, delete=False):
+        """ Get the messages that have arrived since the last poll
+
+        :param delete: Delete all messages from the modem after their indexes have been stored. Messages that
+                       couldn't be deleted are retried on the next poll.
+        :return: a list of new :class:`~huawei_3g.datastructures.SMSMessage` instances, oldest first
+        """
+        high_water, inbox, unread = self._state()
+        count = self.modem.get_message_count(cache=False)
+        if count['count'] == inbox and count['unread'] == unread:
+            return []
+
+        seen = set(row[0] for row in self.connection.execute(
+            "SELECT message_index FROM sync_seen WHERE modem = ?", (self.key,)))
+        new = []
+        # The indexes in the order of the inbox, a message that arrives between two pages moves the next page and
+        # repeats an index
+        present = {}
+        for message in self.modem.iter_messages(count=count['count']):
+            index = int(message.message_id)
+            if index in present:
+                continue
+            present[index] = True
+            if index not in seen:
+                new.append(message)
+        present = list(present)
+        new.sort(key=lambda message: int(message.message_id))
+
+        with self.connection:
+            # Indexes that are no longer on the modem will never come back, only remember the current ones
+            self.connection.execute("DELETE FROM sync_seen WHERE modem = ?", (self.key,))
+            self.connection.executemany("INSERT INTO sync_seen (modem, message_index) VALUES (?, ?)",
+                                        [(self.key, index) for index in present])
+            high_water = max(present + [high_water])
+            self._store_state(high_water, len(present), count['unread'])
+
+        if delete and present:
+            result = self.modem.delete_messages(present)
+            with self.connection:
+                self.connection.executemany("DELETE FROM sync_seen WHERE modem = ? AND message_index = ?",
+                                            [(self.key, index) for index in result.deleted])
+                if result.failed:
+                    # Make sure the next poll lists the inbox again to retry deleting the remaining messages
+                    self._store_state(high_water, len(result.failed), None)
+                else:
+                    self._store_state(high_water, 0, 0)
+        return new
+
+    def reset(self):
+        """ Forget everything that has been stored for this modem """
+        with self.connection:
+            self.connection.execute("DELETE FROM sync_seen WHERE modem = ?", (self.key,))
+            self.connection.execute("DELETE FROM sync_state WHERE modem = ?", (self.key,))
+
+    def close(self):
+        self.connection.close()
+
+    def _state(self):
+        row = self.connection.execute("SELECT high_water, inbox, unread FROM sync_state WHERE modem = ?",
+                                      (self.key,)).fetchone()
+        if row is None:
+            return -1, None, None
+        return row
+
+    def _store_state(self, high_water, inbox, unread):
+        self.connection.execute("INSERT OR REPLACE INTO sync_state (modem, high_water, inbox, unread) "
+                                "VALUES (?, ?, ?, ?)", (self.key, high_water, inbox, unread))
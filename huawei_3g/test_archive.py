@@ -0,0 +1,125 @@
+from unittest import TestCase
+import csv
+import errno
+import gzip
+import json
+import lzma
+import os
+import shutil
+import tempfile
+import threading
+from huawei_3g.archive import ArchiveExporter, export
+from huawei_3g.huawei_e303 import HuaweiE303Modem
+from huawei_3g.testing import FakeHiLinkFleet, FakeHiLinkServer, fake_inbox, fake_message
+
+
+class TestArchiveExporter(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'archive.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read_jsonl(self, opener=open):
+        with opener(self.filename, 'rt', encoding='utf-8') as handle:
+            return [json.loads(line) for line in handle]
+
+    def test_export(self):
+        with FakeHiLinkFleet(3, inbox=25) as fleet:
+            modems = fleet.modems(cache_ttls={})
+            results = export(modems, self.filename, page_size=10, buffer_size=5, flush_size=7)
+            records = self.read_jsonl()
+            self.assertEqual(len(records), 75)
+            self.assertEqual(sorted(result.archived for result in results.values()), [25, 25, 25])
+            self.assertEqual(set(record['modem'] for record in records), {'/fake/0', '/fake/1', '/fake/2'})
+            self.assertEqual(len(fleet.servers[0].inbox), 25)
+
+            # The checkpoint prevents archiving the same messages again
+            fleet.servers[0].inbox.insert(0, fake_message(50000, "New", date="2015-09-09 10:00:00"))
+            results = export(modems, self.filename, page_size=10)
+            self.assertEqual(results['/fake/0'].archived, 1)
+            self.assertEqual(results['/fake/0'].skipped, 25)
+            self.assertEqual(results['/fake/1'].archived, 0)
+            records = self.read_jsonl()
+            self.assertEqual(len(records), 76)
+            self.assertEqual(records[-1]['message'], 'New')
+            for modem in modems:
+                modem.close()
+
+    def test_delete(self):
+        with FakeHiLinkFleet(2, inbox=30) as fleet:
+            modems = fleet.modems(cache_ttls={})
+            exporter = ArchiveExporter(self.filename, delete=True, batch_size=7)
+            results = exporter.export(modems)
+            self.assertEqual(len(self.read_jsonl()), 60)
+            self.assertEqual([len(server.inbox) for server in fleet.servers], [0, 0])
+            self.assertEqual(len(results['/fake/1'].deleted.deleted), 30)
+            # Deleted messages are forgotten by the checkpoint
+            self.assertEqual(exporter.checkpoints, {'/fake/0': set(), '/fake/1': set()})
+            for modem in modems:
+                modem.close()
+
+    def test_read_error(self):
+        with FakeHiLinkFleet(2, inbox=5) as fleet:
+            fleet.servers[1].routes[('POST', '/api/sms/sms-list')] = b'<error><code>100002</code></error>'
+            modems = fleet.modems(cache_ttls={})
+            results = export(modems, self.filename, delete=True)
+            self.assertEqual(results['/fake/0'].archived, 5)
+            self.assertEqual(results['/fake/1'].error.code, '100002')
+            # Nothing is deleted from a modem that couldn't be read completely
+            self.assertEqual(len(fleet.servers[1].inbox), 5)
+            for modem in modems:
+                modem.close()
+
+    def test_write_error(self):
+        class FullDiskExporter(ArchiveExporter):
+            def _flush(self, raw, pending, results):
+                if pending:
+                    raise OSError(errno.ENOSPC, 'No space left on device')
+
+        with FakeHiLinkServer(inbox=fake_inbox(60)) as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address, cache_ttls={}) as modem:
+                errors = []
+
+                def run():
+                    try:
+                        FullDiskExporter(self.filename, page_size=10, buffer_size=5, delete=True).export([modem])
+                    except OSError as error:
+                        errors.append(error)
+
+                thread = threading.Thread(target=run)
+                thread.daemon = True
+                thread.start()
+                thread.join(5)
+                # The reader waiting for room in the buffer is stopped
+                self.assertFalse(thread.is_alive())
+                self.assertEqual([error.errno for error in errors], [errno.ENOSPC])
+            self.assertEqual(len(server.inbox), 60)
+
+    def test_csv_gzip(self):
+        self.filename = os.path.join(self.directory, 'archive.csv.gz')
+        with FakeHiLinkServer(inbox=[fake_message(1, 'Comma, "quote"\nnewline')] + fake_inbox(4)) as server:
+            with HuaweiE303Modem('lo', '/fake', ip=server.address, cache_ttls={}) as modem:
+                export([modem], self.filename, format='csv', compress='gzip', flush_size=2)
+                server.inbox.append(fake_message(2, 'Later'))
+                export([modem], self.filename, format='csv', compress='gzip')
+        with gzip.open(self.filename, 'rt', encoding='utf-8', newline='') as handle:
+            rows = list(csv.DictReader(handle))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0]['message'], 'Comma, "quote"\nnewline')
+        self.assertEqual(rows[-1]['message'], 'Later')
+
+    def test_xz(self):
+        self.filename = os.path.join(self.directory, 'archive.jsonl.xz')
+        with FakeHiLinkFleet(2, inbox=10) as fleet:
+            modems = fleet.modems(cache_ttls={})
+            export(modems, self.filename, compress='xz', flush_size=3)
+            for modem in modems:
+                modem.close()
+        self.assertEqual(len(self.read_jsonl(lzma.open)), 20)
+
+    def test_options(self):
+        self.assertRaises(ValueError, ArchiveExporter, self.filename, format='xml')
+        self.assertRaises(ValueError, ArchiveExporter, self.filename, compress='zip')
+        self.assertEqual(export([], self.filename), {})
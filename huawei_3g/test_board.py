@@ -0,0 +1,157 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import threading
+from huawei_3g.board import StatusBoard, StatusCollector, BoardError, HEADER_SIZE
+from huawei_3g.huawei_e303 import HuaweiE303Modem, NotSupportedError
+from huawei_3g.testing import FakeHiLinkServer
+
+
+def status(signal, network_type="HSPA+"):
+    return {'status': 'Connected', 'signal': signal, 'network_type': network_type}
+
+
+class TestStatusBoard(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "board")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_publish(self):
+        with StatusBoard.create(self.filename, slots=4) as board, StatusBoard.open(self.filename) as reader:
+            self.assertIsNone(reader.read("/sys/bus/usb/devices/1-1"))
+            board.publish("/sys/bus/usb/devices/1-1", "eth1", status(80), {'count': 12, 'unread': 3})
+            board.publish("/sys/bus/usb/devices/1-2", "eth2", status(40, "LTE"), {'count': 0, 'unread': 0})
+            result = reader.read("/sys/bus/usb/devices/1-1")
+            self.assertEqual(result['status'], 'Connected')
+            self.assertEqual(result['interface'], 'eth1')
+            self.assertEqual(result['signal'], 80)
+            self.assertEqual(result['network_type'], 'HSPA+')
+            self.assertEqual((result['count'], result['unread']), (12, 3))
+            self.assertEqual(result['state'], 'ok')
+            self.assertIsNone(result['error'])
+            self.assertEqual([result['path'] for result in reader.read_all()],
+                             ["/sys/bus/usb/devices/1-1", "/sys/bus/usb/devices/1-2"])
+
+            # An error keeps the last status on the board
+            board.publish("/sys/bus/usb/devices/1-1", "eth1", error=NotSupportedError("Not supported", 100002))
+            result = reader.read("/sys/bus/usb/devices/1-1")
+            self.assertEqual(result['state'], 'error')
+            self.assertEqual(result['error'], 'Not supported')
+            self.assertEqual(result['signal'], 80)
+
+            # The slot of a removed modem is reused
+            board.remove("/sys/bus/usb/devices/1-1")
+            self.assertIsNone(reader.read("/sys/bus/usb/devices/1-1"))
+            board.publish("/sys/bus/usb/devices/1-3", "eth3", status(60), {'count': 1, 'unread': 1})
+            self.assertEqual(reader.read("/sys/bus/usb/devices/1-3")['signal'], 60)
+            self.assertEqual(len(reader.read_all()), 2)
+
+    def test_full(self):
+        with StatusBoard.create(self.filename, slots=1) as board:
+            board.publish("/fake/1", "eth1", status(80), {'count': 0, 'unread': 0})
+            self.assertRaises(ValueError, board.publish, "/fake/2", "eth2", status(80), {'count': 0, 'unread': 0})
+
+    def test_long_path(self):
+        path = "/tmp/sysfs-root-of-a-test-run/bus/usb/devices/1-1.4.2:1.0/../1-1.4.2"
+        with StatusBoard.create(self.filename, slots=2) as board:
+            self.assertRaises(ValueError, board.publish, path, "eth1", status(80), {'count': 0, 'unread': 0})
+            self.assertRaises(ValueError, board.read, path)
+            # Text is cut without splitting a character
+            board.publish("/fake/1", "eth1", error=IOError("x" * 47 + "\u00e9"))
+            self.assertEqual(board.read("/fake/1")['error'], "x" * 47)
+
+    def test_not_a_board(self):
+        with open(self.filename, "wb") as handle:
+            handle.write(b"\0" * 1024)
+        self.assertRaises(ValueError, StatusBoard.open, self.filename)
+
+    def test_dead_writer(self):
+        with StatusBoard.create(self.filename, slots=2) as board, StatusBoard.open(self.filename) as reader:
+            board.publish("/fake/1", "eth1", status(80), {'count': 0, 'unread': 0})
+            # The collector died halfway through writing the slot
+            board._mmap[HEADER_SIZE] += 1
+            self.assertRaises(BoardError, reader.read, "/fake/1")
+            self.assertRaises(BoardError, reader.read_all)
+            board.publish("/fake/1", "eth1", status(60), {'count': 0, 'unread': 0})
+            self.assertEqual(reader.read("/fake/1")['signal'], 60)
+
+            # A restarted collector replaces a broken board
+            board._mmap[HEADER_SIZE] += 1
+            StatusBoard.create(self.filename, slots=2).close()
+            self.assertEqual(reader.read_all(), [])
+
+    def test_recreate(self):
+        board = StatusBoard.create(self.filename, slots=2)
+        board.publish("/fake/1", "eth1", status(80), {'count': 0, 'unread': 0})
+        with StatusBoard.open(self.filename) as reader:
+            self.assertEqual(reader.slots, 2)
+            # A restarted collector creates a new board, readers follow it
+            new_board = StatusBoard.create(self.filename, slots=8)
+            board.close()
+            self.assertEqual(reader.read_all(), [])
+            self.assertEqual(reader.slots, 8)
+            new_board.publish("/fake/1", "eth1", status(20), {'count': 0, 'unread': 0})
+            self.assertEqual(reader.read("/fake/1")['signal'], 20)
+            new_board.close()
+
+    def test_consistent_reads(self):
+        with StatusBoard.create(self.filename, slots=2) as board, StatusBoard.open(self.filename) as reader:
+            board.publish("/fake/1", "eth1", status(0), {'count': 0, 'unread': 0})
+            done = threading.Event()
+
+            def write():
+                for i in range(20000):
+                    board.publish("/fake/1", "eth1", status(i % 100, str(i)), {'count': i, 'unread': i})
+                done.set()
+
+            writer = threading.Thread(target=write)
+            writer.start()
+            reads = 0
+            while not done.is_set():
+                result = reader.read("/fake/1")
+                # A torn read would mix the fields of two updates
+                self.assertEqual(result['count'], result['unread'])
+                self.assertEqual(result['network_type'], str(result['count']))
+                self.assertEqual(result['signal'], result['count'] % 100)
+                reads += 1
+            writer.join()
+            self.assertGreater(reads, 0)
+
+
+class TestStatusCollector(TestCase):
+    def test_collector(self):
+        directory = tempfile.mkdtemp()
+        filename = os.path.join(directory, "board")
+        try:
+            with FakeHiLinkServer(inbox=3) as server:
+                with HuaweiE303Modem('eth0', '/fake/1', ip=server.address) as modem:
+                    collector = StatusCollector([modem], filename, interval=60)
+                    collector.sample()
+                    with StatusBoard.open(filename) as reader:
+                        result = reader.read('/fake/1')
+                        self.assertEqual(result['interface'], 'eth0')
+                        self.assertEqual(result['state'], 'ok')
+                        self.assertEqual(result['count'], 3)
+                        self.assertEqual(result['status'], modem.get_status()['status'])
+
+                        collector.remove_modem(modem)
+                        self.assertEqual(reader.read_all(), [])
+                    collector.close()
+
+                    # A full board doesn't stop the other modems from being published
+                    collector = StatusCollector([modem], filename, interval=60, slots=1)
+                    with HuaweiE303Modem('eth1', '/fake/2', ip=server.address) as other:
+                        collector.add_modem(other)
+                        collector.sample()
+                        self.assertEqual(list(collector.errors), ['/fake/2'])
+                        self.assertIsInstance(collector.errors['/fake/2'], ValueError)
+                        collector.remove_modem(modem)
+                        collector.sample()
+                        self.assertEqual(collector.errors, {})
+                    collector.close()
+        finally:
+            shutil.rmtree(directory)
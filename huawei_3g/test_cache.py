@@ -0,0 +1,83 @@
+from unittest import TestCase
+import threading
+import time
+from huawei_3g.cache import ResponseCache
+
+
+class TestResponseCache(TestCase):
+    def setUp(self):
+        self.requests = 0
+
+    def fetch(self):
+        self.requests += 1
+        time.sleep(0.05)
+        return self.requests
+
+    def test_ttl(self):
+        cache = ResponseCache({'/monitoring/status': 0.1})
+        self.assertEqual(cache.get('/monitoring/status', self.fetch), 1)
+        self.assertEqual(cache.get('/monitoring/status', self.fetch), 1)
+        time.sleep(0.1)
+        self.assertEqual(cache.get('/monitoring/status', self.fetch), 2)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 2, 'coalesced': 0, 'entries': 1})
+
+    def test_uncached_url(self):
+        cache = ResponseCache({})
+        cache.get('/monitoring/status', self.fetch)
+        cache.get('/monitoring/status', self.fetch)
+        self.assertEqual(self.requests, 2)
+
+    def test_bypass(self):
+        cache = ResponseCache({'/monitoring/status': 10})
+        cache.get('/monitoring/status', self.fetch)
+        self.assertEqual(cache.get('/monitoring/status', self.fetch, bypass=True), 2)
+        self.assertEqual(cache.get('/monitoring/status', self.fetch), 2)
+
+    def test_coalescing(self):
+        cache = ResponseCache({'/monitoring/status': 10})
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get('/monitoring/status', self.fetch)))
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [1] * 8)
+        self.assertEqual(self.requests, 1)
+        self.assertEqual(cache.coalesced + cache.hits, 7)
+
+    def test_error_not_cached(self):
+        cache = ResponseCache({'/monitoring/status': 10})
+
+        def fail():
+            raise IOError('timeout')
+
+        self.assertRaises(IOError, cache.get, '/monitoring/status', fail)
+        self.assertEqual(cache.get('/monitoring/status', self.fetch), 1)
+
+    def test_invalidate(self):
+        cache = ResponseCache({'/sms/sms-count': 10, '/monitoring/status': 10})
+        cache.get('/sms/sms-count', self.fetch)
+        cache.get('/monitoring/status', self.fetch)
+        cache.invalidate('/sms/')
+        self.assertEqual(cache.get('/sms/sms-count', self.fetch), 3)
+        self.assertEqual(cache.get('/monitoring/status', self.fetch), 2)
+
+    def test_invalidate_in_flight(self):
+        cache = ResponseCache({'/sms/sms-count': 10})
+        results = []
+
+        def count_before_delete():
+            self.requests += 1
+            time.sleep(0.05)
+            return 1
+
+        thread = threading.Thread(target=lambda: results.append(cache.get('/sms/sms-count', count_before_delete)))
+        thread.start()
+        time.sleep(0.01)
+        # A message is deleted while the count is being read
+        cache.invalidate('/sms/')
+        self.assertEqual(cache.get('/sms/sms-count', self.fetch), 2)
+        thread.join()
+        self.assertEqual(results, [1])
+        self.assertEqual(cache.get('/sms/sms-count', self.fetch), 2)
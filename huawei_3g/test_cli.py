@@ -0,0 +1,99 @@
+from unittest import TestCase
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from huawei_3g.cli import main
+from huawei_3g.testing import FakeSysfs, FakeHiLinkServer
+import huawei_3g.modem
+
+
+class TestCli(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.sysfs = FakeSysfs(self.root)
+        self.sysfs.add_device("1-1", interface="wwan0")
+        self.sysfs.add_device("1-2", product="1506")
+        huawei_3g.modem.refresh()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def run_cli(self, *arguments):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            status = main(["--sysfs-root", self.root] + list(arguments))
+        return status, output.getvalue()
+
+    def test_discover(self):
+        status, output = self.run_cli("--json", "discover")
+        self.assertEqual(status, 0)
+        devices = json.loads(output)
+        self.assertEqual([device['interface'] for device in devices], ['wwan0', None])
+        self.assertEqual([device['supported'] for device in devices], [True, False])
+
+    def test_status(self):
+        with FakeHiLinkServer() as server:
+            status, output = self.run_cli("--ip", server.address, "--json", "status")
+        self.assertEqual(status, 0)
+        self.assertEqual(json.loads(output), [{
+            'path': os.path.join(self.root, 'bus/usb/devices/1-1'),
+            'interface': 'wwan0',
+            'result': {'status': 'Connected', 'signal': 40, 'network_type': 'GPRS', 'count': 2, 'unread': 1}
+        }])
+
+    def test_messages_and_delete(self):
+        with FakeHiLinkServer() as server:
+            status, output = self.run_cli("--ip", server.address, "messages")
+            self.assertEqual(status, 0)
+            self.assertIn("40001 2015-09-08 11:03:23 +31617000000: Test 2", output)
+            status, output = self.run_cli("--ip", server.address, "--modem", "1-1", "delete", "40001")
+            self.assertEqual(status, 0)
+            self.assertTrue(output.endswith("(wwan0): deleted 40001\n"))
+            self.assertEqual([message['Index'] for message in server.inbox], ['40000'])
+
+    def test_delete_failure(self):
+        with FakeHiLinkServer(busy_rate=1) as server:
+            status, output = self.run_cli("--ip", server.address, "--modem", "1-1", "delete", "40000", "40001")
+        self.assertEqual(status, 1)
+        self.assertTrue(output.endswith("(wwan0): deleted nothing, failed 40000 40001 (Busy)\n"))
+
+    def test_messages_delete(self):
+        with FakeHiLinkServer() as server:
+            status, output = self.run_cli("--ip", server.address, "--json", "messages", "--delete")
+            self.assertEqual(status, 0)
+            result = json.loads(output)[0]['result']
+            self.assertEqual([message['message_id'] for message in result['messages']], ['40001', '40000'])
+            self.assertEqual(sorted(result['deleted']), ['40000', '40001'])
+            self.assertEqual(server.inbox, [])
+
+    def test_messages_delete_failure(self):
+        class FailingServer(FakeHiLinkServer):
+            def handle(self, method, path, headers, body):
+                if path == '/api/sms/delete-sms':
+                    return b'<error><code>100004</code></error>'
+                return FakeHiLinkServer.handle(self, method, path, headers, body)
+
+        with FailingServer() as server:
+            status, output = self.run_cli("--ip", server.address, "messages", "--delete")
+        self.assertEqual(status, 1)
+        self.assertIn("2 messages", output)
+        self.assertTrue(output.endswith("  deleted nothing, failed 40000 40001 (Busy)\n"))
+
+    def test_error(self):
+        with FakeHiLinkServer(busy_rate=1) as server:
+            status, output = self.run_cli("--ip", server.address, "status")
+        self.assertEqual(status, 1)
+        self.assertTrue(output.endswith("(wwan0): error: Busy\n"))
+
+    def test_lazy_imports(self):
+        script = ("import sys\n"
+                  "import huawei_3g.cli, huawei_3g.huawei_e303\n"
+                  "huawei_3g.cli.main(['--sysfs-root', sys.argv[1], 'discover'])\n"
+                  "print(' '.join(m for m in ['requests', 'xmltodict', 'asyncio'] if m in sys.modules))")
+        output = subprocess.check_output([sys.executable, "-c", script, self.root], universal_newlines=True)
+        self.assertEqual(output.splitlines()[-1], "")
@@ -0,0 +1,88 @@
+from unittest import TestCase
+import threading
+import time
+from huawei_3g.csrf import TokenManager
+
+
+class TestTokenManager(TestCase):
+    def setUp(self):
+        self.fetches = 0
+
+    def fetch(self):
+        self.fetches += 1
+        time.sleep(0.05)
+        return str(self.fetches)
+
+    def test_lazy_and_cached(self):
+        manager = TokenManager(self.fetch, background=False)
+        self.assertEqual(self.fetches, 0)
+        self.assertEqual(manager.get(), '1')
+        self.assertEqual(manager.get(), '1')
+        self.assertEqual(manager.refresh_count, 1)
+
+    def test_expiry(self):
+        manager = TokenManager(self.fetch, ttl=0.1, background=False)
+        self.assertEqual(manager.get(), '1')
+        time.sleep(0.15)
+        self.assertEqual(manager.get(), '2')
+        self.assertEqual(manager.refresh_count, 2)
+
+    def test_single_flight(self):
+        manager = TokenManager(self.fetch, background=False)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(manager.get())) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['1'] * 10)
+        self.assertEqual(self.fetches, 1)
+
+    def test_stale_token(self):
+        manager = TokenManager(self.fetch, background=False)
+        manager.get()
+        self.assertEqual(manager.refresh(stale='1'), '2')
+        # Another caller that got the old token rejected doesn't fetch again
+        self.assertEqual(manager.refresh(stale='1'), '2')
+        self.assertEqual(self.fetches, 2)
+
+    def test_fetch_error(self):
+        def fetch():
+            raise IOError('modem unreachable')
+
+        manager = TokenManager(fetch, background=False)
+        self.assertRaises(IOError, manager.get)
+        self.assertEqual(manager.token, '')
+        self.assertEqual(manager.refresh_count, 0)
+
+    def test_background_refresh(self):
+        manager = TokenManager(self.fetch, ttl=0.2, refresh_margin=0.1)
+        manager.get()
+        time.sleep(0.35)
+        manager.close()
+        self.assertGreaterEqual(manager.refresh_count, 2)
+        self.assertEqual(manager.get(), manager.token)
+
+    def test_background_refresh_idle(self):
+        manager = TokenManager(self.fetch, ttl=0.1, refresh_margin=0.05)
+        manager.get()
+        time.sleep(0.5)
+        # The refresh stops once the token isn't used anymore
+        self.assertLessEqual(manager.refresh_count, 3)
+        self.assertIsNone(manager._timer)
+        count = manager.refresh_count
+        time.sleep(0.2)
+        self.assertEqual(manager.refresh_count, count)
+        manager.get()
+        self.assertIsNotNone(manager._timer)
+        manager.close()
+
+    def test_close_during_refresh(self):
+        manager = TokenManager(self.fetch, ttl=10)
+        thread = threading.Thread(target=manager.get)
+        thread.start()
+        time.sleep(0.01)
+        manager.close()
+        thread.join()
+        self.assertEqual(manager.token, '1')
+        self.assertIsNone(manager._timer)
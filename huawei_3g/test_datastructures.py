@@ -0,0 +1,40 @@
+from unittest import TestCase
+import datetime
+import pickle
+from huawei_3g.datastructures import SMSMessage, parse_date
+
+
+class TestSMSMessage(TestCase):
+    def test_fields(self):
+        message = SMSMessage('40000', 'Test', '+31617000000', '2015-09-08 11:03:00', read=True, sms_type=1,
+                             priority=0, save_type=4, sca='+31653131313')
+        self.assertEqual(message.message_id, '40000')
+        self.assertTrue(message.read)
+        self.assertEqual(message.sca, '+31653131313')
+        self.assertEqual(message.receive_time, datetime.datetime(2015, 9, 8, 11, 3))
+
+    def test_lazy_receive_time(self):
+        message = SMSMessage('40000', 'Test', '+31617000000', 'not a date')
+        self.assertEqual(message.message, 'Test')
+        self.assertRaises(ValueError, lambda: message.receive_time)
+        self.assertIsNone(SMSMessage('40000').receive_time)
+
+    def test_immutable(self):
+        message = SMSMessage('40000', 'Test', '+31617000000', '2015-09-08 11:03:00')
+
+        def change():
+            message.message = 'Changed'
+
+        self.assertRaises(AttributeError, change)
+        self.assertFalse(hasattr(message, '__dict__'))
+
+    def test_pickle(self):
+        message = SMSMessage('40000', 'Test', '+31617000000', '2015-09-08 11:03:00', read=True)
+        copy = pickle.loads(pickle.dumps(message))
+        self.assertEqual(copy, message)
+        self.assertEqual(hash(copy), hash(message))
+        self.assertEqual(copy.receive_time, message.receive_time)
+
+    def test_parse_date(self):
+        self.assertEqual(parse_date('2015-09-08 11:03:23'), datetime.datetime(2015, 9, 8, 11, 3, 23))
+        self.assertEqual(parse_date('2015-9-8 11:03:23'), datetime.datetime(2015, 9, 8, 11, 3, 23))
@@ -0,0 +1,60 @@
+from unittest import TestCase
+import threading
+import time
+from huawei_3g.gate import RequestGate, OpenGate, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_BULK
+
+
+class TestRequestGate(TestCase):
+    def test_priority(self):
+        gate = RequestGate()
+        order = []
+
+        def request(name, priority):
+            with gate.hold(priority):
+                order.append(name)
+
+        gate.acquire()
+        threads = []
+        for name, priority in [('page 1', PRIORITY_BULK), ('status', PRIORITY_NORMAL), ('page 2', PRIORITY_BULK),
+                               ('token', PRIORITY_HIGH), ('count', PRIORITY_NORMAL)]:
+            thread = threading.Thread(target=request, args=(name, priority))
+            thread.start()
+            threads.append(thread)
+            # Wait until the thread is queued so the arrival order is fixed
+            while gate.waiting < len(threads):
+                time.sleep(0.001)
+        gate.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, ['token', 'status', 'count', 'page 1', 'page 2'])
+        self.assertEqual(gate.waits, 5)
+        self.assertEqual(gate.waiting, 0)
+
+    def test_exclusive(self):
+        gate = RequestGate()
+        active = []
+        overlaps = []
+
+        def request():
+            for i in range(200):
+                with gate.hold():
+                    active.append(1)
+                    if len(active) > 1:
+                        overlaps.append(len(active))
+                    active.pop()
+
+        threads = [threading.Thread(target=request) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(overlaps, [])
+        # The gate is free again
+        gate.acquire()
+        gate.release()
+
+    def test_open_gate(self):
+        gate = OpenGate()
+        with gate.hold():
+            with gate.hold(PRIORITY_BULK):
+                pass
@@ -0,0 +1,61 @@
+from unittest import TestCase
+import time
+from huawei_3g.health import Health, CircuitOpenError, rank
+
+
+class FakeModem:
+    def __init__(self, name, health):
+        self.name = name
+        self.health = health
+
+
+class TestHealth(TestCase):
+    def test_states(self):
+        health = Health(failure_threshold=2, reset_timeout=0.05, max_reset_timeout=0.08, probes=1)
+        health.before_request()
+        health.failure()
+        self.assertEqual(health.state, 'closed')
+        health.before_request()
+        health.failure()
+        self.assertEqual(health.state, 'open')
+        self.assertFalse(health.available)
+        self.assertRaises(CircuitOpenError, health.before_request)
+
+        time.sleep(0.05)
+        health.before_request()
+        # Only a single probe at a time
+        self.assertRaises(CircuitOpenError, health.before_request)
+        health.failure()
+        self.assertEqual(health.state, 'open')
+        time.sleep(0.05)
+        self.assertRaises(CircuitOpenError, health.before_request)
+        time.sleep(0.03)
+        health.before_request()
+        health.success(0.01)
+        self.assertEqual(health.state, 'closed')
+        health.before_request()
+        health.before_request()
+
+    def test_score(self):
+        health = Health(latency_target=0.5, smoothing=0.5)
+        self.assertEqual(health.score, 1.0)
+        health.success(0.5)
+        self.assertAlmostEqual(health.score, 0.5 / 0.75)
+        health.failure()
+        self.assertAlmostEqual(health.score, 0.5 * 0.5 / 0.75)
+
+    def test_reset(self):
+        health = Health(failure_threshold=1)
+        health.failure()
+        self.assertEqual(health.score, 0.0)
+        health.reset()
+        health.before_request()
+
+    def test_rank(self):
+        fast = FakeModem('fast', Health())
+        slow = FakeModem('slow', Health())
+        broken = FakeModem('broken', Health(failure_threshold=1))
+        fast.health.success(0.01)
+        slow.health.success(2)
+        broken.health.failure()
+        self.assertEqual([modem.name for modem in rank([slow, broken, fast])], ['fast', 'slow'])
@@ -1,5 +1,10 @@
 from unittest import TestCase
-from huawei_3g.huawei_e303 import HuaweiE303Modem, TokenError
+from huawei_3g.gate import PRIORITY_NORMAL, PRIORITY_BULK
+from huawei_3g.health import Health, CircuitOpenError
+from huawei_3g.huawei_e303 import HuaweiE303Modem, TokenError, BusyError, ApiError, NotSupportedError, \
+    AccessDeniedError, LoginError, VoiceBusyError
+from huawei_3g.testing import FakeHiLinkServer, FakeHiLinkFleet, fake_message
+import time
 import requests
 import responses
 import datetime
@@ -46,6 +51,10 @@ class TestHuaweiE303Modem(TestCase):
 
     @responses.activate
     def test_get_messages(self):
+        with open("huawei_3g/fixtures/sms-count.xml") as payload_file:
+            responses.add(responses.GET, 'http://192.168.8.1/api/sms/sms-count', body=payload_file.read())
+        responses.add(responses.GET, 'http://192.168.8.1/api/webserver/token',
+                      body='<response><token>1</token></response>')
         with open("huawei_3g/fixtures/sms-list-2.xml") as payload_file:
             payload = payload_file.read()
         responses.add(**{
@@ -77,6 +86,10 @@ class TestHuaweiE303Modem(TestCase):
         This is a side effect of the XML parser used.
         :return:
         """
+        with open("huawei_3g/fixtures/sms-count.xml") as payload_file:
+            responses.add(responses.GET, 'http://192.168.8.1/api/sms/sms-count', body=payload_file.read())
+        responses.add(responses.GET, 'http://192.168.8.1/api/webserver/token',
+                      body='<response><token>1</token></response>')
         with open("huawei_3g/fixtures/sms-list-1.xml") as payload_file:
             payload = payload_file.read()
         responses.add(**{
@@ -95,8 +108,16 @@ class TestHuaweiE303Modem(TestCase):
         self.assertEqual(message.sender, '+31617000000')
         self.assertEqual(message.receive_time, datetime.datetime(2015, 9, 8, 11, 3))
 
+    @responses.activate
     def test_delete_message(self):
-        self.assertTrue(True)
+        responses.add(responses.GET, 'http://192.168.8.1/api/webserver/token',
+                      body='<response><token>1</token></response>')
+        responses.add(responses.POST, 'http://192.168.8.1/api/sms/delete-sms', body='<response>OK</response>')
+        modem = HuaweiE303Modem('eth0', '/')
+        result = modem.delete_message('40000')
+        self.assertEqual(result.deleted, ['40000'])
+        self.assertEqual(responses.calls[1].request.body,
+                         b'<?xml version="1.0" encoding="UTF-8"?><request><Index>40000</Index></request>')
 
     def test_delete_messages(self):
         self.assertTrue(True)
@@ -226,3 +247,414 @@ class TestHuaweiE303Modem(TestCase):
                     self.assertEqual(case['error'], 125001)
                 except Exception as error:
                     self.assertEqual(case['message'], str(error))
+
+
+class TestHuaweiE303ModemConnection(TestCase):
+    def test_connection_reuse(self):
+        with FakeHiLinkServer() as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address, cache_ttls={}) as modem:
+                for i in range(5):
+                    self.assertEqual(modem.get_status()['status'], 'Connected')
+                modem.get_message_count()
+                modem.get_messages()
+            self.assertEqual(len(server.requests), 9)
+            self.assertEqual(server.connections, 1)
+
+    def test_token_fetched_once(self):
+        class TokenServer(FakeHiLinkServer):
+            def handle(self, method, path, headers, body):
+                if method == 'POST' and headers.get('__RequestVerificationToken') != '1':
+                    return b'<error><code>125001</code></error>'
+                return FakeHiLinkServer.handle(self, method, path, headers, body)
+
+        with TokenServer() as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address) as modem:
+                modem.delete_messages(['40000'])
+                self.assertEqual([request[1] for request in server.requests],
+                                 ['/api/webserver/token', '/api/sms/delete-sms'])
+                modem.delete_messages(['40001'])
+                self.assertEqual(len(server.requests), 3)
+                self.assertEqual(modem.tokens.refresh_count, 1)
+
+    def test_token_retries_bounded(self):
+        class RejectingServer(FakeHiLinkServer):
+            def handle(self, method, path, headers, body):
+                FakeHiLinkServer.handle(self, method, path, headers, body)
+                if path == '/api/webserver/token':
+                    return b'<response><token>1</token></response>'
+                return b'<error><code>125001</code></error>'
+
+        with RejectingServer() as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address, token_retries=2) as modem:
+                self.assertRaises(TokenError, modem.get_status)
+            self.assertEqual(len(server.requests), 5)
+            self.assertEqual(modem.tokens.refresh_count, 2)
+
+    def test_delete_messages_batches(self):
+        inbox = [fake_message(i) for i in range(45)]
+        with FakeHiLinkServer(inbox) as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address) as modem:
+                result = modem.delete_messages(range(45), batch_size=20)
+            self.assertEqual(result.deleted, list(range(45)))
+            self.assertEqual(result.failed, [])
+            delete_requests = [request for request in server.requests if request[1] == '/api/sms/delete-sms']
+            self.assertEqual([request[2].count(b'<Index>') for request in delete_requests], [20, 20, 5])
+            self.assertEqual(server.inbox, [])
+
+    def test_delete_messages_partial_failure(self):
+        class FailingServer(FakeHiLinkServer):
+            def handle(self, method, path, headers, body):
+                if path == '/api/sms/delete-sms' and b'<Index>1</Index>' in body:
+                    return b'<error><code>100004</code></error>'
+                return FakeHiLinkServer.handle(self, method, path, headers, body)
+
+        with FailingServer([fake_message(i) for i in range(4)]) as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address) as modem:
+                result = modem.delete_messages([0, 1, 2, 3], batch_size=2)
+            self.assertEqual(result.deleted, [2, 3])
+            self.assertEqual(result.failed, [0, 1])
+            self.assertEqual(str(result.errors[0]), 'Busy')
+            self.assertEqual([message['Index'] for message in server.inbox], ['0', '1'])
+
+    def test_drain_messages(self):
+        inbox = [fake_message(i) for i in range(110)]
+        with FakeHiLinkServer(inbox) as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address) as modem:
+                messages, result = modem.drain_messages(page_size=50, batch_size=25)
+            self.assertEqual([message.message_id for message in messages], [str(i) for i in range(110)])
+            self.assertEqual(sorted(result.deleted, key=int), [str(i) for i in range(110)])
+            self.assertEqual(server.inbox, [])
+            # The last page is deleted before the first page is read
+            paths = [request[1] for request in server.requests if request[1].startswith('/api/sms/')]
+            self.assertLess(paths.index('/api/sms/delete-sms'), len(paths) - paths[::-1].index('/api/sms/sms-list') - 1)
+
+    def test_drain_messages_read_failure(self):
+        class FailingServer(FakeHiLinkServer):
+            def handle(self, method, path, headers, body):
+                if path == '/api/sms/sms-list' and b'<PageIndex>2</PageIndex>' in body:
+                    return b'<error><code>100002</code></error>'
+                return FakeHiLinkServer.handle(self, method, path, headers, body)
+
+        with FailingServer([fake_message(i) for i in range(60)]) as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address) as modem:
+                self.assertRaises(ApiError, modem.drain_messages, page_size=50)
+            self.assertEqual(len(server.inbox), 60)
+
+    def test_drain_messages_later_page_failure(self):
+        class FailingServer(FakeHiLinkServer):
+            def handle(self, method, path, headers, body):
+                if path == '/api/sms/sms-list' and b'<PageIndex>1</PageIndex>' in body:
+                    return b'<error><code>100002</code></error>'
+                return FakeHiLinkServer.handle(self, method, path, headers, body)
+
+        with FailingServer([fake_message(i) for i in range(60)]) as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address) as modem:
+                messages, result = modem.drain_messages(page_size=50)
+            # The messages of the last page are returned and deleted, the others stay on the modem
+            self.assertEqual([message.message_id for message in messages], [str(i) for i in range(50, 60)])
+            self.assertEqual(len(result.deleted), 10)
+            self.assertIsInstance(result.errors[0], ApiError)
+            self.assertEqual(len(server.inbox), 50)
+
+    def test_iter_drain(self):
+        with FakeHiLinkServer([fake_message(i) for i in range(25)]) as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address) as modem:
+                drained = []
+                for message in modem.iter_drain(page_size=10):
+                    drained.append(message.message_id)
+                    if len(drained) == 15:
+                        break
+            # Oldest first, only the page the caller consumed completely is deleted
+            self.assertEqual(drained, [str(i) for i in range(24, 9, -1)])
+            self.assertEqual(len(server.inbox), 20)
+
+    def test_get_messages_delete_failure(self):
+        class FailingServer(FakeHiLinkServer):
+            def handle(self, method, path, headers, body):
+                if path == '/api/sms/delete-sms' and b'<Index>1</Index>' in body:
+                    return b'<error><code>100004</code></error>'
+                return FakeHiLinkServer.handle(self, method, path, headers, body)
+
+        with FailingServer([fake_message(i) for i in range(4)]) as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address) as modem:
+                # The failed delete isn't raised over the messages
+                self.assertEqual(len(modem.get_messages(delete=True)), 4)
+                messages, result = modem.drain_messages(batch_size=2)
+                self.assertEqual(len(messages), 4)
+                self.assertEqual(sorted(result.failed), ['0', '1'])
+                # The messages that failed to delete are returned again
+                self.assertEqual([message.message_id for message in modem.get_messages(delete=True)], ['0', '1'])
+
+    def test_close(self):
+        with FakeHiLinkServer() as server:
+            modem = HuaweiE303Modem('eth0', '/', ip=server.address, cache_ttls={})
+            modem.get_status()
+            modem.close()
+            modem.get_status()
+            self.assertEqual(server.connections, 2)
+
+    def test_iter_messages_pages(self):
+        inbox = [fake_message(40000 + i, "Message {}".format(i)) for i in range(45)]
+        with FakeHiLinkServer(inbox) as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address) as modem:
+                messages = list(modem.iter_messages(page_size=20))
+            self.assertEqual([message.message_id for message in messages], [str(40000 + i) for i in range(45)])
+            list_requests = [request for request in server.requests if request[1] == '/api/sms/sms-list']
+            self.assertEqual(len(list_requests), 3)
+            self.assertIn(b'<PageIndex>3</PageIndex><ReadCount>20</ReadCount>', list_requests[2][2])
+
+    def test_iter_messages_empty(self):
+        with FakeHiLinkServer([]) as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address) as modem:
+                self.assertEqual(list(modem.iter_messages()), [])
+            self.assertEqual(len(server.requests), 1)
+
+    def test_iter_messages_unread_first(self):
+        inbox = [fake_message(1), fake_message(2, read=False), fake_message(3)]
+        with FakeHiLinkServer(inbox) as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address) as modem:
+                messages = list(modem.iter_messages(unread_first=True, prefetch=False))
+            self.assertEqual(messages[0].message_id, '2')
+
+    def test_get_messages_over_50(self):
+        inbox = [fake_message(i) for i in range(120)]
+        with FakeHiLinkServer(inbox) as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address) as modem:
+                self.assertEqual(len(modem.get_messages(delete=True)), 120)
+            self.assertEqual(server.inbox, [])
+
+
+class TestHuaweiE303ModemCache(TestCase):
+    def test_get_device_information(self):
+        with FakeHiLinkServer() as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address) as modem:
+                information = modem.get_device_information()
+                modem.get_device_information()
+            self.assertEqual(information['name'], 'E303')
+            self.assertEqual(information['imei'], '861234567890123')
+            self.assertIsNone(information['msisdn'])
+            self.assertEqual(len(server.requests), 1)
+
+    def test_cache(self):
+        with FakeHiLinkServer() as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address) as modem:
+                for i in range(5):
+                    modem.get_status()
+                    modem.get_message_count()
+                self.assertEqual(len(server.requests), 2)
+                modem.get_status(cache=False)
+                self.assertEqual(len(server.requests), 3)
+                self.assertEqual(modem.cache.stats()['hits'], 8)
+                self.assertEqual(modem.cache.stats()['misses'], 3)
+
+    def test_invalidate_after_delete(self):
+        with FakeHiLinkServer() as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address) as modem:
+                self.assertEqual(modem.get_message_count()['count'], 2)
+                modem.delete_messages(['40000'])
+                self.assertEqual(modem.get_message_count()['count'], 1)
+
+
+class TestHuaweiE303ModemSimulated(TestCase):
+    def test_busy(self):
+        with FakeHiLinkServer(busy_rate=1) as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address) as modem:
+                self.assertRaisesRegex(Exception, 'Busy', modem.get_status)
+            self.assertEqual(server.errors, {'100004': 1})
+
+    def test_token_expiry(self):
+        with FakeHiLinkServer(inbox=30, token_lifetime=0.05) as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address) as modem:
+                self.assertEqual(len(list(modem.iter_messages())), 30)
+                time.sleep(0.05)
+                result = modem.delete_messages([40000, 40001])
+            self.assertEqual(result.deleted, [40000, 40001])
+            self.assertEqual(server.errors, {'125001': 1})
+            self.assertEqual(len(server.inbox), 28)
+
+    def test_send_sms(self):
+        with FakeHiLinkServer(send_time=0.2) as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address) as modem:
+                modem.send_sms(['+31600', '+31601'], 'Dinner at 8 & <bring> wine')
+                self.assertEqual(modem.get_send_status(), {'sending': '+31600,+31601', 'sent': [], 'failed': []})
+                self.assertRaises(BusyError, modem.send_sms, '+31602', 'Test')
+            self.assertEqual(server.sent, [(['+31600', '+31601'], 'Dinner at 8 & <bring> wine')])
+
+    def test_fleet(self):
+        with FakeHiLinkFleet(3, inbox=5) as fleet:
+            modems = fleet.modems()
+            for modem in modems:
+                self.assertEqual(modem.get_message_count()['count'], 5)
+                modem.close()
+            self.assertEqual(fleet.requests, 3)
+
+
+class TestHuaweiE303ModemHealth(TestCase):
+    def test_typed_errors(self):
+        for code, error_type in [('100002', NotSupportedError), ('100003', AccessDeniedError), ('100004', BusyError),
+                                 ('108002', LoginError), ('120001', VoiceBusyError), ('125001', TokenError)]:
+            with self.assertRaises(error_type) as context:
+                HuaweiE303Modem._raise_error(code)
+            self.assertIsInstance(context.exception, ApiError)
+            self.assertEqual(context.exception.code, code)
+            self.assertEqual(str(context.exception), HuaweiE303Modem._error_codes[code])
+
+    def test_circuit_breaker(self):
+        with FakeHiLinkServer(busy_rate=1) as server:
+            health = Health(failure_threshold=3, reset_timeout=0.1)
+            with HuaweiE303Modem('eth0', '/', ip=server.address, cache_ttls={}, health=health) as modem:
+                for i in range(3):
+                    self.assertRaises(BusyError, modem.get_status)
+                self.assertEqual(health.state, 'open')
+                self.assertRaises(CircuitOpenError, modem.get_status)
+                self.assertEqual(len(server.requests), 3)
+                self.assertEqual(health.score, 0)
+
+                # After the timeout a single probe is sent, a failing probe opens the circuit for longer
+                time.sleep(0.1)
+                self.assertRaises(BusyError, modem.get_status)
+                self.assertRaises(CircuitOpenError, modem.get_status)
+                self.assertEqual(len(server.requests), 4)
+
+                server.busy_rate = 0
+                time.sleep(0.2)
+                self.assertEqual(modem.get_status()['status'], 'Connected')
+                self.assertEqual(health.state, 'closed')
+                self.assertGreater(health.score, 0)
+
+    def test_api_errors_are_healthy(self):
+        with FakeHiLinkServer() as server:
+            server.routes[('GET', '/api/monitoring/status')] = b'<error><code>100002</code></error>'
+            with HuaweiE303Modem('eth0', '/', ip=server.address, cache_ttls={},
+                                 health=Health(failure_threshold=1)) as modem:
+                for i in range(3):
+                    self.assertRaises(NotSupportedError, modem.get_status)
+                self.assertEqual(modem.health.state, 'closed')
+
+    def test_connection_errors(self):
+        health = Health(failure_threshold=2, reset_timeout=10)
+        modem = HuaweiE303Modem('eth0', '/', ip='127.0.0.1:1', transport='socket', retries=0, health=health)
+        self.assertRaises(IOError, modem.get_status)
+        self.assertRaises(IOError, modem.get_status)
+        with self.assertRaises(CircuitOpenError) as context:
+            modem.get_status()
+        self.assertGreater(context.exception.retry_after, 9)
+
+
+class TestHuaweiE303ModemSnapshot(TestCase):
+    def test_snapshot(self):
+        for transport in ['socket', 'requests']:
+            with FakeHiLinkServer(inbox=3) as server:
+                with HuaweiE303Modem('eth0', '/', ip=server.address, transport=transport) as modem:
+                    before = time.time()
+                    snapshot = modem.get_snapshot(['status', 'message_count', 'signal', 'device_information'])
+                    self.assertEqual(snapshot.status, modem.get_status(cache=False))
+                    self.assertEqual(snapshot.message_count, {'count': 3, 'unread': 0})
+                    self.assertEqual(snapshot.signal, {'rssi': -67, 'rscp': -71, 'rsrp': None, 'ecio': -4,
+                                                       'rsrq': None, 'sinr': None, 'mode': 2, 'cell_id': '12345678'})
+                    self.assertEqual(snapshot.device_information['imei'], '861234567890123')
+                    self.assertIsNone(snapshot.traffic)
+                    self.assertEqual(sorted(snapshot.timestamps), ['device_information', 'message_count', 'signal',
+                                                                   'status'])
+                    self.assertTrue(all(timestamp >= before for timestamp in snapshot.timestamps.values()))
+                    self.assertEqual([request[1] for request in server.requests[:4]],
+                                     ['/api/monitoring/status', '/api/sms/sms-count', '/api/device/signal',
+                                      '/api/device/information'])
+                    self.assertEqual(modem.metrics.snapshot()[0]['/device/signal'][0].count, 1)
+                self.assertEqual(server.connections, 1)
+
+    def test_snapshot_errors(self):
+        with FakeHiLinkServer() as server:
+            server.routes[('GET', '/api/device/signal')] = b'<error><code>100002</code></error>'
+            with HuaweiE303Modem('eth0', '/', ip=server.address, transport='socket') as modem:
+                snapshot = modem.get_snapshot()
+                self.assertIsNone(snapshot.signal)
+                self.assertIsInstance(snapshot.errors['signal'], NotSupportedError)
+                self.assertEqual(snapshot.traffic['total_download'], modem.get_traffic_statistics()['total_download'])
+                self.assertEqual(snapshot.month_statistics, modem.get_month_statistics())
+                self.assertEqual(len(snapshot.timestamps), 6)
+                self.assertEqual(modem.get_snapshot([]).timestamps, {})
+                self.assertRaises(ValueError, modem.get_snapshot, ['weather'])
+
+    def test_snapshot_token_retry(self):
+        class TokenServer(FakeHiLinkServer):
+            def handle(self, method, path, headers, body):
+                if path == '/api/sms/sms-count' and headers.get('__RequestVerificationToken') != 'fresh':
+                    return b'<error><code>125002</code></error>'
+                if path == '/api/webserver/token':
+                    return b'<response><token>fresh</token></response>'
+                return FakeHiLinkServer.handle(self, method, path, headers, body)
+
+        with TokenServer(inbox=3) as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address, transport='socket') as modem:
+                snapshot = modem.get_snapshot(['status', 'message_count'])
+                self.assertEqual(snapshot.errors, {})
+                self.assertEqual(snapshot.message_count, {'count': 3, 'unread': 0})
+                self.assertEqual(modem.tokens.refresh_count, 1)
+
+    def test_snapshot_gate(self):
+        priorities = []
+        with FakeHiLinkServer() as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address, transport='socket') as modem:
+                acquire = modem.gate.acquire
+                modem.gate.acquire = lambda priority=PRIORITY_NORMAL: (priorities.append(priority), acquire(priority))
+                parse = modem._parse_api_response
+
+                def parse_released(response, parser=None):
+                    # The gate is free again while the responses are parsed
+                    self.assertFalse(modem.gate._busy)
+                    return parse(response, parser)
+
+                modem._parse_api_response = parse_released
+                modem.get_snapshot(['status', 'message_count'])
+                modem.get_snapshot(['status'])
+        self.assertEqual(priorities, [PRIORITY_BULK, PRIORITY_NORMAL])
+
+    def test_fleet_snapshots(self):
+        from huawei_3g.modem import get_snapshots
+        with FakeHiLinkFleet(4) as fleet:
+            modems = fleet.modems(transport='socket')
+            modems[3].ip = '127.0.0.1:1'
+            snapshots = get_snapshots(modems, ['status', 'message_count'])
+            for modem in modems:
+                modem.close()
+        self.assertEqual(sorted(snapshots), ['/fake/0', '/fake/1', '/fake/2', '/fake/3'])
+        self.assertEqual(snapshots['/fake/2'].message_count, {'count': 2, 'unread': 1})
+        self.assertIsInstance(snapshots['/fake/3'], IOError)
+
+
+class TestHuaweiE303ModemThreads(TestCase):
+    def hammer(self, serialize):
+        with FakeHiLinkServer(inbox=30, max_concurrent=1, latency=0.002) as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address, cache_ttls={}, serialize=serialize,
+                                 transport='socket', health=Health(failure_threshold=1000), workers=8) as modem:
+                futures = [modem.submit(modem.get_status) for i in range(40)]
+                futures += [modem.submit(modem.get_messages) for i in range(4)]
+                futures += [modem.submit(modem.delete_message, 40000 + i) for i in range(4)]
+                errors = []
+                for future in futures:
+                    try:
+                        future.result()
+                    except BusyError as error:
+                        errors.append(error)
+            return errors, server.errors
+
+    def test_serialized(self):
+        errors, server_errors = self.hammer(True)
+        self.assertEqual(errors, [])
+        self.assertEqual(server_errors, {})
+
+    def test_concurrent(self):
+        # Without the gate the simulated firmware rejects the overlapping requests
+        errors, server_errors = self.hammer(False)
+        self.assertGreater(len(errors), 0)
+        self.assertGreater(server_errors['100004'], 0)
+
+    def test_submit_after_close(self):
+        with FakeHiLinkServer() as server:
+            modem = HuaweiE303Modem('eth0', '/', ip=server.address)
+            self.assertEqual(modem.submit(modem.get_status).result()['status'], 'Connected')
+            modem.close()
+            # A closed modem starts a new pool for new work
+            self.assertEqual(modem.submit(modem.get_message_count).result()['count'], 2)
+            modem.close()
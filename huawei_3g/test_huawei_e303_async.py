@@ -0,0 +1,152 @@
+from unittest import TestCase
+import asyncio
+import time
+from huawei_3g.huawei_e303_async import AsyncHuaweiE303Modem, AsyncTransport, gather_status
+from huawei_3g.testing import FakeHiLinkServer, fake_message
+from huawei_3g.transport import BindError
+
+
+class SlowHiLinkServer(FakeHiLinkServer):
+    def __init__(self, delay):
+        FakeHiLinkServer.__init__(self)
+        self.delay = delay
+
+    def handle(self, method, path, headers, body):
+        time.sleep(self.delay)
+        return FakeHiLinkServer.handle(self, method, path, headers, body)
+
+
+class FailingDeleteServer(FakeHiLinkServer):
+    def handle(self, method, path, headers, body):
+        if path == '/api/sms/delete-sms' and b'<Index>20</Index>' in body:
+            return b'<error><code>100004</code></error>'
+        return FakeHiLinkServer.handle(self, method, path, headers, body)
+
+
+class TestAsyncHuaweiE303Modem(TestCase):
+    def test_api(self):
+        async def run(address):
+            transport = AsyncTransport()
+            modem = AsyncHuaweiE303Modem('eth0', '/', ip=address, transport=transport)
+            status = await modem.get_status()
+            count = await modem.get_message_count()
+            messages = await modem.get_messages(delete=True)
+            await transport.close()
+            return status, count, messages
+
+        with FakeHiLinkServer() as server:
+            status, count, messages = asyncio.run(run(server.address))
+            self.assertEqual(server.connections, 1)
+            self.assertEqual(server.requests[-1][1], '/api/sms/delete-sms')
+            self.assertEqual(server.requests[-1][2], b'<?xml version="1.0" encoding="UTF-8"?><request>'
+                                                     b'<Index>40000</Index><Index>40001</Index></request>')
+
+        self.assertDictEqual(status, {
+            'status': 'Connected',
+            'signal': 40,
+            'network_type': 'GPRS'
+        })
+        self.assertDictEqual(count, {'count': 2, 'unread': 1})
+        self.assertEqual([message.message_id for message in messages], ['40001', '40000'])
+
+    def test_delete_batches(self):
+        async def run(address):
+            transport = AsyncTransport()
+            modem = AsyncHuaweiE303Modem('eth0', '/', ip=address, transport=transport)
+            result = await modem.delete_messages(range(45), batch_size=20)
+            await transport.close()
+            return result
+
+        with FailingDeleteServer([fake_message(i) for i in range(45)]) as server:
+            result = asyncio.run(run(server.address))
+            delete_requests = [request for request in server.requests if request[1] == '/api/sms/delete-sms']
+            # The failing batch doesn't stop the last batch
+            self.assertEqual([request[2].count(b'<Index>') for request in delete_requests], [20, 5])
+            self.assertEqual(len(server.inbox), 20)
+        self.assertEqual(result.failed, list(range(20, 40)))
+        self.assertEqual(result.deleted, list(range(20)) + list(range(40, 45)))
+        self.assertEqual(str(result.errors[0]), 'Busy')
+
+    def test_drain_messages(self):
+        async def run(address):
+            transport = AsyncTransport()
+            modem = AsyncHuaweiE303Modem('eth0', '/', ip=address, transport=transport)
+            result = await modem.drain_messages(page_size=10, batch_size=5)
+            await transport.close()
+            return result
+
+        with FakeHiLinkServer([fake_message(i) for i in range(25)]) as server:
+            messages, result = asyncio.run(run(server.address))
+            paths = [request[1] for request in server.requests if request[1].startswith('/api/sms/')]
+            # The last page is deleted before the first page is read
+            self.assertLess(paths.index('/api/sms/delete-sms'), len(paths) - paths[::-1].index('/api/sms/sms-list') - 1)
+            self.assertEqual(server.inbox, [])
+        self.assertEqual([message.message_id for message in messages], [str(i) for i in range(25)])
+        self.assertEqual(sorted(result.deleted, key=int), [str(i) for i in range(25)])
+
+        with FailingDeleteServer([fake_message(i) for i in range(25)]) as server:
+            messages, result = asyncio.run(run(server.address))
+            self.assertEqual([message['Index'] for message in server.inbox], [str(i) for i in range(20, 25)])
+        self.assertEqual(len(messages), 25)
+        self.assertEqual(sorted(result.failed, key=int), [str(i) for i in range(20, 25)])
+
+    def test_late_interface(self):
+        async def run(address):
+            async with AsyncHuaweiE303Modem(None, '/', ip=address, bind='address') as modem:
+                self.assertIsNone(modem.binding)
+                with self.assertRaises(BindError):
+                    await modem.get_status()
+                modem.set_interface('lo')
+                status = await modem.get_status()
+                self.assertEqual(len(modem.transport._idle), 1)
+            # The modem created the transport, so closing the modem closed its connections
+            self.assertEqual(modem.transport._idle, {})
+            return status
+
+        with FakeHiLinkServer() as server:
+            self.assertEqual(asyncio.run(run(server.address))['status'], 'Connected')
+            self.assertEqual([request[1] for request in server.requests], ['/api/monitoring/status'])
+
+    def test_close_shared_transport(self):
+        async def run(address):
+            transport = AsyncTransport()
+            modem = AsyncHuaweiE303Modem('eth0', '/', ip=address, transport=transport)
+            await modem.get_status()
+            await modem.close()
+            # Other modems may still use the transport
+            self.assertEqual(len(transport._idle), 1)
+            await transport.close()
+
+        with FakeHiLinkServer() as server:
+            asyncio.run(run(server.address))
+
+    def test_token_retry(self):
+        class TokenServer(FakeHiLinkServer):
+            def handle(self, method, path, headers, body):
+                if path != '/api/webserver/token' and headers.get('__RequestVerificationToken') != '1':
+                    return b'<error><code>125001</code></error>'
+                return FakeHiLinkServer.handle(self, method, path, headers, body)
+
+        with TokenServer() as server:
+            modem = AsyncHuaweiE303Modem('eth0', '/', ip=server.address)
+            asyncio.run(modem.get_status())
+            self.assertEqual(modem.token, '1')
+
+    def test_gather_status(self):
+        servers = [SlowHiLinkServer(0.3).start() for i in range(4)]
+        servers.append(SlowHiLinkServer(2).start())
+        try:
+            transport = AsyncTransport()
+            modems = [AsyncHuaweiE303Modem('eth{}'.format(i), '/', ip=server.address, transport=transport)
+                      for i, server in enumerate(servers)]
+            start = time.time()
+            result = asyncio.run(gather_status(modems, timeout=1))
+            duration = time.time() - start
+        finally:
+            for server in servers:
+                server.stop()
+
+        self.assertLess(duration, 1.5)
+        for modem in modems[0:4]:
+            self.assertEqual(result[modem]['status'], 'Connected')
+        self.assertIsInstance(result[modems[4]], asyncio.TimeoutError)
@@ -0,0 +1,72 @@
+from unittest import TestCase
+import threading
+from huawei_3g.huawei_e303 import HuaweiE303Modem, ApiError
+from huawei_3g.metrics import Histogram, Metrics, export
+from huawei_3g.testing import FakeHiLinkServer
+
+
+class TestHistogram(TestCase):
+    def test_cumulative(self):
+        histogram = Histogram((0.1, 1))
+        for value in [0.05, 0.1, 0.5, 3]:
+            histogram.observe(value)
+        self.assertEqual(histogram.cumulative(), [(0.1, 2), (1, 3), (float("inf"), 4)])
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.sum, 3.65)
+
+
+class TestMetrics(TestCase):
+    def test_threads(self):
+        metrics = Metrics()
+
+        def record():
+            for i in range(100):
+                metrics.observe('/monitoring/status', 0.002, 0.0001)
+            metrics.error('/monitoring/status', '100004')
+
+        threads = [threading.Thread(target=record) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        record()
+
+        requests, errors = metrics.snapshot()
+        self.assertEqual(requests['/monitoring/status'][0].count, 500)
+        self.assertEqual(requests['/monitoring/status'][1].count, 500)
+        self.assertEqual(errors, {('/monitoring/status', '100004'): 5})
+        # The shards of the finished threads are folded in
+        self.assertEqual(len(metrics._shards), 1)
+        self.assertEqual(metrics.snapshot()[0]['/monitoring/status'][0].count, 500)
+
+    def test_short_lived_threads(self):
+        metrics = Metrics()
+        for i in range(50):
+            thread = threading.Thread(target=metrics.observe, args=('/sms/sms-list', 0.01, 0.001))
+            thread.start()
+            thread.join()
+        # Without reading the metrics the shards of finished threads are still folded together
+        self.assertEqual(len(metrics._shards), 1)
+        self.assertEqual(metrics.snapshot()[0]['/sms/sms-list'][0].count, 50)
+
+    def test_export(self):
+        with FakeHiLinkServer(busy_rate=1) as server:
+            with HuaweiE303Modem('eth0', '/sys/usb1/1-1', ip=server.address) as modem:
+                with self.assertRaises(ApiError) as context:
+                    modem.get_status()
+                self.assertEqual(context.exception.code, '100004')
+                server.busy_rate = 0
+                modem.get_status(cache=False)
+                modem.delete_messages([40000])
+                text = export([modem])
+
+        self.assertIn('# TYPE huawei_3g_request_transport_seconds histogram\n', text)
+        self.assertIn('huawei_3g_request_transport_seconds_bucket{endpoint="/monitoring/status",le="+Inf",'
+                      'modem="/sys/usb1/1-1"} 2\n', text)
+        self.assertIn('huawei_3g_request_parse_seconds_count{endpoint="/sms/delete-sms",modem="/sys/usb1/1-1"} 1\n',
+                      text)
+        self.assertIn('huawei_3g_errors_total{code="100004",endpoint="/monitoring/status",modem="/sys/usb1/1-1"} 1\n',
+                      text)
+        self.assertIn('huawei_3g_token_refreshes_total{modem="/sys/usb1/1-1"} 1\n', text)
+        self.assertIn('# TYPE huawei_3g_health_score gauge\n', text)
+        self.assertIn('huawei_3g_circuit_open{modem="/sys/usb1/1-1"} 0\n', text)
@@ -1,10 +1,17 @@
 from unittest import TestCase
 from mock import Mock, patch
+import os.path
+import shutil
+import tempfile
 import huawei_3g.modem as modem
 import huawei_3g.huawei_e303
+from huawei_3g.testing import FakeSysfs
 
 
 class TestFind(TestCase):
+    def setUp(self):
+        modem.refresh()
+
     @patch('builtins.open')
     @patch('glob.glob')
     def test_find(self, mock_glob, mock_open_call):
@@ -56,3 +63,53 @@ class TestFind(TestCase):
         mock_object.__enter__ = Mock(return_value=mock_file_handle)
         mock_object.__exit__ = Mock(return_value=False)
         return mock_object
+
+
+class TestScanner(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.sysfs = FakeSysfs(self.directory)
+        self.sysfs.add_device('1-1', interface='enp0s20u1')
+        self.sysfs.add_device('1-2', product='15dc', interface='enp0s20u2')
+        self.sysfs.add_device('1-3', vendor='8086')
+        self.sysfs.add_interface('eth0')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_find(self):
+        result = sorted(modem.find(self.directory), key=lambda device: device['path'])
+        self.assertEqual(len(result), 2)
+        self.assertEqual(result[0]['path'], os.path.join(self.directory, 'bus/usb/devices/1-1'))
+        self.assertEqual(result[0]['interface'], 'enp0s20u1')
+        self.assertEqual(result[0]['supported'], True)
+        self.assertEqual(result[1]['interface'], 'enp0s20u2')
+        self.assertEqual(result[1]['supported'], False)
+
+    def test_find_interface(self):
+        self.assertEqual(modem.find_interface(os.path.join(self.directory, 'bus/usb/devices/1-2'), self.directory),
+                         'enp0s20u2')
+        self.assertIsNone(modem.find_interface(os.path.join(self.directory, 'bus/usb/devices/1-3'), self.directory))
+
+    def test_cache(self):
+        scanner = modem.Scanner(self.directory)
+        self.assertEqual(len(scanner.find()), 2)
+        self.assertEqual(len(scanner.find()), 2)
+        self.assertEqual(scanner.scans, 1)
+
+        self.sysfs.add_device('1-4', interface='enp0s20u4')
+        self.assertEqual(len(scanner.find()), 3)
+        self.assertEqual(scanner.scans, 2)
+
+        self.sysfs.remove_device('1-1', 'enp0s20u1')
+        self.assertEqual(len(scanner.find()), 2)
+
+        scanner.refresh()
+        scanner.find()
+        self.assertEqual(scanner.scans, 4)
+
+    def test_load(self):
+        modems = modem.load(self.directory)
+        self.assertEqual(len(modems), 1)
+        self.assertEqual(modems[0].interface, 'enp0s20u1')
+        modems[0].close()
@@ -0,0 +1,137 @@
+from unittest import TestCase
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from huawei_3g.outbound import OutboundQueue
+from huawei_3g.testing import FakeHiLinkFleet, FakeHiLinkServer, read_fixture
+
+
+class TestOutboundQueue(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.database = os.path.join(self.directory, 'outbound.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_send(self):
+        with FakeHiLinkFleet(3) as fleet:
+            modems = fleet.modems()
+            with OutboundQueue(modems, self.database, rate=100, poll_interval=0.01) as queue:
+                ids = queue.enqueue_many([('+316{}'.format(i), 'Alert <{}> & more'.format(i)) for i in range(30)])
+                self.assertTrue(queue.join(5))
+                self.assertEqual(queue.counts(), {'sent': 30})
+                status = queue.status(ids[0])
+            sent = sorted(message for server in fleet.servers for message in server.sent)
+            for modem in modems:
+                modem.close()
+
+        self.assertEqual(status['status'], 'sent')
+        self.assertEqual(status['attempts'], 1)
+        self.assertIn(status['modem'], ['/fake/0', '/fake/1', '/fake/2'])
+        self.assertEqual(len(sent), 30)
+        self.assertIn((['+3160'], 'Alert <0> & more'), sent)
+        # Every modem did part of the work
+        self.assertTrue(all(server.sent for server in fleet.servers))
+
+    def test_busy(self):
+        with FakeHiLinkFleet(2, busy_rate=0.3, seed=1) as fleet:
+            modems = fleet.modems(cache_ttls={})
+            with OutboundQueue(modems, self.database, rate=100, poll_interval=0.01, max_attempts=10,
+                               retry_delay=0, busy_backoff=0.01) as queue:
+                queue.enqueue_many([('+31600', 'Test')] * 10)
+                self.assertTrue(queue.join(10))
+                self.assertEqual(queue.counts(), {'sent': 10})
+            self.assertIn('100004', fleet.errors)
+            for modem in modems:
+                modem.close()
+
+    def test_low_signal(self):
+        weak = read_fixture('status.xml').replace(b'<SignalIcon>2</SignalIcon>', b'<SignalIcon>0</SignalIcon>')
+        with FakeHiLinkFleet(2) as fleet:
+            fleet.servers[0].routes[('GET', '/api/monitoring/status')] = weak
+            modems = fleet.modems()
+            with OutboundQueue(modems, self.database, rate=100, poll_interval=0.01) as queue:
+                queue.enqueue_many([('+31600', 'Test')] * 5)
+                self.assertTrue(queue.join(5))
+            self.assertEqual(len(fleet.servers[0].sent), 0)
+            self.assertEqual(len(fleet.servers[1].sent), 5)
+            for modem in modems:
+                modem.close()
+
+    def test_failed(self):
+        class BrokenServer(FakeHiLinkServer):
+            def handle(self, method, path, headers, body):
+                if path == '/api/sms/send-sms':
+                    return b'<error><code>100003</code></error>'
+                return FakeHiLinkServer.handle(self, method, path, headers, body)
+
+        with BrokenServer() as server:
+            fleet = FakeHiLinkFleet(0)
+            fleet.servers.append(server)
+            modems = fleet.modems()
+            with OutboundQueue(modems, self.database, rate=100, poll_interval=0.01, max_attempts=2,
+                               retry_delay=0) as queue:
+                message_id = queue.enqueue('+31600', 'Test')
+                self.assertTrue(queue.join(5))
+                self.assertEqual(queue.status(message_id), {
+                    'status': 'failed', 'attempts': 2, 'modem': '/fake/0', 'error': 'Access denied'})
+            modems[0].close()
+
+    def test_send_status_error(self):
+        class BrokenStatusServer(FakeHiLinkServer):
+            def handle(self, method, path, headers, body):
+                if path == '/api/sms/send-status':
+                    return b'<error><code>100003</code></error>'
+                return FakeHiLinkServer.handle(self, method, path, headers, body)
+
+        with BrokenStatusServer() as server:
+            fleet = FakeHiLinkFleet(0)
+            fleet.servers.append(server)
+            modems = fleet.modems(cache_ttls={})
+            with OutboundQueue(modems, self.database, rate=100, poll_interval=0.01, retry_delay=0,
+                               busy_backoff=0.01) as queue:
+                message_id = queue.enqueue('+31600', 'Test')
+                self.assertTrue(queue.join(5))
+                self.assertEqual(queue.status(message_id), {
+                    'status': 'unknown', 'attempts': 1, 'modem': '/fake/0', 'error': 'Access denied'})
+            # The modem accepted the message, it isn't sent again
+            self.assertEqual(len(server.sent), 1)
+            modems[0].close()
+
+    def test_stop_while_sending(self):
+        with FakeHiLinkServer(send_time=0.5) as server:
+            fleet = FakeHiLinkFleet(0)
+            fleet.servers.append(server)
+            modems = fleet.modems(cache_ttls={})
+            queue = OutboundQueue(modems, self.database, rate=100, poll_interval=0.1).start()
+            message_id = queue.enqueue('+31600', 'Test')
+            while not server.sent:
+                time.sleep(0.01)
+            del server.requests[:]
+            queue.stop()
+            # The worker finished the message and kept polling at the poll interval
+            self.assertEqual(queue.status(message_id)['status'], 'sent')
+            polls = [request for request in server.requests if request[1] == '/api/sms/send-status']
+            self.assertLessEqual(len(polls), 8)
+            queue.close()
+            modems[0].close()
+
+    def test_durable(self):
+        queue = OutboundQueue([], self.database)
+        first, second = queue.enqueue_many([('+31600', 'First'), ('+31600', 'Second')])
+        queue.close()
+
+        # Simulate a crash while the second message was being sent
+        connection = sqlite3.connect(self.database)
+        with connection:
+            connection.execute("UPDATE outbound SET status = 'sending' WHERE id = ?", (second,))
+        connection.close()
+
+        queue = OutboundQueue([], self.database)
+        self.assertEqual(queue.counts(), {'queued': 2})
+        self.assertEqual(queue.status(first)['status'], 'queued')
+        self.assertIsNone(queue.status(1000))
+        queue.close()
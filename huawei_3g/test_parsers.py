@@ -0,0 +1,78 @@
+from unittest import TestCase
+import datetime
+from huawei_3g.parsers import FastParser, XmltodictParser, ErrorRecord, get_parser
+from huawei_3g.testing import read_fixture
+
+
+class TestParsers(TestCase):
+    parsers = [FastParser(), XmltodictParser()]
+
+    def test_status(self):
+        for parser in self.parsers:
+            status = parser.status(read_fixture("status.xml"))
+            self.assertEqual(status.connection_status, 901)
+            self.assertEqual(status.signal_icon, 2)
+            self.assertEqual(status.network_type, 2)
+
+    def test_message_count(self):
+        for parser in self.parsers:
+            count = parser.message_count(read_fixture("sms-count.xml"))
+            self.assertEqual(count.local_inbox, 2)
+            self.assertEqual(count.local_unread, 1)
+            self.assertEqual(count.local_outbox, 0)
+
+    def test_traffic(self):
+        for parser in self.parsers:
+            traffic = parser.traffic(read_fixture("traffic-statistics.xml"))
+            self.assertEqual(traffic.connect_time, 4127)
+            self.assertEqual(traffic.download_rate, 2512)
+            self.assertEqual(traffic.total_download, 612390847)
+            self.assertEqual(traffic.total_connect_time, 251883)
+
+            month = parser.month_statistics(read_fixture("month-statistics.xml"))
+            self.assertEqual(month.download, 148233002)
+            self.assertEqual(month.duration, 61873)
+            self.assertEqual(month.last_clear, '2015-9-1')
+
+    def test_messages(self):
+        for parser in self.parsers:
+            messages = parser.messages(read_fixture("sms-list-2.xml"))
+            self.assertEqual([message.message_id for message in messages], ['40001', '40000'])
+            self.assertEqual(messages[0].message, 'Test 2')
+            self.assertEqual(messages[0].sender, '+31617000000')
+            self.assertEqual(messages[0].receive_time, datetime.datetime(2015, 9, 8, 11, 3, 23))
+            self.assertFalse(messages[0].read)
+            self.assertTrue(messages[1].read)
+            self.assertEqual(messages[1].save_type, 4)
+            self.assertEqual(messages[1].sms_type, 1)
+            self.assertEqual(messages[1].sca, '')
+
+            messages = parser.messages(read_fixture("sms-list-1.xml"))
+            self.assertEqual([message.message_id for message in messages], ['40000'])
+
+            messages = parser.messages(b'<response><Count>0</Count><Messages></Messages></response>')
+            self.assertEqual(messages, [])
+
+    def test_error(self):
+        for parser in self.parsers:
+            for parse in [parser.status, parser.message_count, parser.messages]:
+                error = parse(b'<?xml version="1.0" encoding="UTF-8"?><error><code>100004</code><message/></error>')
+                self.assertIsInstance(error, ErrorRecord)
+                self.assertEqual(error.code, '100004')
+
+    def test_empty_fields(self):
+        for parser in self.parsers:
+            status = parser.status(b'<response><ConnectionStatus>902</ConnectionStatus><SignalIcon></SignalIcon>'
+                                   b'<CurrentNetworkType>0</CurrentNetworkType></response>')
+            self.assertEqual(status.signal_icon, 0)
+
+    def test_get_parser(self):
+        self.assertIsInstance(get_parser('fast'), FastParser)
+        self.assertIsInstance(get_parser('xmltodict'), XmltodictParser)
+
+    def test_early_exit(self):
+        # Everything after the last field of the record is never parsed, so a broken tail goes unnoticed
+        payload = read_fixture("status.xml").replace(
+            b"</response>", b"<Padding>" + b"x" * 4096 + b"</Padding><broken></response>")
+        self.assertEqual(FastParser().status(payload).signal_icon, 2)
+        self.assertRaises(Exception, XmltodictParser().status, payload)
@@ -0,0 +1,25 @@
+from unittest import TestCase
+import time
+from huawei_3g.ratelimit import TokenBucket
+
+
+class TestTokenBucket(TestCase):
+    def test_burst(self):
+        bucket = TokenBucket(10, burst=3)
+        self.assertEqual([bucket.take() for i in range(3)], [0, 0, 0])
+        wait = bucket.take()
+        self.assertTrue(0 < wait <= 0.1)
+
+    def test_refund(self):
+        bucket = TokenBucket(1)
+        self.assertEqual(bucket.take(), 0)
+        bucket.refund()
+        self.assertEqual(bucket.take(), 0)
+
+    def test_acquire(self):
+        bucket = TokenBucket(50)
+        bucket.take()
+        start = time.monotonic()
+        self.assertTrue(bucket.acquire())
+        self.assertGreaterEqual(time.monotonic() - start, 0.015)
+        self.assertFalse(bucket.acquire(timeout=0.001))
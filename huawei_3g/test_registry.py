@@ -0,0 +1,130 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import time
+from huawei_3g.registry import ModemRegistry, parse_uevent
+from huawei_3g.testing import FakeSysfs
+from huawei_3g.transport import BindError
+
+
+def uevent(action, subsystem, devpath):
+    return "{0}@{2}\0ACTION={0}\0DEVPATH={2}\0SUBSYSTEM={1}\0SEQNUM=1\0".format(action, subsystem, devpath).encode()
+
+
+class TestModemRegistry(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.sysfs = FakeSysfs(self.directory)
+        self.sysfs.add_device('1-1', interface='wwan0')
+        self.added = []
+        self.removed = []
+        self.registry = ModemRegistry(self.directory, on_add=self.added.append, on_remove=self.removed.append)
+
+    def tearDown(self):
+        self.registry.close()
+        shutil.rmtree(self.directory)
+
+    def test_parse_uevent(self):
+        event = parse_uevent(uevent('add', 'usb', '/devices/pci0000:00/usb1/1-2'))
+        self.assertEqual(event['ACTION'], 'add')
+        self.assertEqual(event['SUBSYSTEM'], 'usb')
+        self.assertEqual(event['DEVPATH'], '/devices/pci0000:00/usb1/1-2')
+
+    def test_uevents(self):
+        self.registry.rescan()
+        self.assertEqual(len(self.added), 1)
+        first = self.registry.modems[0]
+
+        # The USB device shows up before its network interface
+        self.sysfs.add_device('1-2')
+        self.assertTrue(self.registry.handle_uevent(uevent('add', 'usb', '/devices/pci0000:00/usb1/1-2')))
+        self.assertEqual(len(self.added), 2)
+        second = self.added[1]
+        self.assertIsNone(second.interface)
+        self.sysfs.add_interface('wwan1', second.path + '/1-2:1.0')
+        self.registry.handle_uevent(uevent('add', 'net', '/devices/pci0000:00/usb1/1-2/1-2:1.0/net/wwan1'))
+        self.assertEqual(second.interface, 'wwan1')
+        self.assertEqual(len(self.added), 2)
+
+        self.assertFalse(self.registry.handle_uevent(uevent('add', 'block', '/devices/virtual/block/loop0')))
+
+        self.sysfs.remove_device('1-1', 'wwan0')
+        self.registry.handle_uevent(uevent('remove', 'usb', '/devices/pci0000:00/usb1/1-1'))
+        self.assertEqual(self.removed, [first])
+        self.assertEqual(self.registry.modems, [second])
+        self.assertIs(self.registry.get(second.path), second)
+
+    def test_poll(self):
+        self.registry.poll_interval = 0.05
+        self.registry.start(method='poll')
+        self.assertEqual(self.registry.method, 'poll')
+        modem = self.registry.modems[0]
+
+        self.sysfs.add_device('1-2', interface='wwan1')
+        time.sleep(0.3)
+        self.assertEqual(len(self.registry.modems), 2)
+        self.assertIs(self.registry.get(modem.path), modem)
+
+    def test_poll_errors(self):
+        def add(modem):
+            self.added.append(modem)
+            if len(self.added) == 2:
+                raise RuntimeError("Callback failed")
+
+        self.registry.on_add = add
+        self.registry.poll_interval = 0.05
+        self.registry.start(method='poll')
+        self.sysfs.add_device('1-2', interface='wwan1')
+        time.sleep(0.3)
+        self.assertIsInstance(self.registry.last_error, RuntimeError)
+
+        # The registry keeps working after the error
+        self.sysfs.add_device('1-3', interface='wwan2')
+        time.sleep(0.3)
+        self.assertEqual(len(self.registry.modems), 3)
+        self.assertEqual(len(self.added), 3)
+
+    def test_callback_errors(self):
+        def add(modem):
+            self.added.append(modem)
+            raise RuntimeError("Callback failed")
+
+        def remove(modem):
+            self.removed.append(modem)
+            raise RuntimeError("Callback failed")
+
+        self.registry.on_add = add
+        self.registry.on_remove = remove
+        self.sysfs.add_device('1-2', interface='wwan1')
+        self.registry.rescan()
+        # Every modem is announced although the callback raised for the first one
+        self.assertEqual(sorted(self.added, key=lambda modem: modem.path),
+                         sorted(self.registry.modems, key=lambda modem: modem.path))
+        self.assertEqual(len(self.added), 2)
+        self.assertIsInstance(self.registry.last_error, RuntimeError)
+
+        self.sysfs.remove_device('1-1', 'wwan0')
+        self.sysfs.remove_device('1-2', 'wwan1')
+        self.registry.rescan()
+        self.assertEqual(len(self.removed), 2)
+        self.assertEqual(self.registry.modems, [])
+
+    def test_device_removed_during_scan(self):
+        # A device whose files disappear while it's being read
+        device = self.sysfs.add_device('1-2')
+        os.remove(os.path.join(device, 'idVendor'))
+        os.symlink(os.path.join(self.directory, 'gone'), os.path.join(device, 'idVendor'))
+        self.registry.rescan()
+        self.assertEqual(len(self.registry.modems), 1)
+
+    def test_bind_late_interface(self):
+        registry = ModemRegistry(self.directory, on_add=self.added.append, bind='address')
+        self.sysfs.add_device('1-2')
+        registry.rescan()
+        # The fake wwan0 has no address to bind to, the other modem is bound once its interface shows up
+        self.assertIsInstance(registry.last_error, BindError)
+        self.assertEqual(len(registry.modems), 1)
+        self.assertIsNone(registry.modems[0].interface)
+        self.assertIsNone(registry.modems[0].binding)
+        registry.close()
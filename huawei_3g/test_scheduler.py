@@ -0,0 +1,78 @@
+from unittest import TestCase
+import time
+from huawei_3g.scheduler import PollScheduler
+from huawei_3g.testing import FakeHiLinkFleet, FakeHiLinkServer, fake_message
+from huawei_3g.huawei_e303 import HuaweiE303Modem
+
+
+def drain(events):
+    result = []
+    while not events.empty():
+        result.append(events.get())
+    return result
+
+
+class TestPollScheduler(TestCase):
+    def wait_for(self, condition, timeout=3):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("Timeout")
+            time.sleep(0.01)
+
+    def test_events(self):
+        with FakeHiLinkServer() as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address) as modem:
+                with PollScheduler([modem], min_interval=0.02, max_interval=0.1, jitter=0) as scheduler:
+                    self.wait_for(lambda: scheduler.polls >= 1)
+                    events = drain(scheduler.events)
+                    self.assertEqual([event.kind for event in events], ['status', 'signal', 'network_type', 'messages'])
+                    self.assertEqual(events[0].new, 'Connected')
+                    self.assertEqual(events[3].new_messages, 2)
+
+                    self.wait_for(lambda: scheduler.polls >= 3)
+                    self.assertEqual(drain(scheduler.events), [])
+                    self.assertGreater(scheduler.interval(modem), 0.02)
+
+                    server.inbox = [fake_message(40002, read=False)] + server.inbox
+                    self.wait_for(lambda: not scheduler.events.empty())
+                    event = scheduler.events.get()
+                    self.assertEqual(event.kind, 'messages')
+                    self.assertEqual(event.new_messages, 1)
+                    self.assertEqual(event.new, {'count': 3, 'unread': 2})
+
+    def test_busy_backoff(self):
+        with FakeHiLinkServer(busy_rate=1) as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address) as modem:
+                with PollScheduler([modem], min_interval=0.01, max_interval=0.08, jitter=0) as scheduler:
+                    self.wait_for(lambda: scheduler.polls >= 4)
+                    self.assertEqual(scheduler.interval(modem), 0.08)
+                    server.busy_rate = 0
+                    self.wait_for(lambda: scheduler.events.qsize() >= 2)
+                    events = drain(scheduler.events)
+                    self.assertEqual(events[0].kind, 'error')
+                    self.assertEqual(str(events[0].new), 'Busy')
+                    self.assertEqual(events[1].kind, 'recovered')
+
+    def test_budget(self):
+        with FakeHiLinkFleet(10) as fleet:
+            modems = fleet.modems()
+            with PollScheduler(modems, min_interval=0.01, max_interval=0.01, budget=40) as scheduler:
+                time.sleep(0.5)
+            # The burst of the bucket plus 40 requests per second
+            self.assertLessEqual(fleet.requests, 40 + 20 + 4)
+            self.assertGreaterEqual(fleet.requests, 40)
+            for modem in modems:
+                modem.close()
+
+    def test_remove(self):
+        with FakeHiLinkServer() as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address) as modem:
+                with PollScheduler(min_interval=0.01, max_interval=0.01, on_event=lambda event: None) as scheduler:
+                    scheduler.add_modem(modem)
+                    self.wait_for(lambda: scheduler.polls >= 2)
+                    scheduler.remove_modem(modem)
+                    time.sleep(0.05)
+                    requests = len(server.requests)
+                    time.sleep(0.05)
+                    self.assertEqual(len(server.requests), requests)
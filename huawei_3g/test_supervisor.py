@@ -0,0 +1,95 @@
+from unittest import TestCase
+import os
+import signal
+import time
+from huawei_3g.datastructures import SMSMessage
+from huawei_3g.supervisor import FleetSupervisor, FleetResult
+from huawei_3g.testing import FakeHiLinkFleet
+
+
+def fake_devices(fleet):
+    return [{"path": "/fake/{}".format(i), "supported": True, "productId": "14dc", "name": "Huawei E303",
+             "class": "huawei_e303", "interface": "lo", "ip": server.address}
+            for i, server in enumerate(fleet.servers)]
+
+
+class TestFleetSupervisor(TestCase):
+    def wait_for(self, supervisor, condition, timeout=20):
+        results = []
+        deadline = time.monotonic() + timeout
+        while not condition(results):
+            self.assertLess(time.monotonic(), deadline, "Timeout, got {!r}".format(results[-5:]))
+            try:
+                results.append(supervisor.results.get(timeout=0.1))
+            except Exception:
+                pass
+        return results
+
+    def test_poll(self):
+        with FakeHiLinkFleet(5, inbox=3) as fleet:
+            devices = fake_devices(fleet)
+            discover = lambda: list(devices)
+            with FleetSupervisor(processes=2, interval=0.1, discover=discover, discover_interval=0.1,
+                                 messages=True, delete=True) as supervisor:
+                results = self.wait_for(supervisor, lambda results: set(
+                    result.path for result in results if result.kind == "messages") == set(
+                    device["path"] for device in devices))
+                self.assertEqual(sorted(supervisor.assignments.values()), [0, 0, 0, 1, 1])
+                messages = [result for result in results if result.kind == "messages"]
+                self.assertEqual([len(result.value) for result in messages], [3] * 5)
+                self.assertIsInstance(messages[0].value[0], SMSMessage)
+
+                # Removing modems moves the modems between the workers so they stay balanced
+                del devices[0:3]
+                deadline = time.monotonic() + 5
+                while len(supervisor.assignments) != 2:
+                    self.assertLess(time.monotonic(), deadline)
+                    time.sleep(0.05)
+                self.assertEqual(sorted(supervisor.assignments.values()), [0, 1])
+            self.assertEqual([len(server.inbox) for server in fleet.servers], [0] * 5)
+
+    def test_restart(self):
+        with FakeHiLinkFleet(2) as fleet:
+            devices = fake_devices(fleet)
+            with FleetSupervisor(processes=2, interval=0.1, discover=lambda: devices) as supervisor:
+                self.wait_for(supervisor, lambda results: len(set(result.path for result in results)) == 2)
+                crashed = supervisor.assignments["/fake/0"]
+                os.kill(supervisor._workers[crashed].process.pid, signal.SIGKILL)
+                deadline = time.monotonic() + 10
+                while supervisor.restarts == 0:
+                    self.assertLess(time.monotonic(), deadline)
+                    time.sleep(0.05)
+                while not supervisor.results.empty():
+                    supervisor.results.get()
+                self.wait_for(supervisor, lambda results: "/fake/0" in set(result.path for result in results))
+                self.assertEqual(supervisor.restarts, 1)
+
+    def test_errors(self):
+        with FakeHiLinkFleet(1) as fleet:
+            fleet.servers[0].routes[('GET', '/api/monitoring/status')] = b'<error><code>100002</code></error>'
+            batches = []
+            with FleetSupervisor(processes=1, interval=0.1, discover=lambda: fake_devices(fleet),
+                                 on_results=batches.append) as supervisor:
+                deadline = time.monotonic() + 20
+                while not batches:
+                    self.assertLess(time.monotonic(), deadline)
+                    time.sleep(0.05)
+            result = batches[0][0]
+            self.assertIsInstance(result, FleetResult)
+            self.assertEqual(result.kind, "error")
+            self.assertEqual(result.value, {"type": "NotSupportedError", "message": "No support", "code": "100002"})
+
+    def test_create_errors(self):
+        with FakeHiLinkFleet(3) as fleet:
+            devices = fake_devices(fleet)
+            # Binding fails for a missing interface and an unknown class has no modem object
+            devices[1]["interface"] = "missing0"
+            devices[2]["class"] = "unknown"
+            with FleetSupervisor(processes=1, interval=0.1, discover=lambda: devices,
+                                 modem_options={"bind": "address"}) as supervisor:
+                results = self.wait_for(supervisor, lambda results: set(
+                    result.path for result in results if result.kind == "error") == {"/fake/1", "/fake/2"} and
+                    "/fake/0" in set(result.path for result in results if result.kind == "status"))
+                self.assertEqual(supervisor.restarts, 0)
+            errors = dict((result.path, result.value["type"]) for result in results if result.kind == "error")
+            self.assertEqual(errors, {"/fake/1": "BindError", "/fake/2": "ValueError"})
@@ -0,0 +1,99 @@
+from unittest import TestCase
+import os.path
+import shutil
+import tempfile
+from huawei_3g.huawei_e303 import HuaweiE303Modem
+from huawei_3g.sync import MessageSync
+from huawei_3g.testing import FakeHiLinkServer, fake_message
+
+
+class TestMessageSync(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.database = os.path.join(self.directory, 'sync.sqlite')
+        self.server = FakeHiLinkServer([fake_message(40000), fake_message(40001)]).start()
+        self.modem = HuaweiE303Modem('eth0', '/sys/bus/usb/devices/1-1', ip=self.server.address)
+
+    def tearDown(self):
+        self.modem.close()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def test_poll(self):
+        sync = MessageSync(self.modem, self.database)
+        self.assertEqual([message.message_id for message in sync.poll()], ['40000', '40001'])
+        self.assertEqual(sync.high_water, 40001)
+
+        # Nothing changed, only the message count is requested
+        del self.server.requests[:]
+        self.assertEqual(sync.poll(), [])
+        self.assertEqual([request[1] for request in self.server.requests], ['/api/sms/sms-count'])
+
+        self.server.inbox.insert(0, fake_message(40002, 'New'))
+        del self.server.requests[:]
+        self.assertEqual([message.message for message in sync.poll()], ['New'])
+        # The count of the poll is reused to list the inbox
+        self.assertEqual([request[1] for request in self.server.requests], ['/api/sms/sms-count', '/api/sms/sms-list'])
+        sync.close()
+
+    def test_persistent(self):
+        MessageSync(self.modem, self.database).poll()
+        self.server.inbox.insert(0, fake_message(40002, 'New'))
+        sync = MessageSync(self.modem, self.database)
+        self.assertEqual([message.message_id for message in sync.poll()], ['40002'])
+
+        other_modem = MessageSync(self.modem, self.database, key='other')
+        self.assertEqual(len(other_modem.poll()), 3)
+
+    def test_poll_delete(self):
+        sync = MessageSync(self.modem, self.database)
+        self.assertEqual(len(sync.poll(delete=True)), 2)
+        self.assertEqual(self.server.inbox, [])
+
+        self.server.inbox.append(fake_message(40002, 'New'))
+        self.assertEqual([message.message_id for message in sync.poll(delete=True)], ['40002'])
+        self.assertEqual(sync.high_water, 40002)
+
+    def test_poll_delete_failure(self):
+        handle = self.server.handle
+        failures = [1]
+
+        def failing_delete(method, path, headers, body):
+            if path == '/api/sms/delete-sms' and failures:
+                failures.pop()
+                return b'<error><code>100004</code></error>'
+            return handle(method, path, headers, body)
+
+        self.server.handle = failing_delete
+        sync = MessageSync(self.modem, self.database)
+        self.assertEqual(len(sync.poll(delete=True)), 2)
+        self.assertEqual(len(self.server.inbox), 2)
+
+        self.assertEqual(sync.poll(delete=True), [])
+        self.assertEqual(self.server.inbox, [])
+
+    def test_message_arrives_between_pages(self):
+        self.server.inbox = [fake_message(40000 + i) for i in range(25)]
+        handle = self.server.handle
+
+        def arriving_message(method, path, headers, body):
+            response = handle(method, path, headers, body)
+            if path == '/api/sms/sms-list' and b'<PageIndex>1</PageIndex>' in body:
+                self.server.inbox.insert(0, fake_message(40100, 'New'))
+            return response
+
+        self.server.handle = arriving_message
+        sync = MessageSync(self.modem, self.database)
+        messages = sync.poll()
+        self.assertEqual(len(messages), 25)
+        self.assertEqual(len(set(message.message_id for message in messages)), 25)
+        self.assertEqual(sync.high_water, 40024)
+
+        self.server.handle = handle
+        self.assertEqual([message.message for message in sync.poll()], ['New'])
+
+    def test_reset(self):
+        sync = MessageSync(self.modem, self.database)
+        sync.poll()
+        sync.reset()
+        self.assertEqual(len(sync.poll()), 2)
@@ -0,0 +1,73 @@
+from unittest import TestCase
+from huawei_3g.huawei_e303 import HuaweiE303Modem
+from huawei_3g.testing import FakeHiLinkServer
+from huawei_3g.traffic import RingArchive, TrafficSeries, TrafficCollector
+
+
+def traffic(download, upload=0, connect_time=0, download_rate=0, upload_rate=0):
+    return {'total_download': download, 'total_upload': upload, 'total_connect_time': connect_time,
+            'download_rate': download_rate, 'upload_rate': upload_rate}
+
+
+class TestRingArchive(TestCase):
+    def test_ring(self):
+        archive = RingArchive(10, 3)
+        for timestamp in range(0, 60, 5):
+            archive.add(timestamp, 100, 10, timestamp, 1, 5, 5)
+        # Only the last three slots are kept
+        self.assertEqual(sorted(archive.buckets), [3, 4, 5])
+        self.assertEqual(archive.aggregate(0, 60)['download'], 600)
+        self.assertEqual(archive.aggregate(40, 50), {
+            'download': 200, 'upload': 20, 'avg_download_rate': 20.0, 'avg_upload_rate': 2.0,
+            'max_download_rate': 45, 'max_upload_rate': 1, 'seconds': 10, 'connected': 10})
+        self.assertTrue(archive.covers(30))
+        self.assertFalse(archive.covers(29))
+
+        # Late samples for slots that were overwritten are dropped
+        archive.add(5, 100, 10, 0, 0, 5, 5)
+        self.assertEqual(archive.aggregate(0, 60)['download'], 600)
+
+
+class TestTrafficSeries(TestCase):
+    def test_series(self):
+        series = TrafficSeries(((60, 10), (3600, 24)))
+        series.add(0, traffic(1000))
+        self.assertEqual(series.window(60, 60)['download'], 0)
+        for minute in range(1, 121):
+            series.add(minute * 60, traffic(1000 + minute * 6000, connect_time=minute * 60, download_rate=100))
+
+        last_minutes = series.window(300, 7200)
+        self.assertEqual(last_minutes['download'], 5 * 6000)
+        self.assertEqual(last_minutes['avg_download_rate'], 100)
+        # Ten minutes per minute are kept, longer windows use the hourly archive
+        self.assertEqual(series.window(7200, 7200)['download'], 120 * 6000)
+        self.assertEqual(series.window(7200, 7200)['connected'], 7200)
+
+    def test_counter_reset(self):
+        series = TrafficSeries()
+        series.add(0, traffic(5000))
+        series.add(60, traffic(6000))
+        series.add(120, traffic(300))
+        self.assertEqual(series.window(180, 180)['download'], 1300)
+
+    def test_memory(self):
+        self.assertLess(TrafficSeries().nbytes, 16 * 1024)
+
+
+class TestTrafficCollector(TestCase):
+    def test_collector(self):
+        with FakeHiLinkServer() as server:
+            with HuaweiE303Modem('eth0', '/', ip=server.address) as modem:
+                self.assertEqual(modem.get_traffic_statistics()['total_download'], 612390847)
+                self.assertEqual(modem.get_month_statistics()['last_clear'], '2015-9-1')
+
+                collector = TrafficCollector([modem])
+                collector.sample(now=1000)
+                route = ('GET', '/api/monitoring/traffic-statistics')
+                server.routes[route] = server.routes[route].replace(b'612390847', b'612490847')
+                collector.sample(now=1060)
+                self.assertEqual(collector.window(modem, 60, now=1060)['download'], 100000)
+
+                server.busy_rate = 1
+                collector.sample(now=1120)
+                self.assertEqual(str(collector.errors['/']), 'Busy')
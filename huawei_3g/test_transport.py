@@ -0,0 +1,200 @@
+from unittest import TestCase
+import asyncio
+import os
+import socket
+import tempfile
+import threading
+from huawei_3g.huawei_e303 import HuaweiE303Modem
+from huawei_3g.huawei_e303_async import AsyncHuaweiE303Modem
+from huawei_3g.testing import FakeHiLinkServer, fake_inbox
+from huawei_3g.transport import Binding, BindError, interface_address, get_transport, SocketTransport, \
+    RecordingTransport, ReplayTransport, TransportError
+
+
+class TestBinding(TestCase):
+    def test_interface_address(self):
+        self.assertEqual(interface_address('lo'), '127.0.0.1')
+        self.assertIsNone(interface_address('doesnotexist0'))
+
+    def test_binding(self):
+        binding = Binding('lo')
+        self.assertIn(binding.method, ['device', 'address'])
+        binding.create_socket().close()
+
+        binding = Binding('lo', 'address')
+        self.assertEqual(binding.source_address, '127.0.0.1')
+
+    def test_bind_error(self):
+        self.assertRaises(BindError, Binding, None)
+        self.assertRaises(BindError, Binding, 'doesnotexist0')
+        self.assertRaises(BindError, Binding, 'doesnotexist0', 'address')
+        self.assertRaises(BindError, Binding, 'lo', 'magic')
+
+    def test_bound_modem(self):
+        with FakeHiLinkServer() as server:
+            for method in ['auto', 'address']:
+                with HuaweiE303Modem('lo', '/', ip=server.address, bind=method) as modem:
+                    self.assertEqual(modem.get_status()['status'], 'Connected')
+
+    def test_bound_async_modem(self):
+        with FakeHiLinkServer() as server:
+            modem = AsyncHuaweiE303Modem('lo', '/', ip=server.address, bind='auto')
+            status = asyncio.run(modem.get_status())
+            self.assertEqual(status['status'], 'Connected')
+
+    def test_set_interface(self):
+        with FakeHiLinkServer() as server:
+            with HuaweiE303Modem('lo', '/', ip=server.address, bind='address') as modem:
+                transport = modem.transport
+                modem.set_interface('lo')
+                self.assertIsNot(modem.transport, transport)
+                self.assertEqual(modem.get_status()['status'], 'Connected')
+                self.assertRaises(BindError, modem.set_interface, 'doesnotexist0')
+
+    def test_late_interface(self):
+        with FakeHiLinkServer() as server:
+            # The network interface shows up after the USB device
+            with HuaweiE303Modem(None, '/', ip=server.address, bind='address') as modem:
+                self.assertIsNone(modem.binding)
+                self.assertRaises(BindError, modem.get_status)
+                self.assertRaises(BindError, modem.get_snapshot)
+                self.assertEqual(server.requests, [])
+                modem.set_interface('lo')
+                self.assertEqual(modem.binding.source_address, '127.0.0.1')
+                self.assertEqual(modem.get_status()['status'], 'Connected')
+
+
+def _raw_server(responses):
+    """ Answer every connection with the next canned response and close it, returns the address """
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(5)
+
+    def serve():
+        for response in responses:
+            connection = listener.accept()[0]
+            connection.recv(65536)
+            connection.sendall(response)
+            connection.close()
+        listener.close()
+
+    thread = threading.Thread(target=serve)
+    thread.daemon = True
+    thread.start()
+    return "127.0.0.1:{}".format(listener.getsockname()[1])
+
+
+class TestSocketTransport(TestCase):
+    def test_modem(self):
+        with FakeHiLinkServer(inbox=fake_inbox(30, unread=3)) as server:
+            with HuaweiE303Modem('lo', '/', ip=server.address, transport="socket", cache_ttls={}) as modem:
+                self.assertEqual(modem.get_status()['status'], 'Connected')
+                self.assertEqual(modem.get_message_count()['unread'], 3)
+                self.assertEqual(len(modem.get_messages(delete=True)), 30)
+                self.assertEqual(modem.get_message_count()['count'], 0)
+            self.assertEqual(server.connections, 1)
+
+    def test_bound_modem(self):
+        with FakeHiLinkServer() as server:
+            with HuaweiE303Modem('lo', '/', ip=server.address, transport="socket", bind='address') as modem:
+                transport = modem.transport
+                modem.set_interface('lo')
+                self.assertIsNot(modem.transport, transport)
+                self.assertEqual(modem.get_status()['status'], 'Connected')
+
+    def test_large_response(self):
+        transport = SocketTransport(buffer_size=16)
+        with FakeHiLinkServer(inbox=fake_inbox(50)) as server:
+            small = transport.request("GET", server.address, "/api/monitoring/status")
+            self.assertEqual(small.status_code, 200)
+            body = b"<request><PageIndex>1</PageIndex><ReadCount>50</ReadCount><BoxType>1</BoxType></request>"
+            response = transport.request("POST", server.address, "/api/sms/sms-list", body)
+            self.assertEqual(response.content.count(b"<Message>"), 50)
+        transport.close()
+
+    def test_pipeline(self):
+        transport = SocketTransport(buffer_size=64)
+        paths = ['/api/monitoring/status', '/api/sms/sms-count', '/api/device/information']
+        with FakeHiLinkServer() as server:
+            responses = list(transport.pipeline(server.address, [('GET', path, None, None) for path in paths]))
+            self.assertEqual([b'<SignalIcon>' in responses[0].content, b'<LocalInbox>' in responses[1].content,
+                              b'<Imei>' in responses[2].content], [True, True, True])
+            self.assertEqual(len(transport._idle[server.address]), 1)
+
+            # A pipeline that isn't read completely doesn't return its connection
+            pipeline = transport.pipeline(server.address, [('GET', path, None, None) for path in paths])
+            next(pipeline)
+            pipeline.close()
+            self.assertEqual(len(transport._idle[server.address]), 0)
+            self.assertEqual(transport.request('GET', server.address, paths[0]).content, responses[0].content)
+            self.assertEqual(server.connections, 2)
+        transport.close()
+
+    def test_chunked_and_close(self):
+        address = _raw_server([
+            b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n4\r\n<res\r\n9;x=y\r\nponse>OK<\r\n"
+            b"a\r\n/response>\r\n0\r\n\r\n",
+            b"HTTP/1.0 200 OK\r\n\r\n<response>OK</response>"
+        ])
+        transport = SocketTransport()
+        self.assertEqual(transport.request("GET", address, "/").content, b"<response>OK</response>")
+        # The first connection was closed by the server after the response, this retries on a new one
+        self.assertEqual(transport.request("GET", address, "/").content, b"<response>OK</response>")
+        self.assertRaises(TransportError, transport.request, "GET", address, "/")
+
+    def test_connection_refused(self):
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        address = "127.0.0.1:{}".format(listener.getsockname()[1])
+        listener.close()
+        self.assertRaises(TransportError, SocketTransport(retries=0).request, "GET", address, "/")
+        self.assertRaises(IOError, HuaweiE303Modem('lo', '/', ip=address, transport="socket").get_status)
+
+    def test_unknown_transport(self):
+        self.assertRaises(ValueError, get_transport, "carrier-pigeon")
+
+
+class TestReplayTransport(TestCase):
+    def test_record_and_replay(self):
+        with FakeHiLinkServer(inbox=fake_inbox(3)) as server:
+            recorder = RecordingTransport(get_transport("socket"))
+            with HuaweiE303Modem('lo', '/', ip=server.address, transport=recorder, cache_ttls={}) as modem:
+                status = modem.get_status()
+                messages = modem.get_messages(delete=True)
+                count = modem.get_message_count()
+
+        directory = tempfile.mkdtemp()
+        filename = os.path.join(directory, "session.json")
+        recorder.save(filename)
+        replay = ReplayTransport(filename)
+        os.remove(filename)
+        os.rmdir(directory)
+
+        with HuaweiE303Modem('lo', '/', ip="192.0.2.1", transport=replay, cache_ttls={}) as modem:
+            self.assertEqual(modem.get_status(), status)
+            replayed = modem.get_messages(delete=True)
+            self.assertEqual([message.message_id for message in replayed],
+                             [message.message_id for message in messages])
+            self.assertEqual(modem.get_message_count(), count)
+            # The last recorded response is repeated
+            self.assertEqual(modem.get_message_count(), count)
+        self.assertIn(("GET", "/api/monitoring/status", ""), replay.requests)
+
+    def test_missing_response(self):
+        replay = ReplayTransport([])
+        self.assertRaises(TransportError, replay.request, "GET", "modem", "/api/monitoring/status")
+
+    def test_replayed_once(self):
+        records = [{"method": "POST", "path": "/api/sms/sms-list", "body": body, "status_code": 200,
+                    "content": "<response>{}</response>".format(content)}
+                   for body, content in (("x", 1), ("x", 2), ("y", 3))]
+        replay = ReplayTransport(records)
+
+        def request(body):
+            return replay.request("POST", "modem", "/api/sms/sms-list", body).content
+
+        # The first response is used through the fallback, the exact match continues with the second one
+        self.assertEqual(request(b"z"), b"<response>1</response>")
+        self.assertEqual(request(b"x"), b"<response>2</response>")
+        self.assertEqual(request(b"x"), b"<response>2</response>")
+        self.assertEqual(request(b"z"), b"<response>3</response>")
@@ -0,0 +1,380 @@
+import os
+import os.path
+import random
+import re
+import shutil
+import threading
+import time
+from xml.sax.saxutils import escape, unescape
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def read_fixture(name):
+    """ Read a file from the huawei_3g/fixtures directory as bytes """
+    with open(os.path.join(FIXTURES, name), "rb") as fixture_file:
+        return fixture_file.read()
+
+
+def fake_message(index, content="Test", phone="+31617000000", date="2015-09-08 11:03:00", read=True):
+    """ Create a message for the inbox of a :class:`~huawei_3g.testing.FakeHiLinkServer` """
+    return {
+        "Smstat": "1" if read else "0",
+        "Index": str(index),
+        "Phone": phone,
+        "Content": content,
+        "Date": date,
+        "Sca": "",
+        "SaveType": "4",
+        "Priority": "0",
+        "SmsType": "1"
+    }
+
+
+def fake_inbox(size, unread=0):
+    """ Create an inbox with size messages, the newest unread messages first """
+    return [fake_message(40000 + size - i - 1, "Test {}".format(size - i), read=i >= unread) for i in range(size)]
+
+
+def render_error(code):
+    """ Render an error payload of the HiLink API """
+    return "<?xml version=\"1.0\" encoding=\"utf-8\"?>\n<error>\n<code>{}</code>\n<message></message>\n</error>" \
+        .format(code).encode("utf-8")
+
+
+def render_sms_list(messages):
+    """ Render a list of messages as the payload of /api/sms/sms-list """
+    parts = ["<?xml version=\"1.0\" encoding=\"utf-8\"?>\n<response>\n<Count>{}</Count>\n<Messages>\n"
+             .format(len(messages))]
+    for message in messages:
+        parts.append("<Message>")
+        for key, value in message.items():
+            parts.append("<{0}>{1}</{0}>".format(key, escape(value)))
+        parts.append("</Message>\n")
+    parts.append("</Messages>\n</response>")
+    return "".join(parts).encode("utf-8")
+
+
+def render_sms_count(messages):
+    """ Render the payload of /api/sms/sms-count for an inbox """
+    unread = len([message for message in messages if message["Smstat"] == "0"])
+    return ("<?xml version=\"1.0\" encoding=\"utf-8\"?>\n<response>\n"
+            "<LocalUnread>{}</LocalUnread>\n<LocalInbox>{}</LocalInbox>\n<LocalOutbox>0</LocalOutbox>\n"
+            "<LocalDraft>0</LocalDraft>\n<LocalDeleted>0</LocalDeleted>\n<SimUnread>0</SimUnread>\n"
+            "<SimInbox>0</SimInbox>\n<SimOutbox>0</SimOutbox>\n<SimDraft>0</SimDraft>\n"
+            "<LocalMax>500</LocalMax>\n<SimMax>20</SimMax>\n<NewMsg>0</NewMsg>\n</response>"
+            ).format(unread, len(messages)).encode("utf-8")
+
+
+def _request_value(body, name, default=None):
+    match = re.search("<{0}>([^<]*)</{0}>".format(name).encode("ascii"), body)
+    if match:
+        return match.group(1).decode("utf-8")
+    return default
+
+
+class _HiLinkRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so the client can keep the connection alive like the real modem allows
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, with Nagle enabled the body waits for the delayed ACK of the client
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.hilink.connection_opened()
+
+    def do_GET(self):
+        self._respond(self.server.hilink.handle("GET", self.path, self.headers, b""))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        self._respond(self.server.hilink.handle("POST", self.path, self.headers, body))
+
+    def _respond(self, payload):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeHiLinkServer:
+    """ A local stand-in for the web server on a HiLink modem
+
+    This serves the payloads in huawei_3g/fixtures on a random port on localhost so the modem classes can be tested
+    against a real HTTP server. Point a modem at it with the ``ip`` argument::
+
+        with FakeHiLinkServer() as server:
+            modem = HuaweiE303Modem('eth0', '/', ip=server.address)
+    """
+
+    def __init__(self, inbox=None, latency=0, jitter=0, busy_rate=0, token_lifetime=None, seed=None, send_time=0,
+                 max_concurrent=None):
+        """ Create a fake HiLink web server
+
+        :param inbox: The list of messages in the inbox, see :func:`~huawei_3g.testing.fake_message`, or the amount of
+                      messages to generate. Defaults to the messages in the sms-list-2.xml fixture.
+        :param latency: The time in seconds the server takes to answer a request
+        :param jitter: The maximum random deviation in seconds from the latency
+        :param busy_rate: The fraction of requests answered with the 100004 "Busy" error
+        :param token_lifetime: The time in seconds a token is accepted for POST requests, after that they fail with
+                               125001. None accepts any token.
+        :param seed: The seed for the random numbers for jitter and busy errors, for reproducible runs
+        :param send_time: The time in seconds sending an SMS takes, sending another message in the meantime fails with
+                          the 100004 "Busy" error like on the real modem
+        :param max_concurrent: The amount of requests handled at the same time, more concurrent requests fail with
+                               the 100004 "Busy" error like on the real modem. None handles any amount.
+        """
+        self.routes = {
+            ("GET", "/api/monitoring/status"): read_fixture("status.xml"),
+            ("GET", "/api/device/information"): read_fixture("device-information.xml"),
+            ("GET", "/api/device/signal"): read_fixture("device-signal.xml"),
+            ("GET", "/api/monitoring/traffic-statistics"): read_fixture("traffic-statistics.xml"),
+            ("GET", "/api/monitoring/month_statistics"): read_fixture("month-statistics.xml"),
+        }
+        if inbox is None:
+            inbox = [fake_message(40001, "Test 2", date="2015-09-08 11:03:23", read=False), fake_message(40000)]
+        elif isinstance(inbox, int):
+            inbox = fake_inbox(inbox)
+        self.inbox = inbox
+        self.latency = latency
+        self.jitter = jitter
+        self.busy_rate = busy_rate
+        self.token_lifetime = token_lifetime
+        self.send_time = send_time
+        self.max_concurrent = max_concurrent
+        self._in_flight = 0
+        self.sent = []
+        self._sending_until = 0
+        self.connections = 0
+        self.requests = []
+        self.errors = {}
+        self._tokens = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = _ThreadingHTTPServer(("127.0.0.1", 0), _HiLinkRequestHandler)
+        self._server.hilink = self
+        self._thread = None
+
+    @property
+    def address(self):
+        """ The host:port this server listens on """
+        return "{}:{}".format(*self._server.server_address)
+
+    def connection_opened(self):
+        with self._lock:
+            self.connections += 1
+
+    def handle(self, method, path, headers, body):
+        """ Produce the response payload for a request. Override this to simulate other modem behavior """
+        with self._lock:
+            self.requests.append((method, path, body))
+            delay = max(0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            busy = self.busy_rate and self._random.random() < self.busy_rate
+            self._in_flight += 1
+            busy = busy or (self.max_concurrent is not None and self._in_flight > self.max_concurrent)
+        try:
+            if delay:
+                time.sleep(delay)
+            return self._respond(method, path, headers, body, busy)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _respond(self, method, path, headers, body, busy):
+        with self._lock:
+            if busy:
+                return self._error("100004")
+            if (method, path) in self.routes:
+                return self.routes[(method, path)]
+            if (method, path) == ("GET", "/api/webserver/token"):
+                return self._issue_token()
+            if method == "POST" and not self._valid_token(headers.get("__RequestVerificationToken")):
+                return self._error("125001")
+            if (method, path) == ("GET", "/api/sms/sms-count"):
+                return render_sms_count(self.inbox)
+            if (method, path) == ("POST", "/api/sms/sms-list"):
+                return self._sms_list(body)
+            if (method, path) == ("POST", "/api/sms/delete-sms"):
+                return self._delete_sms(body)
+            if (method, path) == ("POST", "/api/sms/send-sms"):
+                return self._send_sms(body)
+            if (method, path) == ("GET", "/api/sms/send-status"):
+                return self._send_status()
+        return b"<error><code>100002</code></error>"
+
+    def _error(self, code):
+        self.errors[code] = self.errors.get(code, 0) + 1
+        return render_error(code)
+
+    def _issue_token(self):
+        token = str(len(self._tokens) + 1)
+        self._tokens[token] = time.monotonic()
+        return "<response><token>{}</token></response>".format(token).encode("utf-8")
+
+    def _valid_token(self, token):
+        if self.token_lifetime is None:
+            return True
+        issued = self._tokens.get(token)
+        return issued is not None and time.monotonic() - issued < self.token_lifetime
+
+    def _sms_list(self, body):
+        page_index = int(_request_value(body, "PageIndex", 1))
+        read_count = int(_request_value(body, "ReadCount", 20))
+        if _request_value(body, "BoxType", "1") != "1":
+            return render_sms_list([])
+        messages = self.inbox
+        if _request_value(body, "UnreadPreferred") == "1":
+            messages = sorted(messages, key=lambda message: message["Smstat"])
+        start = (page_index - 1) * read_count
+        return render_sms_list(messages[start:start + read_count])
+
+    def _delete_sms(self, body):
+        ids = set(index.decode("utf-8") for index in re.findall(b"<Index>([^<]*)</Index>", body))
+        self.inbox = [message for message in self.inbox if message["Index"] not in ids]
+        return b"<response>OK</response>"
+
+    def _send_sms(self, body):
+        if time.monotonic() < self._sending_until:
+            return self._error("100004")
+        self._sending_until = time.monotonic() + self.send_time
+        phones = [phone.decode("utf-8") for phone in re.findall(b"<Phone>([^<]*)</Phone>", body)]
+        self.sent.append((phones, unescape(_request_value(body, "Content", ""))))
+        return b"<response>OK</response>"
+
+    def _send_status(self):
+        phones = ",".join(self.sent[-1][0]) if self.sent else ""
+        sending = time.monotonic() < self._sending_until
+        return ("<response><Phone>{}</Phone><SucPhone>{}</SucPhone><FailPhone></FailPhone>"
+                "<TotalCount>{}</TotalCount><CurIndex>{}</CurIndex></response>").format(
+            phones if sending else "", "" if sending else phones, len(self.sent), len(self.sent)).encode("utf-8")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,))
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+class FakeHiLinkFleet:
+    """ A group of :class:`~huawei_3g.testing.FakeHiLinkServer` instances to simulate many modems at once
+
+    :param count: The amount of servers
+    :param kwargs: The arguments for every server, see :class:`~huawei_3g.testing.FakeHiLinkServer`. The seed is
+                   incremented per server so they don't all fail at the same moment.
+    """
+
+    def __init__(self, count, **kwargs):
+        seed = kwargs.pop("seed", None)
+        self.servers = []
+        for i in range(count):
+            self.servers.append(FakeHiLinkServer(seed=None if seed is None else seed + i, **kwargs))
+
+    @property
+    def requests(self):
+        """ The total amount of requests handled by the servers """
+        return sum(len(server.requests) for server in self.servers)
+
+    @property
+    def errors(self):
+        """ The amount of simulated errors per error code over all servers """
+        errors = {}
+        for server in self.servers:
+            for code, count in server.errors.items():
+                errors[code] = errors.get(code, 0) + count
+        return errors
+
+    def modems(self, **kwargs):
+        """ Create a :class:`~huawei_3g.huawei_e303.HuaweiE303Modem` for every server
+
+        :param kwargs: Extra arguments for the modem constructor
+        """
+        from huawei_3g.huawei_e303 import HuaweiE303Modem
+        return [HuaweiE303Modem("fake{}".format(i), "/fake/{}".format(i), ip=server.address, **kwargs)
+                for i, server in enumerate(self.servers)]
+
+    def start(self):
+        for server in self.servers:
+            server.start()
+        return self
+
+    def stop(self):
+        for server in self.servers:
+            server.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+class FakeSysfs:
+    """ A fake sysfs tree with USB devices and network interfaces
+
+    Pass the root of the tree as ``sysfs_root`` to the functions in :mod:`~huawei_3g.modem`. The layout follows the
+    real sysfs: USB devices live under devices/ and are symlinked from bus/usb/devices, network interfaces are in
+    class/net and have a device symlink pointing to the USB interface they belong to.
+
+    :param root: An empty directory to create the tree in
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.hub = os.path.join(root, "devices", "pci0000:00", "0000:00:14.0", "usb1")
+        for directory in [self.hub, os.path.join(root, "bus", "usb", "devices"), os.path.join(root, "class", "net")]:
+            os.makedirs(directory)
+
+    def add_device(self, name, vendor="12d1", product="14dc", interface=None):
+        """ Plug in a USB device
+
+        :param name: The name of the USB device. Ex: 1-1
+        :param vendor: The USB vendor id
+        :param product: The USB product id
+        :param interface: The name of the network interface of the device, if any
+        :return: the path of the device in bus/usb/devices
+        """
+        device = os.path.join(self.hub, name)
+        os.makedirs(os.path.join(device, name + ":1.0"))
+        for filename, value in [("idVendor", vendor), ("idProduct", product)]:
+            with open(os.path.join(device, filename), "w") as handle:
+                handle.write(value + "\n")
+        link = os.path.join(self.root, "bus", "usb", "devices", name)
+        os.symlink(device, link)
+        if interface:
+            self.add_interface(interface, os.path.join(device, name + ":1.0"))
+        return link
+
+    def add_interface(self, name, device=None):
+        """ Add a network interface, optionally belonging to a device directory """
+        directory = os.path.join(self.root, "class", "net", name)
+        os.makedirs(directory)
+        if device:
+            os.symlink(device, os.path.join(directory, "device"))
+
+    def remove_device(self, name, interface=None):
+        """ Unplug a USB device and remove its network interface """
+        os.unlink(os.path.join(self.root, "bus", "usb", "devices", name))
+        shutil.rmtree(os.path.join(self.hub, name))
+        if interface:
+            shutil.rmtree(os.path.join(self.root, "class", "net", interface))
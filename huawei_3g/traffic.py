@@ -0,0 +1,229 @@
+import array
+import threading
+import time
+
+# (seconds per slot, slots): two hours per minute, a week per hour and three months per day
+DEFAULT_ARCHIVES = ((60, 120), (3600, 168), (86400, 92))
+
+
+class RingArchive:
+    """ Traffic totals in fixed-size time slots, stored in arrays that are reused in a ring
+
+    A slot covers ``step`` seconds and the archive keeps the last ``slots`` slots. Every slot holds the bytes
+    transferred, the highest rates seen, the seconds sampled and the seconds connected. Samples for a slot that has
+    been overwritten by newer data are dropped.
+
+    :param step: The duration of a slot in seconds
+    :param slots: The amount of slots
+    """
+
+    def __init__(self, step, slots):
+        self.step = step
+        self.slots = slots
+        self.buckets = array.array('q', [-1]) * slots
+        self.download = array.array('d', [0]) * slots
+        self.upload = array.array('d', [0]) * slots
+        self.max_download_rate = array.array('f', [0]) * slots
+        self.max_upload_rate = array.array('f', [0]) * slots
+        self.seconds = array.array('f', [0]) * slots
+        self.connected = array.array('f', [0]) * slots
+        self.latest = -1
+
+    @property
+    def nbytes(self):
+        """ The memory used by the arrays in bytes """
+        return sum(len(values) * values.itemsize for values in self._arrays())
+
+    def add(self, timestamp, download, upload, download_rate, upload_rate, seconds, connected):
+        bucket = int(timestamp // self.step)
+        if bucket <= self.latest - self.slots:
+            return
+        index = bucket % self.slots
+        if self.buckets[index] != bucket:
+            for values in self._arrays():
+                values[index] = 0
+            self.buckets[index] = bucket
+        self.download[index] += download
+        self.upload[index] += upload
+        self.max_download_rate[index] = max(self.max_download_rate[index], download_rate)
+        self.max_upload_rate[index] = max(self.max_upload_rate[index], upload_rate)
+        self.seconds[index] += seconds
+        self.connected[index] += connected
+        self.latest = max(self.latest, bucket)
+
+    def covers(self, timestamp):
+        """ True if the archive still has the slot for this time """
+        return self.latest >= 0 and int(timestamp // self.step) > self.latest - self.slots
+
+    def aggregate(self, start, end):
+        """ Aggregate the slots that start in the window [start, end)
+
+        :return: a dictionary with download and upload in bytes, the average and maximum download_rate and
+                 upload_rate in bytes per second, and the seconds sampled and connected
+        """
+        first = int(start // self.step)
+        last = int(-(-end // self.step))
+        download = upload = max_download_rate = max_upload_rate = seconds = connected = 0
+        for index in range(self.slots):
+            if first <= self.buckets[index] < last:
+                download += self.download[index]
+                upload += self.upload[index]
+                max_download_rate = max(max_download_rate, self.max_download_rate[index])
+                max_upload_rate = max(max_upload_rate, self.max_upload_rate[index])
+                seconds += self.seconds[index]
+                connected += self.connected[index]
+        return {
+            'download': download,
+            'upload': upload,
+            'avg_download_rate': download / seconds if seconds else 0.0,
+            'avg_upload_rate': upload / seconds if seconds else 0.0,
+            'max_download_rate': max_download_rate,
+            'max_upload_rate': max_upload_rate,
+            'seconds': seconds,
+            'connected': connected
+        }
+
+    def _arrays(self):
+        return (self.buckets, self.download, self.upload, self.max_download_rate, self.max_upload_rate, self.seconds,
+                self.connected)
+
+
+class TrafficSeries:
+    """ The traffic history of a single modem in multiple resolutions
+
+    Every sample is added to all archives, queries use the finest archive that still covers the start of the window.
+    With the default archives the history of three months takes about 15KB.
+
+    :param archives: A list of (seconds per slot, slots) tuples, from fine to coarse
+    """
+
+    def __init__(self, archives=DEFAULT_ARCHIVES):
+        self.archives = [RingArchive(step, slots) for step, slots in archives]
+        self._last = None
+
+    @property
+    def nbytes(self):
+        """ The memory used by the arrays in bytes """
+        return sum(archive.nbytes for archive in self.archives)
+
+    def add(self, timestamp, traffic):
+        """ Add a sample of the traffic counters
+
+        The first sample only sets the starting point. The bytes and connected time since the previous sample are
+        added to the slot the sampled period starts in, when the counters went down because they were cleared the new
+        value is used as the difference.
+
+        :param timestamp: The time of the sample in seconds since the epoch
+        :param traffic: A dictionary as returned by :func:`~huawei_3g.HuaweiE303Modem.get_traffic_statistics`
+        """
+        last = self._last
+        self._last = (timestamp, traffic['total_download'], traffic['total_upload'], traffic['total_connect_time'])
+        if last is None or timestamp <= last[0]:
+            return
+        seconds = timestamp - last[0]
+        download = self._difference(last[1], traffic['total_download'])
+        upload = self._difference(last[2], traffic['total_upload'])
+        connected = min(self._difference(last[3], traffic['total_connect_time']), seconds)
+        for archive in self.archives:
+            archive.add(last[0], download, upload, traffic['download_rate'], traffic['upload_rate'], seconds,
+                        connected)
+
+    def aggregate(self, start, end=None):
+        """ Aggregate the traffic between two times, see :func:`~huawei_3g.traffic.RingArchive.aggregate`
+
+        The window is rounded to the slots of the archive used.
+
+        :param start: The start of the window in seconds since the epoch
+        :param end: The end of the window, defaults to now
+        """
+        end = time.time() if end is None else end
+        for archive in self.archives:
+            if archive.covers(start):
+                return archive.aggregate(start, end)
+        return self.archives[-1].aggregate(start, end)
+
+    def window(self, seconds, now=None):
+        """ Aggregate the last ``seconds`` seconds """
+        now = time.time() if now is None else now
+        return self.aggregate(now - seconds, now)
+
+    @staticmethod
+    def _difference(previous, current):
+        if current < previous:
+            return current
+        return current - previous
+
+
+class TrafficCollector:
+    """ Samples the traffic statistics of modems into a :class:`~huawei_3g.traffic.TrafficSeries` per modem
+
+    :param modems: A list of :class:`~huawei_3g.huawei_e303.HuaweiE303Modem` instances
+    :param interval: The time in seconds between samples
+    :param archives: The archives of every series, see :class:`~huawei_3g.traffic.TrafficSeries`
+    """
+
+    def __init__(self, modems, interval=60, archives=DEFAULT_ARCHIVES):
+        self.modems = list(modems)
+        self.interval = interval
+        self.archives = archives
+        self.errors = {}
+        self._series = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def series(self, modem):
+        """ Get the series of a modem, an empty series if it hasn't been sampled yet """
+        with self._lock:
+            series = self._series.get(modem.path)
+            if series is None:
+                series = self._series[modem.path] = TrafficSeries(self.archives)
+            return series
+
+    def sample(self, now=None):
+        """ Sample the traffic counters of all modems once
+
+        Modems that fail are skipped, the last error per modem is kept in :attr:`errors`.
+        """
+        for modem in list(self.modems):
+            try:
+                traffic = modem.get_traffic_statistics(cache=False)
+            except Exception as error:
+                self.errors[modem.path] = error
+                continue
+            self.errors.pop(modem.path, None)
+            series = self.series(modem)
+            with self._lock:
+                series.add(time.time() if now is None else now, traffic)
+
+    def window(self, modem, seconds, now=None):
+        """ Aggregate the last ``seconds`` seconds of a modem, see :func:`~huawei_3g.traffic.TrafficSeries.window` """
+        series = self.series(modem)
+        with self._lock:
+            return series.window(seconds, now)
+
+    def start(self):
+        """ Sample in a background thread every interval """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="huawei-3g-traffic")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _run(self):
+        while True:
+            self.sample()
+            if self._stop.wait(self.interval):
+                return
@@ -0,0 +1,471 @@
+import errno
+import fcntl
+import socket
+import struct
+import threading
+import time
+
+DEFAULT_TIMEOUT = (3.05, 10)
+
+SO_BINDTODEVICE = getattr(socket, "SO_BINDTODEVICE", 25)
+SIOCGIFADDR = 0x8915
+
+
+class BindError(Exception):
+    """ Raised when the traffic to a modem can't be bound to its network interface """
+    pass
+
+
+def interface_address(interface):
+    """ Get the IPv4 address of a network interface or None if it has no address """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        request = struct.pack("256s", interface.encode("utf-8")[:15])
+        return socket.inet_ntoa(fcntl.ioctl(sock.fileno(), SIOCGIFADDR, request)[20:24])
+    except OSError:
+        return None
+    finally:
+        sock.close()
+
+
+class Binding:
+    """ Describes how the sockets to a modem are bound to its network interface
+
+    All E303 dongles use 192.168.8.1 so with multiple dongles the routing table decides which one answers. Binding
+    the sockets to the network interface of the dongle makes sure the traffic goes to the right one, which allows
+    talking to all dongles at the same time.
+
+    device
+      The socket is bound with SO_BINDTODEVICE. This needs CAP_NET_RAW on older kernels.
+
+    address
+      The socket is bound to the IPv4 address of the interface. This needs a routing rule per source address
+      (ip rule add from <address> table <n>) to select the right interface.
+
+    :param interface: The name of the network interface
+    :param method: "device", "address" or "auto" to use SO_BINDTODEVICE if it is permitted and the address otherwise
+    """
+
+    def __init__(self, interface, method="auto"):
+        if not interface:
+            raise BindError("The modem has no network interface to bind to")
+        self.interface = interface
+        self.method = None
+        self.source_address = None
+
+        if method in ("auto", "device"):
+            try:
+                probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                try:
+                    probe.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE, self._device())
+                finally:
+                    probe.close()
+                self.method = "device"
+                return
+            except OSError as error:
+                if error.errno == errno.ENODEV:
+                    raise BindError("Network interface {} does not exist".format(interface))
+                if method == "device":
+                    raise BindError("Can't bind to {} with SO_BINDTODEVICE: {}".format(interface, error))
+
+        if method in ("auto", "address"):
+            self.source_address = interface_address(interface)
+            if self.source_address is None:
+                raise BindError("Network interface {} has no IPv4 address to bind to".format(interface))
+            self.method = "address"
+            return
+
+        raise BindError("Unknown binding method {}".format(method))
+
+    @property
+    def socket_options(self):
+        """ The socket options for urllib3 connections """
+        from requests.packages.urllib3.connection import HTTPConnection
+        options = list(HTTPConnection.default_socket_options)
+        if self.method == "device":
+            options.append((socket.SOL_SOCKET, SO_BINDTODEVICE, self._device()))
+        return options
+
+    def create_socket(self, family=socket.AF_INET):
+        """ Create a non-connected TCP socket that is bound to the interface """
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            if self.method == "device":
+                sock.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE, self._device())
+            else:
+                sock.bind((self.source_address, 0))
+        except OSError as error:
+            sock.close()
+            raise BindError("Can't bind to {}: {}".format(self.interface, error))
+        return sock
+
+    def _device(self):
+        return self.interface.encode("utf-8") + b"\0"
+
+    def __repr__(self):
+        return "<Binding {} ({})>".format(self.interface, self.method)
+
+
+class TransportError(IOError):
+    """ Raised when a request can't be sent to the modem or the response can't be read """
+    pass
+
+
+class Response:
+    """ The parts of a HTTP response the modem classes care about """
+    __slots__ = ('status_code', 'content')
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+
+def get_transport(name, **options):
+    """ Create a transport by name
+
+    requests
+      :class:`~huawei_3g.session.RequestsTransport`, uses a requests session
+
+    socket
+      :class:`~huawei_3g.transport.SocketTransport`, a minimal HTTP client without dependencies
+
+    :param name: "requests" or "socket"
+    :param options: The pool_size, timeout, retries and binding for the transport
+    """
+    if name == "requests":
+        # Only imported when it's used, importing requests is slow
+        from huawei_3g.session import RequestsTransport
+        return RequestsTransport(**options)
+    if name == "socket":
+        return SocketTransport(**options)
+    raise ValueError("Unknown transport {}".format(name))
+
+
+class _SocketConnection:
+    __slots__ = ('sock', 'buffer', 'view', 'end', 'deadline')
+
+    def __init__(self, sock, buffer_size):
+        self.sock = sock
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.end = 0
+        self.deadline = None
+
+    def fill(self):
+        """ Receive more data after the data already in the buffer, returns the amount of bytes received """
+        if self.end == len(self.buffer):
+            # Grow the buffer, the view has to be released before the bytearray can be resized
+            self.view.release()
+            self.buffer.extend(bytes(len(self.buffer)))
+            self.view = memoryview(self.buffer)
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise socket.timeout("Read deadline exceeded")
+        self.sock.settimeout(remaining)
+        received = self.sock.recv_into(self.view[self.end:])
+        self.end += received
+        return received
+
+    def close(self):
+        self.view.release()
+        self.sock.close()
+
+
+class SocketTransport:
+    """ A minimal HTTP/1.1 client over plain sockets with kept-alive connections
+
+    The HiLink API exchanges a few hundred bytes per call, for those the per-request overhead of a full HTTP client
+    is most of the CPU time. This client sends every request with a single send call and receives the response
+    straight into a buffer that belongs to the connection and is reused for every response, the body is copied out
+    of it once.
+
+    :param pool_size: The maximum amount of idle connections kept
+    :param timeout: The (connect, read) timeout in seconds, the read timeout is a deadline for the whole response so
+                    a modem that answers a byte at a time can't stall a request
+    :param retries: The amount of times connecting is retried
+    :param binding: A :class:`~huawei_3g.transport.Binding` to bind the connections to a network interface
+    :param buffer_size: The initial size of the receive buffer of a connection, it grows for larger responses
+    """
+    name = "socket"
+
+    def __init__(self, pool_size=2, timeout=DEFAULT_TIMEOUT, retries=2, binding=None, buffer_size=8192):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.binding = binding
+        self.buffer_size = buffer_size
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def request(self, method, host, path, body=None, headers=None):
+        """ Do a single HTTP request and return a :class:`~huawei_3g.transport.Response`
+
+        :param method: GET or POST
+        :param host: The host to connect to, optionally with a port
+        :param path: The path of the request including the leading slash
+        :param body: The request body as bytes
+        :param headers: Extra request headers as a dictionary
+        """
+        connection, response, keep_alive = self._first(host, self._encode(method, host, path, body, headers))
+        if keep_alive:
+            self._release(host, connection)
+        else:
+            connection.close()
+        return response
+
+    def pipeline(self, host, requests):
+        """ Send multiple requests at once over a single connection and yield the responses as they arrive
+
+        HTTP/1.1 pipelining saves a round trip per request, the modem answers the requests in order. This is a
+        generator of :class:`~huawei_3g.transport.Response` instances, if it is closed before all responses were read
+        the connection is closed.
+
+        :param host: The host to connect to, optionally with a port
+        :param requests: A list of (method, path, body, headers) tuples
+        """
+        payload = b"".join(self._encode(method, host, path, body, headers) for method, path, body, headers in requests)
+        connection, response, keep_alive = self._first(host, payload)
+        finished = False
+        try:
+            yield response
+            for i in range(1, len(requests)):
+                if not keep_alive:
+                    raise TransportError("Connection closed by {} after {} of {} responses".format(
+                        host, i, len(requests)))
+                try:
+                    status_code, content, keep_alive = self._read_response(connection)
+                except (_StaleConnection, OSError, ValueError) as error:
+                    raise TransportError("Request to {} failed: {}".format(host, error or "connection closed"))
+                yield Response(status_code, content)
+            finished = True
+        finally:
+            if finished and keep_alive:
+                self._release(host, connection)
+            else:
+                connection.close()
+
+    def close(self):
+        """ Close all idle connections """
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def _acquire(self, host):
+        with self._lock:
+            idle = self._idle.get(host)
+            if idle:
+                return idle.pop()
+        return None
+
+    def _release(self, host, connection):
+        with self._lock:
+            idle = self._idle.setdefault(host, [])
+            if len(idle) < self.pool_size:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def _connect(self, host):
+        address, _, port = host.partition(":")
+        attempt = 0
+        while True:
+            sock = self.binding.create_socket() if self.binding else socket.socket(socket.AF_INET,
+                                                                                     socket.SOCK_STREAM)
+            try:
+                sock.settimeout(self.timeout[0])
+                sock.connect((address, int(port or 80)))
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                sock.settimeout(self.timeout[1])
+                return _SocketConnection(sock, self.buffer_size)
+            except OSError as error:
+                sock.close()
+                if attempt >= self.retries:
+                    raise TransportError("Can't connect to {}: {}".format(host, error))
+                attempt += 1
+
+    @staticmethod
+    def _encode(method, host, path, body, headers):
+        body = body or b""
+        head = ["{} {} HTTP/1.1\r\nHost: {}\r\nContent-Length: {}\r\n".format(method, path, host, len(body))]
+        for name, value in (headers or {}).items():
+            head.append("{}: {}\r\n".format(name, value))
+        head.append("\r\n")
+        return "".join(head).encode("latin-1") + body
+
+    def _first(self, host, payload):
+        """ Send the payload and read the first response, returns the connection, the response and keep-alive """
+        connection = self._acquire(host)
+        reused = connection is not None
+        while True:
+            if connection is None:
+                connection = self._connect(host)
+            try:
+                connection.deadline = time.monotonic() + self.timeout[1]
+                connection.sock.settimeout(self.timeout[1])
+                connection.sock.sendall(payload)
+                status_code, content, keep_alive = self._read_response(connection)
+                return connection, Response(status_code, content), keep_alive
+            except _StaleConnection:
+                # The modem closed an idle connection, this is only safe to retry because nothing was received
+                connection.close()
+                if not reused:
+                    raise TransportError("Connection closed by {}".format(host))
+                connection = None
+                reused = False
+            except (OSError, ValueError) as error:
+                connection.close()
+                raise TransportError("Request to {} failed: {}".format(host, error))
+
+    def _read_response(self, connection):
+        buffer = connection.buffer
+        while True:
+            header_end = buffer.find(b"\r\n\r\n", 0, connection.end)
+            if header_end != -1:
+                break
+            if not connection.fill():
+                if connection.end == 0:
+                    raise _StaleConnection()
+                raise ValueError("Connection closed in the response headers")
+
+        lines = bytes(connection.view[:header_end]).decode("latin-1").split("\r\n")
+        version, status_code = lines[0].split(None, 2)[0:2]
+        response_headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+        keep_alive = version == "HTTP/1.1" and response_headers.get("connection", "").lower() != "close"
+
+        body_start = header_end + 4
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            content, response_end = self._read_chunked(connection, body_start)
+            self._consume(connection, response_end)
+            return int(status_code), content, keep_alive
+
+        if "content-length" in response_headers:
+            body_end = body_start + int(response_headers["content-length"])
+            while connection.end < body_end:
+                if not connection.fill():
+                    raise ValueError("Connection closed in the response body")
+        else:
+            while connection.fill():
+                pass
+            body_end = connection.end
+            keep_alive = False
+        content = bytes(connection.view[body_start:body_end])
+        self._consume(connection, body_end)
+        return int(status_code), content, keep_alive
+
+    @staticmethod
+    def _consume(connection, end):
+        # Move the start of the next pipelined response to the front of the buffer
+        leftover = connection.end - end
+        if leftover > 0:
+            connection.view[:leftover] = bytes(connection.view[end:connection.end])
+        connection.end = max(leftover, 0)
+
+    @staticmethod
+    def _read_chunked(connection, position):
+        chunks = []
+        while True:
+            line_end = connection.buffer.find(b"\r\n", position, connection.end)
+            if line_end == -1:
+                if not connection.fill():
+                    raise ValueError("Connection closed in a chunk header")
+                continue
+            size = int(bytes(connection.view[position:line_end]).split(b";")[0], 16)
+            chunk_end = line_end + 2 + size
+            while connection.end < chunk_end + 2:
+                if not connection.fill():
+                    raise ValueError("Connection closed in a chunk")
+            if size == 0:
+                return b"".join(chunks), chunk_end + 2
+            chunks.append(bytes(connection.view[line_end + 2:chunk_end]))
+            position = chunk_end + 2
+
+
+class _StaleConnection(Exception):
+    pass
+
+
+class RecordingTransport:
+    """ Wraps another transport and records every exchange for :class:`~huawei_3g.transport.ReplayTransport`
+
+    Record a session against a real modem and save it to replay it in tests without the modem::
+
+        transport = RecordingTransport(get_transport("socket"))
+        modem = HuaweiE303Modem("eth0", "/", transport=transport)
+        modem.get_messages()
+        transport.save("session.json")
+
+    :param transport: The transport that does the requests
+    """
+    name = "recording"
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.records = []
+
+    def request(self, method, host, path, body=None, headers=None):
+        response = self.transport.request(method, host, path, body, headers)
+        self.records.append({
+            "method": method,
+            "path": path,
+            "body": (body or b"").decode("utf-8"),
+            "status_code": response.status_code,
+            "content": response.content.decode("utf-8")
+        })
+        return response
+
+    def save(self, filename):
+        """ Write the recorded exchanges to a JSON file """
+        import json
+        with open(filename, "w") as handle:
+            json.dump(self.records, handle, indent=2)
+
+    def close(self):
+        self.transport.close()
+
+
+class ReplayTransport:
+    """ Answers requests with exchanges recorded by :class:`~huawei_3g.transport.RecordingTransport`
+
+    Requests are matched on method, path and body, falling back to method and path because some bodies contain the
+    current time. Recorded responses for the same request are returned in order and the last one is repeated. A
+    response is replayed once whichever way it was matched.
+
+    :param records: A list of recorded exchanges or the name of a JSON file saved by
+                    :func:`~huawei_3g.transport.RecordingTransport.save`
+    """
+    name = "replay"
+
+    def __init__(self, records):
+        if isinstance(records, str):
+            import json
+            with open(records) as handle:
+                records = json.load(handle)
+        self.requests = []
+        self._responses = []
+        self._replayed = []
+        self._exact = {}
+        self._fallback = {}
+        for index, record in enumerate(records):
+            self._responses.append(Response(record["status_code"], record["content"].encode("utf-8")))
+            self._replayed.append(False)
+            self._exact.setdefault((record["method"], record["path"], record["body"]), []).append(index)
+            self._fallback.setdefault((record["method"], record["path"]), []).append(index)
+
+    def request(self, method, host, path, body=None, headers=None):
+        body = (body or b"").decode("utf-8")
+        self.requests.append((method, path, body))
+        indexes = self._exact.get((method, path, body)) or self._fallback.get((method, path))
+        if not indexes:
+            raise TransportError("No recorded response for {} {}".format(method, path))
+        index = next((index for index in indexes if not self._replayed[index]), indexes[-1])
+        self._replayed[index] = True
+        return self._responses[index]
+
+    def close(self):
+        pass
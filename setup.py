@@ -1,4 +1,4 @@
-from distutils.core import setup, Command
+from setuptools import setup, Command
 
 
 def discover_and_run_tests():
@@ -41,10 +41,13 @@ setup(
     name='huawei_3g',
     version='0.1.0',
     packages=['huawei_3g'],
+    package_data={'huawei_3g': ['fixtures/*.xml']},
+    scripts=['bin/huawei-3g'],
     url='https://github.com/MartijnBraam/huawei-3g',
     license='MIT',
     author='Martijn Braam',
     author_email='martijn@brixit.nl',
     description='Python module for controlling huawei 3g usb modems',
     cmdclass={'test': DiscoverTest},
+    python_requires='>=3.7',
 )
\ No newline at end of file